@@ -0,0 +1,368 @@
+"""
+Bulk import of posts from NDJSON or CSV.
+
+Each record carries the Post columns, a list of tag labels and optionally
+an image_path to a local file. In CSV, tags are separated by ";". Records
+are validated and written in batches: PostgreSQL gets COPY, other
+databases a multi-row INSERT. A record that fails validation, or makes its
+batch fail, is reported with its line number without stopping the import.
+
+Command line:
+
+    python -m app.bulk_import posts.ndjson --owner alice [--image-root DIR]
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import shutil
+import sys
+import time
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+from typing import IO, Iterable, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import insert, text
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.images import IMAGE_DIR, schedule_variants, static_url
+from app.models import Post, User, post_tag_table
+from app.ranking import hot_score
+from app.schemas import ImportRecordError, ImportResult, PostImport
+from app.search import index_posts
+from app.similarity import similarity_index
+from app.tags import resolve_tags, update_tag_stats
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", 1000))
+# Directory the import endpoint may read image_path files from; unset means
+# records with an image_path are rejected when imported over HTTP.
+IMPORT_IMAGE_ROOT = os.getenv("IMPORT_IMAGE_ROOT")
+
+CSV_TAG_SEPARATOR = ";"
+
+POST_COLUMNS = (
+    "title",
+    "description",
+    "material",
+    "length",
+    "width",
+    "height",
+    "color",
+    "shape",
+    "weight",
+    "location",
+    "smell",
+    "taste",
+    "origin",
+)
+
+
+class RecordError(Exception):
+    pass
+
+
+def iter_ndjson(stream: IO[str]) -> Iterator[Tuple[int, dict]]:
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_number, RecordError(f"Invalid JSON: {e}")
+            continue
+        if not isinstance(record, dict):
+            yield line_number, RecordError("Record must be a JSON object")
+            continue
+        yield line_number, record
+
+
+def iter_csv(stream: IO[str]) -> Iterator[Tuple[int, dict]]:
+    reader = csv.DictReader(stream)
+    for record in reader:
+        # Empty cells mean "not given", not empty strings
+        record = {
+            key: value
+            for key, value in record.items()
+            if key is not None and value not in ("", None)
+        }
+        tags = record.get("tags", "")
+        record["tags"] = [
+            tag.strip() for tag in tags.split(CSV_TAG_SEPARATOR) if tag.strip()
+        ]
+        yield reader.line_num, record
+
+
+def iter_records(stream: IO[str], fmt: str) -> Iterator[Tuple[int, dict]]:
+    if fmt == "ndjson":
+        return iter_ndjson(stream)
+    if fmt == "csv":
+        return iter_csv(stream)
+    raise ValueError(f"Unsupported import format: {fmt}")
+
+
+def _ingest_image(image_path: str, image_root: Optional[str]) -> str:
+    """
+    Copy a local image into the static image directory, refusing paths
+    outside image_root. Returns the new file's path.
+    """
+    if image_root is None:
+        raise RecordError("image_path is not allowed for this import")
+    root = os.path.realpath(image_root)
+    source = os.path.realpath(os.path.join(root, image_path))
+    if os.path.commonpath([root, source]) != root:
+        raise RecordError("image_path must be inside the image root")
+    if not os.path.isfile(source):
+        raise RecordError(f"Image not found: {image_path}")
+
+    os.makedirs(IMAGE_DIR, exist_ok=True)
+    target = os.path.join(IMAGE_DIR, f"{uuid.uuid4()}_{os.path.basename(source)}")
+    shutil.copyfile(source, target)
+    return target
+
+
+def _discard_image(prepared: dict):
+    """
+    Remove the image copied for a record that was not written.
+    """
+    if prepared["file_path"]:
+        try:
+            os.remove(prepared["file_path"])
+        except OSError:
+            pass
+
+
+def _prepare(record, owner_id: int, image_root: Optional[str]) -> dict:
+    if isinstance(record, RecordError):
+        raise record
+    try:
+        post = PostImport.model_validate(record)
+    except ValidationError as e:
+        raise RecordError(
+            "; ".join(
+                f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}"
+                for error in e.errors()
+            )
+        )
+
+    row = {column: getattr(post, column) for column in POST_COLUMNS}
+    created_at = datetime.utcnow()
+    row.update(
+        owner_id=owner_id,
+        created_at=created_at,
+        interest_count=0,
+        hot_score=hot_score(0, created_at),
+        image_url=None,
+        thumbnail_url=None,
+        preview_url=None,
+    )
+    file_path = None
+    if post.image_path:
+        file_path = _ingest_image(post.image_path, image_root)
+        row["image_url"] = static_url(file_path)
+    return {"row": row, "tags": post.tags, "file_path": file_path}
+
+
+def _copy_value(value) -> str:
+    if value is None:
+        return ""  # unquoted empty field is NULL in COPY's csv format
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def _copy_rows(db: Session, table: str, columns: List[str], rows: List[dict]):
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write(",".join(_copy_value(row[column]) for column in columns))
+        buffer.write("\n")
+    buffer.seek(0)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer
+        )
+    finally:
+        cursor.close()
+
+
+def _insert_posts(db: Session, rows: List[dict]) -> List[int]:
+    if db.get_bind().dialect.name == "postgresql":
+        # COPY can't return ids, so take them from the sequence up front
+        ids = db.execute(
+            text(
+                "SELECT nextval(pg_get_serial_sequence('posts', 'id')) "
+                "FROM generate_series(1, :n)"
+            ),
+            {"n": len(rows)},
+        ).scalars().all()
+        for post_id, row in zip(ids, rows):
+            row["id"] = post_id
+        _copy_rows(db, "posts", list(rows[0].keys()), rows)
+        return ids
+    return db.execute(
+        insert(Post).returning(Post.id, sort_by_parameter_order=True), rows
+    ).scalars().all()
+
+
+def _insert_links(db: Session, links: List[dict]):
+    if not links:
+        return
+    if db.get_bind().dialect.name == "postgresql":
+        _copy_rows(db, "post_tag", ["post_id", "tag_id"], links)
+    else:
+        db.execute(insert(post_tag_table), links)
+
+
+def _write_batch(db: Session, prepared: List[dict]):
+    """
+    Write a batch of prepared records in one transaction.
+    """
+    ids = _insert_posts(db, [record["row"] for record in prepared])
+
+    tags = resolve_tags(db, [label for record in prepared for label in record["tags"]])
+    tags_by_label = {tag["label"]: tag for tag in tags}
+
+    links = []
+    labels_by_id = {}
+    for post_id, record in zip(ids, prepared):
+        record["id"] = post_id
+        labels = list(dict.fromkeys(label for label in record["tags"] if label))
+        labels_by_id[post_id] = labels
+        links.extend(
+            {"post_id": post_id, "tag_id": tags_by_label[label]["id"]} for label in labels
+        )
+    _insert_links(db, links)
+    update_tag_stats(
+        db,
+        [[tags_by_label[label]["id"] for label in labels] for labels in labels_by_id.values()],
+    )
+
+    posts = [SimpleNamespace(**{**record["row"], "id": record["id"]}) for record in prepared]
+    index_posts(db, posts, labels_by_id)
+    db.commit()
+
+    for post in posts:
+        similarity_index.add(
+            post.id, post, [tags_by_label[label]["id"] for label in labels_by_id[post.id]]
+        )
+
+
+def import_posts(
+    db: Session,
+    records: Iterable[Tuple[int, dict]],
+    owner_id: int,
+    image_root: Optional[str] = None,
+    batch_size: int = IMPORT_BATCH_SIZE,
+) -> ImportResult:
+    """
+    Validate and write (line_number, record) pairs in batches of batch_size.
+    A batch that fails to write is retried one record at a time so only the
+    offending records are reported.
+    """
+    result = ImportResult()
+
+    def fail(line_number: int, error: Exception):
+        result.failed += 1
+        result.errors.append(ImportRecordError(line=line_number, error=str(error)))
+
+    def flush(batch: List[Tuple[int, dict]]):
+        try:
+            _write_batch(db, [record for _, record in batch])
+            written = batch
+        except Exception:
+            db.rollback()
+            written = []
+            for line_number, record in batch:
+                try:
+                    _write_batch(db, [record])
+                    written.append((line_number, record))
+                except Exception as e:
+                    db.rollback()
+                    _discard_image(record)
+                    fail(line_number, e)
+        result.imported += len(written)
+        for _, record in written:
+            if record["file_path"]:
+                schedule_variants(record["id"], record["file_path"])
+
+    batch = []
+    for line_number, record in records:
+        try:
+            batch.append((line_number, _prepare(record, owner_id, image_root)))
+        except (RecordError, OSError) as e:
+            fail(line_number, e)
+            continue
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+    return result
+
+
+def detect_format(filename: Optional[str], content_type: Optional[str] = None) -> str:
+    if (content_type or "").startswith("text/csv") or (filename or "").lower().endswith(
+        ".csv"
+    ):
+        return "csv"
+    return "ndjson"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import posts from NDJSON or CSV")
+    parser.add_argument("path", help="input file, or - for stdin")
+    parser.add_argument("--owner", required=True, help="username that will own the posts")
+    parser.add_argument("--format", choices=["ndjson", "csv"], help="default: from extension")
+    parser.add_argument(
+        "--image-root",
+        help="directory image_path values are relative to (default: the input's directory)",
+    )
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    fmt = args.format or detect_format(args.path)
+    image_root = args.image_root
+    if image_root is None:
+        image_root = (
+            os.getcwd()
+            if args.path == "-"
+            else os.path.dirname(os.path.abspath(args.path))
+        )
+
+    with SessionLocal() as db:
+        owner = db.query(User).filter(User.username == args.owner).first()
+        if owner is None:
+            parser.error(f"no such user: {args.owner}")
+
+        if args.path == "-":
+            stream = sys.stdin
+        else:
+            stream = open(args.path, newline="", encoding="utf-8")
+        started = time.perf_counter()
+        try:
+            result = import_posts(
+                db, iter_records(stream, fmt), owner.id, image_root, args.batch_size
+            )
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        elapsed = time.perf_counter() - started
+
+    for error in result.errors:
+        print(f"line {error.line}: {error.error}", file=sys.stderr)
+    rate = result.imported / elapsed if elapsed else 0
+    print(
+        f"Imported {result.imported} posts, {result.failed} failed "
+        f"in {elapsed:.2f}s ({rate:.0f} posts/s)"
+    )
+    return 1 if result.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,56 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """
+    Bounded, thread-safe LRU cache whose entries go stale after a TTL.
+    Stale entries are kept (until evicted) so callers can still fall back to
+    them; use get() for (value, fresh) or get_fresh() to ignore stale ones.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Tuple[Optional[Any], bool]:
+        """
+        Return (value, fresh); value is None on a miss.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None, False
+            self._data.move_to_end(key)
+        expires_at, value = entry
+        return value, time.monotonic() < expires_at
+
+    def get_fresh(self, key: Hashable) -> Optional[Any]:
+        value, fresh = self.get(key)
+        return value if fresh else None
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """
+        Store value; ttl overrides the cache-wide TTL for this entry.
+        """
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,430 @@
+"""
+Stores behind app.response_cache, picked by RESPONSE_CACHE_URL:
+
+- memory:// (default): an LRU in this process. Each worker has its own, so
+  with several workers invalidations are broadcast to the others over the
+  events backend (see app.events.broadcast), which has to be "postgres".
+- file:///path/to/cache.db: a SQLite file shared by every worker on the
+  host, memory-mapped and meant to live on a tmpfs such as /dev/shm.
+  Entries are evicted oldest first.
+- redis://host:port/db: a Redis server (or anything speaking its protocol)
+  shared by every worker on every host. Redis evicts and expires entries
+  itself, so configure it with a maxmemory policy.
+
+The shared stores also share the version counter, so an invalidation in one
+worker stops the others from storing responses built before it. Their keys
+are digests of the cache key's repr(), so keys must have a stable repr
+(tuples of strings, numbers and None). They block on I/O, so async code
+calls them from a thread (see ResponseCache in app.response_cache).
+Entries built together are written together with set_many(), in one
+transaction or round trip.
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, NamedTuple, Optional
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+# How long the file store waits for another process's write lock: an
+# invalidation waits long, a cache write gives up soon and is skipped, as
+# the next miss builds the response again anyway
+SQLITE_BUSY_TIMEOUT = 10.0
+SQLITE_SET_BUSY_TIMEOUT_MS = 200
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: str
+    tags: frozenset
+    expires_at: float
+    size: int
+
+
+def digest(key: Hashable) -> bytes:
+    return hashlib.blake2b(repr(key).encode(), digest_size=16).digest()
+
+
+class MemoryStore:
+    """
+    Thread-safe LRU with a byte budget and tag-based invalidation.
+    """
+
+    shared = False
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.evictions = 0
+        self._data: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        self._keys_by_tag = {}
+        self._version = 0
+        self._lock = threading.Lock()
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    @property
+    def entries(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= time.time():
+                self._remove(key)
+                return None
+            self._data.move_to_end(key)
+        return entry
+
+    def set(self, key: Hashable, entry: CachedResponse, version: int) -> int:
+        return self.set_many({key: entry}, version)
+
+    def set_many(self, entries: Dict[Hashable, CachedResponse], version: int) -> int:
+        """
+        Store entries unless the version moved on; returns the number of
+        entries evicted to make room.
+        """
+        evicted = 0
+        with self._lock:
+            if version != self._version:
+                return 0
+            for key, entry in entries.items():
+                if key in self._data:
+                    self._remove(key)
+                self._data[key] = entry
+                self.size += entry.size
+                for tag in entry.tags:
+                    self._keys_by_tag.setdefault(tag, set()).add(key)
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._data)))
+                evicted += 1
+        self.evictions += evicted
+        return evicted
+
+    def invalidate(self, tags: Iterable[str]):
+        with self._lock:
+            self._version += 1
+            for tag in tags:
+                for key in self._keys_by_tag.pop(tag, ()):
+                    if key in self._data:
+                        self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            self._data.clear()
+            self._keys_by_tag.clear()
+            self.size = 0
+
+    def _remove(self, key: Hashable):
+        entry = self._data.pop(key)
+        self.size -= entry.size
+        for tag in entry.tags:
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    key BLOB NOT NULL UNIQUE,
+    body BLOB NOT NULL,
+    etag TEXT NOT NULL,
+    tags TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entry_tags (
+    tag TEXT NOT NULL,
+    key BLOB NOT NULL,
+    PRIMARY KEY (tag, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_entry_tags_key ON entry_tags (key);
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO meta VALUES ('version', 0), ('bytes', 0), ('entries', 0);
+CREATE TRIGGER IF NOT EXISTS entries_added AFTER INSERT ON entries BEGIN
+    UPDATE meta SET value = value + new.size WHERE name = 'bytes';
+    UPDATE meta SET value = value + 1 WHERE name = 'entries';
+END;
+CREATE TRIGGER IF NOT EXISTS entries_removed AFTER DELETE ON entries BEGIN
+    UPDATE meta SET value = value - old.size WHERE name = 'bytes';
+    UPDATE meta SET value = value - 1 WHERE name = 'entries';
+    DELETE FROM entry_tags WHERE key = old.key;
+END;
+"""
+
+
+class SharedFileStore:
+    """
+    SQLite database shared by the processes of one host. Every operation is
+    a short transaction; writes take the database lock with BEGIN IMMEDIATE
+    so the version check and the write can't interleave with another
+    process's invalidation. A cache write that can't get the lock within
+    SQLITE_SET_BUSY_TIMEOUT_MS is skipped. Durability is not needed, so it
+    runs with synchronous=OFF; the file is memory-mapped for reads.
+    """
+
+    shared = True
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._local = threading.local()
+        self._connection().executescript(_SQLITE_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # Autocommit mode; transactions are begun explicitly
+            connection = sqlite3.connect(
+                self.path, isolation_level=None, timeout=SQLITE_BUSY_TIMEOUT
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            connection.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+            self._local.connection = connection
+        return connection
+
+    def _meta(self, connection, name: str) -> int:
+        return connection.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()[0]
+
+    @property
+    def version(self) -> int:
+        return self._meta(self._connection(), "version")
+
+    @property
+    def size(self) -> int:
+        return self._meta(self._connection(), "bytes")
+
+    @property
+    def entries(self) -> int:
+        return self._meta(self._connection(), "entries")
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        row = (
+            self._connection()
+            .execute(
+                "SELECT body, etag, tags, expires_at, size FROM entries "
+                "WHERE key = ? AND expires_at > ?",
+                (digest(key), time.time()),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return None
+        body, etag, tags, expires_at, size = row
+        return CachedResponse(body, etag, frozenset(tags.split()), expires_at, size)
+
+    def set(self, key: Hashable, entry: CachedResponse, version: int) -> int:
+        return self.set_many({key: entry}, version)
+
+    def set_many(self, entries: Dict[Hashable, CachedResponse], version: int) -> int:
+        connection = self._connection()
+        entries = {digest(key): entry for key, entry in entries.items()}
+        evicted = 0
+        connection.execute(f"PRAGMA busy_timeout = {SQLITE_SET_BUSY_TIMEOUT_MS}")
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+        except sqlite3.OperationalError:
+            logger.debug("Response cache file busy, not storing %d entries", len(entries))
+            return 0
+        finally:
+            connection.execute(f"PRAGMA busy_timeout = {int(SQLITE_BUSY_TIMEOUT * 1000)}")
+        try:
+            if self._meta(connection, "version") != version:
+                connection.execute("ROLLBACK")
+                return 0
+            connection.executemany(
+                "DELETE FROM entries WHERE key = ?", [(key,) for key in entries]
+            )
+            connection.executemany(
+                "INSERT INTO entries (key, body, etag, tags, expires_at, size) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (key, entry.body, entry.etag, " ".join(entry.tags), entry.expires_at, entry.size)
+                    for key, entry in entries.items()
+                ],
+            )
+            connection.executemany(
+                "INSERT OR IGNORE INTO entry_tags (tag, key) VALUES (?, ?)",
+                [(tag, key) for key, entry in entries.items() for tag in entry.tags],
+            )
+            while self._meta(connection, "bytes") > self.max_bytes:
+                connection.execute(
+                    "DELETE FROM entries WHERE id = (SELECT min(id) FROM entries)"
+                )
+                evicted += 1
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        self.evictions += evicted
+        return evicted
+
+    def invalidate(self, tags: Iterable[str]):
+        tags = list(tags)
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("UPDATE meta SET value = value + 1 WHERE name = 'version'")
+            if tags:
+                connection.execute(
+                    "DELETE FROM entries WHERE key IN (SELECT key FROM entry_tags "
+                    f"WHERE tag IN ({', '.join('?' * len(tags))}))",
+                    tags,
+                )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def clear(self):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("UPDATE meta SET value = value + 1 WHERE name = 'version'")
+            connection.execute("DELETE FROM entries")
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+
+class RedisStore:
+    """
+    Entries are strings holding the ETag and the body, expiring after the
+    TTL; each tag is a set of the keys labelled with it. set() checks the
+    version under WATCH, so it fails if an invalidation bumps it meanwhile.
+    Errors talking to Redis are logged and served as cache misses.
+    """
+
+    shared = True
+    # Redis tracks its own memory and evictions (INFO memory / stats)
+    size = float("nan")
+    entries = float("nan")
+    evictions = 0
+
+    def __init__(self, url: str, max_bytes: int, ttl: float, prefix: str = "swe573:rc:"):
+        import redis
+
+        self._redis = redis
+        self.client = redis.Redis.from_url(url)
+        # Only bounds the size of one entry
+        self.max_bytes = max_bytes
+        self.ttl_ms = max(1, int(ttl * 1000))
+        self.prefix = prefix
+        self._version_key = prefix + "version"
+
+    def _key(self, key: Hashable) -> bytes:
+        return self.prefix.encode() + b"e:" + digest(key).hex().encode()
+
+    def _tag_key(self, tag: str) -> str:
+        return self.prefix + "t:" + tag
+
+    @property
+    def version(self) -> Optional[int]:
+        try:
+            return int(self.client.get(self._version_key) or 0)
+        except self._redis.RedisError:
+            logger.exception("Could not read the response cache version")
+            return None
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        try:
+            value = self.client.get(self._key(key))
+        except self._redis.RedisError:
+            logger.exception("Could not read from the response cache")
+            return None
+        if value is None:
+            return None
+        etag, _, body = value.partition(b"\n")
+        return CachedResponse(body, etag.decode(), frozenset(), float("nan"), len(body))
+
+    def set(self, key: Hashable, entry: CachedResponse, version: Optional[int]) -> int:
+        return self.set_many({key: entry}, version)
+
+    def set_many(self, entries: Dict[Hashable, CachedResponse], version: Optional[int]) -> int:
+        if version is None:
+            return 0
+        entries = {self._key(key): entry for key, entry in entries.items()}
+        try:
+            with self.client.pipeline() as pipe:
+                pipe.watch(self._version_key)
+                if int(pipe.get(self._version_key) or 0) != version:
+                    return 0
+                pipe.multi()
+                tags = set()
+                for key, entry in entries.items():
+                    pipe.set(key, entry.etag.encode() + b"\n" + entry.body, px=self.ttl_ms)
+                    tags.update(entry.tags)
+                for tag in tags:
+                    # Tag sets outlive the entries they list
+                    pipe.sadd(
+                        self._tag_key(tag),
+                        *(key for key, entry in entries.items() if tag in entry.tags),
+                    )
+                    pipe.pexpire(self._tag_key(tag), self.ttl_ms)
+                pipe.execute()
+        except self._redis.WatchError:
+            pass
+        except self._redis.RedisError:
+            logger.exception("Could not write to the response cache")
+        return 0
+
+    def invalidate(self, tags: Iterable[str]):
+        tag_keys = [self._tag_key(tag) for tag in tags]
+        try:
+            # Take the tag sets and bump the version atomically, so entries
+            # stored after this are listed in fresh sets
+            with self.client.pipeline() as pipe:
+                pipe.incr(self._version_key)
+                for tag_key in tag_keys:
+                    pipe.smembers(tag_key)
+                if tag_keys:
+                    pipe.delete(*tag_keys)
+                results = pipe.execute()
+            keys = set().union(*results[1 : 1 + len(tag_keys)])
+            if keys:
+                self.client.delete(*keys)
+        except self._redis.RedisError:
+            logger.exception("Could not invalidate %s in the response cache", tag_keys)
+
+    def clear(self):
+        try:
+            self.client.incr(self._version_key)
+            keys = [
+                key
+                for key in self.client.scan_iter(match=self.prefix + "*", count=1000)
+                if key != self._version_key.encode()
+            ]
+            for start in range(0, len(keys), 1000):
+                self.client.delete(*keys[start : start + 1000])
+        except self._redis.RedisError:
+            logger.exception("Could not clear the response cache")
+
+
+def make_store(url: str, max_bytes: int, ttl: float):
+    parts = urlsplit(url)
+    if parts.scheme == "memory":
+        return MemoryStore(max_bytes)
+    if parts.scheme == "file":
+        os.makedirs(os.path.dirname(parts.path) or ".", exist_ok=True)
+        return SharedFileStore(parts.path, max_bytes)
+    if parts.scheme in ("redis", "rediss", "unix"):
+        return RedisStore(url, max_bytes, ttl)
+    raise ValueError(f"Unknown RESPONSE_CACHE_URL scheme {parts.scheme!r}")
@@ -0,0 +1,128 @@
+"""
+Comment threads, read a page at a time.
+
+A post's comments are listed newest first ("new", on created_at) or highest
+score first ("top"), both tie-broken on the id and paginated with keyset
+cursors over an index starting with post_id, so a page costs the same
+however long the thread is. Scores move as votes come in, so paging
+through "top" while it changes can skip or repeat a comment.
+
+The number of comments is kept on posts.comment_count, maintained by
+create_comment and repaired by app.reconcile.
+"""
+
+import logging
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import inspect, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.models import Comment, Post, User
+from app.pagination import paginate
+from app.reconcile import reconcile_comment_counts
+
+logger = logging.getLogger(__name__)
+
+COMMENT_SORTS = {
+    "new": (Comment.created_at, Comment.id),
+    "top": (Comment.score, Comment.id),
+}
+# Comments embedded in GET /posts/{id}, and the order they are in
+DETAIL_COMMENTS = 20
+DETAIL_COMMENTS_SORT = "top"
+
+
+def setup_comments(engine):
+    """
+    Add what threads are read with to databases created before it existed:
+    the indexes on comments and posts.comment_count, then count.
+    """
+    with engine.begin() as conn:
+        if engine.dialect.name == "sqlite":
+            # Comments used to get CURRENT_TIMESTAMP, which SQLite stores
+            # without the fraction SQLAlchemy writes; as strings, the two
+            # formats don't compare as the times they encode
+            conn.execute(
+                text(
+                    "UPDATE comments SET created_at = created_at || '.000000' "
+                    "WHERE length(created_at) = 19"
+                )
+            )
+        inspector = inspect(conn)
+        existing = {index["name"] for index in inspector.get_indexes(Comment.__tablename__)}
+        for index in Comment.__table__.indexes:
+            if index.name not in existing:
+                index.create(conn)
+        columns = {column["name"] for column in inspector.get_columns(Post.__tablename__)}
+        added = "comment_count" not in columns
+        if added:
+            conn.execute(
+                text(
+                    "ALTER TABLE posts ADD COLUMN comment_count INTEGER NOT NULL DEFAULT 0"
+                )
+            )
+    if added:
+        with Session(bind=engine) as db:
+            counted = reconcile_comment_counts(db)
+            db.commit()
+        logger.info("Counted the comments of %d posts", counted)
+
+
+def _cursor_values(sort: str):
+    if sort == "new":
+        return lambda row: [row.created_at.isoformat(), row.id]
+    return lambda row: [row.score, row.id]
+
+
+def _parse_cursor(sort: str):
+    if sort == "new":
+        return lambda values: [datetime.fromisoformat(values[0]), int(values[1])]
+    return lambda values: [int(values[0]), int(values[1])]
+
+
+async def comment_page(
+    db: AsyncSession, post_id: int, sort: str, limit: int, cursor: Optional[str] = None
+) -> dict:
+    """
+    {"items": [CommentWithScore-shaped dicts], "next_cursor"} for a page of
+    a post's comments.
+    """
+    columns = COMMENT_SORTS[sort]
+    statement = (
+        select(
+            Comment.id,
+            Comment.post_id,
+            Comment.user_id,
+            Comment.content,
+            Comment.score,
+            Comment.created_at,
+            User.username,
+        )
+        .join(User, User.id == Comment.user_id)
+        .where(Comment.post_id == post_id)
+    )
+    rows, next_cursor = await paginate(
+        db,
+        statement,
+        columns,
+        cursor,
+        limit,
+        _cursor_values(sort),
+        descending=True,
+        parse_cursor=_parse_cursor(sort),
+    )
+    items = [
+        {
+            "id": row.id,
+            "post_id": row.post_id,
+            "user_id": row.user_id,
+            "content": row.content,
+            "score": row.score,
+            "created_at": row.created_at,
+            "user": {"id": row.user_id, "username": row.username},
+        }
+        for row in rows
+    ]
+    return {"items": items, "next_cursor": next_cursor}
@@ -1,17 +1,257 @@
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
+from contextlib import contextmanager
+from contextvars import ContextVar
+from fastapi import Request
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy import create_engine, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
+import asyncio
+import fcntl
+import hashlib
+import itertools
+import logging
 import os
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable is not set.")
 
+# Async drivers for the sync URLs we accept in DATABASE_URL
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def async_url(url: str) -> str:
+    scheme, sep, rest = url.partition("://")
+    return ASYNC_DRIVERS.get(scheme, scheme) + sep + rest
+
+
+# Read-heavy routes run on the async engine; defaults to DATABASE_URL with
+# the matching async driver (asyncpg / aiosqlite).
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or async_url(DATABASE_URL)
+
+# Optional read replicas of DATABASE_URL, comma-separated, in the same
+# (sync) form; the async sessions read from them, see RoutingSession
+DATABASE_REPLICA_URLS = [
+    url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()
+]
+# Seconds between replica health checks, and how far behind the primary a
+# replica may be (also how long reads stay on the primary after a write)
+REPLICA_CHECK_INTERVAL = float(os.getenv("DATABASE_REPLICA_CHECK_INTERVAL", 5))
+REPLICA_MAX_LAG = float(os.getenv("DATABASE_REPLICA_MAX_LAG", 5))
+
 engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+async_engine = create_async_engine(ASYNC_DATABASE_URL)
+
+# Seconds a replica has been replaying behind the primary; 0 once it has
+# replayed everything it received, as pg_last_xact_replay_timestamp() only
+# moves when the primary writes
+_POSTGRES_LAG = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() "
+    "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+class Replicas:
+    """
+    Async engines of the read replicas, handed out round-robin among the
+    healthy ones. A background task checks each replica every
+    REPLICA_CHECK_INTERVAL: one that can't be reached, or (on PostgreSQL)
+    lags more than REPLICA_MAX_LAG, is skipped until a check passes again.
+    """
+
+    def __init__(self, urls):
+        self.engines = [create_async_engine(async_url(url)) for url in urls]
+        self.healthy = list(self.engines)
+        self._turn = itertools.count()
+        self._task = None
+
+    def __bool__(self) -> bool:
+        return bool(self.engines)
+
+    def pick(self):
+        """
+        The next healthy replica, or None to read from the primary.
+        """
+        healthy = self.healthy
+        if not healthy:
+            return None
+        return healthy[next(self._turn) % len(healthy)]
+
+    def mark_down(self, replica):
+        if replica in self.healthy:
+            logger.warning("Read replica %s is down, reading from the primary", replica.url)
+            self.healthy = [engine for engine in self.healthy if engine is not replica]
+
+    async def _check(self, replica) -> bool:
+        try:
+            async with replica.connect() as connection:
+                if replica.dialect.name == "postgresql":
+                    lag = (await connection.execute(_POSTGRES_LAG)).scalar()
+                    if lag is not None and lag > REPLICA_MAX_LAG:
+                        logger.warning("Read replica %s lags %.1fs behind", replica.url, lag)
+                        return False
+                elif replica.dialect.name == "sqlite":
+                    # SELECT 1 passes without reading the file
+                    await connection.execute(text("SELECT count(*) FROM sqlite_master"))
+                else:
+                    await connection.execute(text("SELECT 1"))
+            return True
+        except Exception:
+            logger.warning("Health check of read replica %s failed", replica.url, exc_info=True)
+            return False
+
+    async def check(self):
+        results = await asyncio.gather(*(self._check(replica) for replica in self.engines))
+        healthy = [replica for replica, ok in zip(self.engines, results) if ok]
+        for replica in healthy:
+            if replica not in self.healthy:
+                logger.info("Read replica %s is back", replica.url)
+        self.healthy = healthy
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(REPLICA_CHECK_INTERVAL)
+            await self.check()
+
+    async def start(self):
+        if self.engines:
+            await self.check()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for replica in self.engines:
+            await replica.dispose()
+
+
+replicas = Replicas(DATABASE_REPLICA_URLS)
+
+# Set while reads must see the primary's latest writes, see primary_reads()
+_primary_reads = ContextVar("primary_reads", default=False)
+
+
+@contextmanager
+def primary_reads():
+    """
+    Send the async sessions' queries run inside to the primary.
+    """
+    token = _primary_reads.set(True)
+    try:
+        yield
+    finally:
+        _primary_reads.reset(token)
+
+
+def replica_failed(exc: DBAPIError) -> bool:
+    """
+    Whether exc says the database couldn't serve the query at all (it is
+    unreachable, or lost the connection), rather than rejecting this query.
+    """
+    return isinstance(exc, (OperationalError, InterfaceError)) or exc.connection_invalidated
+
+
+class RoutingSession(Session):
+    """
+    Sync session behind AsyncSessionLocal. The async sessions only serve
+    reads, so each one reads from one replica, picked when it first runs a
+    query, unless it was pinned to the primary (session.info["primary"]) or
+    the query runs under primary_reads(). Without replicas, or with none
+    healthy, it reads from the primary.
+
+    A query the replica fails to serve is run again on the primary, which
+    the session then keeps reading from. The async sessions buffer results,
+    so no rows of the failed query have been handed out yet.
+    """
+
+    def _reads_primary(self) -> bool:
+        return not replicas or self.info.get("primary") or _primary_reads.get()
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self._reads_primary():
+            return async_engine.sync_engine
+        if "replica" not in self.info:
+            self.info["replica"] = replicas.pick()
+        replica = self.info["replica"]
+        return (replica or async_engine).sync_engine
+
+    def execute(self, statement, *args, **kw):
+        try:
+            return super().execute(statement, *args, **kw)
+        except DBAPIError as exc:
+            replica = self.info.get("replica")
+            if replica is None or self._reads_primary() or not replica_failed(exc):
+                raise
+            # Until the next health check passes
+            replicas.mark_down(replica)
+            self.info["primary"] = True
+            del self.info["replica"]
+        return super().execute(statement, *args, **kw)
+
+
+AsyncSessionLocal = async_sessionmaker(
+    sync_session_class=RoutingSession, autoflush=False, expire_on_commit=False
+)
+
+
+def dialect_insert(db):
+    """
+    The INSERT construct of db's dialect, for ON CONFLICT clauses.
+    """
+    dialect = db.get_bind().dialect.name
+    return postgresql.insert if dialect == "postgresql" else sqlite.insert
+
+
+# pg_advisory_lock key of the startup lock
+STARTUP_LOCK_KEY = 573021
+
+
+@contextmanager
+def startup_lock(engine):
+    """
+    Serialize schema setup between the workers starting up against a
+    database: a PostgreSQL advisory lock, or a lock file for other
+    databases (whose workers share a host).
+    """
+    if engine.dialect.name == "postgresql":
+        with engine.connect() as connection:
+            connection.execute(text("SELECT pg_advisory_lock(:key)"), {"key": STARTUP_LOCK_KEY})
+            try:
+                yield
+            finally:
+                connection.execute(
+                    text("SELECT pg_advisory_unlock(:key)"), {"key": STARTUP_LOCK_KEY}
+                )
+        return
+    name = hashlib.blake2b(str(engine.url).encode(), digest_size=8).hexdigest()
+    path = os.path.join(tempfile.gettempdir(), f"swe573-startup-{name}.lock")
+    with open(path, "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
 
 # Dependency for getting the database session
 def get_db():
@@ -20,3 +260,58 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# Cookie set on the responses to writes, for REPLICA_MAX_LAG: the client's
+# reads go to the primary meanwhile, so it sees its own writes
+PRIMARY_PIN_COOKIE = "read_primary"
+
+
+class PrimaryPinMiddleware:
+    """
+    Pure ASGI middleware setting PRIMARY_PIN_COOKIE on every successful
+    request other than GET, HEAD and OPTIONS, when there are replicas.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or not replicas
+            or scope["method"] in ("GET", "HEAD", "OPTIONS")
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        cookie = (
+            f"{PRIMARY_PIN_COOKIE}={int(time.time())}; Max-Age={max(1, round(REPLICA_MAX_LAG))}; "
+            "Path=/; HttpOnly; SameSite=Lax"
+        ).encode()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                headers = list(message.get("headers", ()))
+                headers.append((b"set-cookie", cookie))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+# Dependency for getting an async database session, for reads only: see
+# RoutingSession. Nothing may lazy-load on it: eager-load every relationship
+# a route touches.
+async def get_async_db(request: Request):
+    async with AsyncSessionLocal() as db:
+        if PRIMARY_PIN_COOKIE in request.cookies:
+            db.sync_session.info["primary"] = True
+        try:
+            yield db
+        except DBAPIError as exc:
+            # Failed while rows were being streamed, past retrying
+            replica = db.sync_session.info.get("replica")
+            if replica is not None and replica_failed(exc):
+                replicas.mark_down(replica)
+            raise
@@ -0,0 +1,77 @@
+"""
+Normalization of the physical descriptors of posts, applied on write.
+
+Categorical descriptors (material, color, shape, origin, location) are
+stored trimmed, with whitespace collapsed. Material, color and shape are
+also stored in lower case; origin and location name places, so they keep
+the case they were written in and are compared case-insensitively (see
+app.facets). Measurements are
+stored in canonical units, centimetres for length/width/height and
+kilograms for weight, and may be given with a unit ("5 mm", "50 g").
+"""
+
+import re
+from typing import Optional, Union
+
+CATEGORICAL_COLUMNS = ("material", "color", "shape", "origin", "location")
+NUMERIC_COLUMNS = ("length", "width", "height", "weight")
+# Categorical columns stored in the case they were written in
+CASED_COLUMNS = ("origin", "location")
+
+LENGTH_UNITS = {"cm": 1.0, "mm": 0.1, "m": 100.0, "in": 2.54, "ft": 30.48}
+WEIGHT_UNITS = {
+    "kg": 1.0,
+    "g": 0.001,
+    "mg": 0.000001,
+    "lb": 0.45359237,
+    "oz": 0.028349523125,
+}
+UNITS = {
+    "length": LENGTH_UNITS,
+    "width": LENGTH_UNITS,
+    "height": LENGTH_UNITS,
+    "weight": WEIGHT_UNITS,
+}
+
+_MEASURE_RE = re.compile(r"^\s*(-?\d*\.?\d+)\s*([a-z]*)\s*$", re.IGNORECASE)
+
+
+def normalize_term(value: Optional[str], fold_case: bool = True) -> Optional[str]:
+    if value is None:
+        return None
+    value = " ".join(value.split())
+    return (value.lower() if fold_case else value) or None
+
+
+def normalize_descriptor(column: str, value: Optional[str]) -> Optional[str]:
+    """
+    value of a categorical column in the form it is stored in.
+    """
+    return normalize_term(value, fold_case=column not in CASED_COLUMNS)
+
+
+def parse_measure(column: str, value: Union[str, float, None]) -> Optional[float]:
+    """
+    Convert a measurement, a number or a string such as "5 mm", to the
+    column's canonical unit. Numbers without a unit are taken as canonical.
+    """
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    if isinstance(value, (int, float)):
+        number, unit = float(value), ""
+    else:
+        match = _MEASURE_RE.match(value)
+        if not match:
+            example = next(iter(UNITS[column]))
+            raise ValueError(
+                f"{column} must be a number with an optional unit, e.g. '5 {example}'"
+            )
+        number, unit = float(match.group(1)), match.group(2).lower()
+    if number < 0:
+        raise ValueError(f"{column} must be greater than 0")
+    if not unit:
+        return number
+    units = UNITS[column]
+    if unit not in units:
+        raise ValueError(f"{column}: unknown unit '{unit}', use one of {', '.join(units)}")
+    return round(number * units[unit], 9)
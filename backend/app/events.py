@@ -0,0 +1,374 @@
+"""
+Live updates: small delta events pushed to subscribed clients over
+Server-Sent Events when a write commits.
+
+Events are published on channels:
+- post_channel(id): comments, comment votes and interest changes on a post
+- FEED: new posts and interest changes on any post
+
+A write calls publish(db, event, *channels) before committing. The event is
+delivered only if the transaction commits, by the configured backend:
+
+- "local": queued on the session and handed to this process's subscribers
+  after commit. Enough for a single worker.
+- "postgres": sent with pg_notify inside the transaction; PostgreSQL
+  delivers it on commit to every worker LISTENing on the channel, this one
+  included, so it works across several uvicorn workers.
+
+broadcast(event, *channels) sends an event to every worker right away,
+outside any transaction; code in each worker can react to events with
+broker.listen() (e.g. to drop its cached copies of what changed). Listeners
+only see events from other workers.
+
+Every subscriber has a bounded queue. Events are rendered to an SSE frame
+once and shared by all subscribers. A subscriber whose queue is full is too
+slow to keep up (its socket isn't draining) and is evicted: its backlog is
+dropped and it gets a final "evicted" event, after which clients should
+reload the resource and reconnect.
+"""
+
+import asyncio
+import logging
+import os
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+import orjson
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from app import metrics
+from app.serialization import dump_json
+
+logger = logging.getLogger(__name__)
+
+EVENTS_BACKEND = os.getenv("EVENTS_BACKEND")  # "local" or "postgres"
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", 100))
+EVENTS_MAX_SUBSCRIBERS = int(os.getenv("EVENTS_MAX_SUBSCRIBERS", 1000))
+EVENTS_HEARTBEAT = float(os.getenv("EVENTS_HEARTBEAT", 15))
+
+FEED = "posts"
+NOTIFY_CHANNEL = "swe573_events"
+# PostgreSQL rejects NOTIFY payloads of 8000 bytes or more
+NOTIFY_MAX_BYTES = 7999
+
+_PENDING = "pending_events"
+
+# Tells this process's messages apart from other workers'
+WORKER_ID = uuid.uuid4().hex[:12]
+
+# Reconnect delay for clients, then keep-alive and eviction frames
+RETRY_FRAME = b"retry: 3000\n\n"
+HEARTBEAT_FRAME = b": keep-alive\n\n"
+EVICTED_FRAME = b"event: evicted\ndata: {}\n\n"
+
+
+def post_channel(post_id: int) -> str:
+    return f"post:{post_id}"
+
+
+def encode_message(event: dict, channels: Iterable[str]) -> bytes:
+    """
+    Wire format shared by the backends: the sending worker's ID and the
+    channels, space-separated, on the first line, the event as JSON on the
+    second.
+    """
+    return " ".join((WORKER_ID, *channels)).encode() + b"\n" + dump_json(event)
+
+
+def summarize(event: dict) -> dict:
+    """
+    The event without its nested objects (e.g. a comment's text), for
+    payloads too big to send; clients reload the resource instead.
+    """
+    summary = {key: value for key, value in event.items() if not isinstance(value, dict)}
+    summary["truncated"] = True
+    return summary
+
+
+class Subscription:
+    def __init__(self, channels: Iterable[str], queue_size: int):
+        self.channels = frozenset(channels)
+        self.queue: "asyncio.Queue[bytes]" = asyncio.Queue(queue_size)
+
+
+class Broker:
+    """
+    Fans messages out to the subscriptions of this process. Everything but
+    deliver_threadsafe() runs on the event loop.
+    """
+
+    def __init__(self, queue_size: int, max_subscribers: int):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.evictions = 0
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._listeners: Dict[str, List[Callable[[dict], None]]] = {}
+        self._count = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def __len__(self):
+        return self._count
+
+    def subscribe(self, *channels: str) -> Optional[Subscription]:
+        """
+        A new subscription, or None if the process is at its limit.
+        """
+        if self._count >= self.max_subscribers:
+            return None
+        self._loop = asyncio.get_running_loop()
+        subscription = Subscription(channels, self.queue_size)
+        for channel in subscription.channels:
+            self._subscribers.setdefault(channel, set()).add(subscription)
+        self._count += 1
+        metrics.EVENT_SUBSCRIBERS.inc()
+        return subscription
+
+    def listen(self, channel: str, callback: Callable[[dict], None]):
+        """
+        Call callback(event), on the event loop, for every event other
+        workers send on channel. It must not block.
+        """
+        self._listeners.setdefault(channel, []).append(callback)
+
+    def unsubscribe(self, subscription: Subscription):
+        removed = False
+        for channel in subscription.channels:
+            subscribers = self._subscribers.get(channel)
+            if subscribers and subscription in subscribers:
+                subscribers.discard(subscription)
+                removed = True
+                if not subscribers:
+                    del self._subscribers[channel]
+        if removed:
+            self._count -= 1
+            metrics.EVENT_SUBSCRIBERS.dec()
+
+    def deliver(self, message: bytes):
+        head, _, body = message.partition(b"\n")
+        origin, *channels = head.decode().split()
+        if origin != WORKER_ID:
+            self._notify_listeners(channels, body)
+        targets = set()
+        for channel in channels:
+            targets.update(self._subscribers.get(channel, ()))
+        if not targets:
+            return
+        frame = b"data: " + body + b"\n\n"
+        for subscription in targets:
+            try:
+                subscription.queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                self._evict(subscription)
+        metrics.EVENTS_DELIVERED.inc(len(targets))
+
+    def _notify_listeners(self, channels: List[str], body: bytes):
+        callbacks = [
+            callback for channel in channels for callback in self._listeners.get(channel, ())
+        ]
+        if not callbacks:
+            return
+        event = orjson.loads(body)
+        for callback in callbacks:
+            try:
+                callback(event)
+            except Exception:
+                logger.exception("Events listener %r failed", callback)
+
+    def deliver_threadsafe(self, message: bytes):
+        """
+        deliver() from another thread (e.g. a sync endpoint's threadpool).
+        """
+        loop = self._loop
+        if loop is not None and self._count and not loop.is_closed():
+            loop.call_soon_threadsafe(self.deliver, message)
+
+    def _evict(self, subscription: Subscription):
+        self.unsubscribe(subscription)
+        queue = subscription.queue
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(EVICTED_FRAME)
+        self.evictions += 1
+        metrics.EVENT_EVICTIONS.inc()
+
+
+broker = Broker(EVENTS_QUEUE_SIZE, EVENTS_MAX_SUBSCRIBERS)
+
+
+async def stream(subscription: Subscription):
+    """
+    SSE body for a subscription: events as they come, a comment line every
+    EVENTS_HEARTBEAT seconds to keep proxies from closing an idle
+    connection. Unsubscribes when the client goes away.
+    """
+    try:
+        yield RETRY_FRAME
+        while True:
+            try:
+                frame = await asyncio.wait_for(subscription.queue.get(), EVENTS_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield HEARTBEAT_FRAME
+                continue
+            yield frame
+            if frame is EVICTED_FRAME:
+                return
+    finally:
+        broker.unsubscribe(subscription)
+
+
+class LocalBackend:
+    def publish(self, db: Session, message: bytes):
+        # Begin the transaction if nothing has yet, so a rollback drops it
+        db.connection()
+        db.info.setdefault(_PENDING, []).append(message)
+
+    def broadcast(self, message: bytes):
+        # This is the only worker; only its subscribers can want it
+        broker.deliver_threadsafe(message)
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+
+@event.listens_for(Session, "after_commit")
+def _deliver_pending(session):
+    for message in session.info.pop(_PENDING, ()):
+        broker.deliver_threadsafe(message)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _drop_pending(session, previous_transaction):
+    session.info.pop(_PENDING, None)
+
+
+class PostgresBackend:
+    """
+    NOTIFY from the writing transaction, LISTEN on a dedicated asyncpg
+    connection of the async engine, reconnecting if it drops. Broadcasts are
+    queued and sent one at a time on the LISTEN connection.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._connection = None
+        self._listener = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._outbox: Optional["asyncio.Queue[str]"] = None
+        self._sender: Optional[asyncio.Task] = None
+        self._reconnect: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    @staticmethod
+    def _payload(message: bytes) -> str:
+        payload = message.decode()
+        if len(message) > NOTIFY_MAX_BYTES:
+            head, _, body = payload.partition("\n")
+            payload = head + "\n" + dump_json(summarize(orjson.loads(body))).decode()
+        return payload
+
+    def publish(self, db: Session, message: bytes):
+        db.execute(select(func.pg_notify(NOTIFY_CHANNEL, self._payload(message))))
+
+    def broadcast(self, message: bytes):
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._outbox.put_nowait, self._payload(message))
+
+    async def _send(self):
+        while True:
+            payload = await self._outbox.get()
+            try:
+                await self._listener.execute(
+                    "SELECT pg_notify($1, $2)", NOTIFY_CHANNEL, payload
+                )
+            except Exception:
+                logger.exception("Could not broadcast an event")
+
+    def _on_notify(self, connection, pid, channel, payload):
+        broker.deliver(payload.encode())
+
+    def _on_terminate(self, connection):
+        if not self._stopping:
+            logger.warning("Lost the events LISTEN connection, reconnecting")
+            self._reconnect = asyncio.get_running_loop().create_task(self.start())
+
+    async def start(self):
+        if self._sender is None:
+            self._loop = asyncio.get_running_loop()
+            self._outbox = asyncio.Queue()
+            self._sender = self._loop.create_task(self._send())
+        delay = 1.0
+        if self._connection is not None:
+            # A dropped connection, don't hand it back to the pool
+            await self._connection.invalidate()
+            self._connection = None
+        while not self._stopping:
+            try:
+                self._connection = await self.engine.connect()
+                raw = await self._connection.get_raw_connection()
+                listener = raw.driver_connection
+                await listener.add_listener(NOTIFY_CHANNEL, self._on_notify)
+                listener.add_termination_listener(self._on_terminate)
+                self._listener = listener
+                return
+            except Exception:
+                logger.exception("Could not LISTEN for events, retrying in %.0fs", delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+
+    async def stop(self):
+        self._stopping = True
+        if self._reconnect is not None:
+            self._reconnect.cancel()
+        if self._sender is not None:
+            self._sender.cancel()
+        if self._connection is not None:
+            await self._connection.close()
+
+
+def make_backend(engine, async_engine):
+    name = EVENTS_BACKEND or (
+        "postgres" if engine.dialect.name == "postgresql" else "local"
+    )
+    if name == "postgres":
+        return PostgresBackend(async_engine)
+    if name == "local":
+        return LocalBackend()
+    raise ValueError(f"Unknown EVENTS_BACKEND {name!r}")
+
+
+_backend = LocalBackend()
+
+
+def configure(engine, async_engine):
+    global _backend
+    _backend = make_backend(engine, async_engine)
+
+
+async def start():
+    broker._loop = asyncio.get_running_loop()
+    await _backend.start()
+
+
+async def stop():
+    await _backend.stop()
+
+
+def publish(db: Session, event: dict, *channels: str):
+    """
+    Publish event on channels once db's transaction commits.
+    """
+    _backend.publish(db, encode_message(event, channels))
+
+
+def broadcast(event: dict, *channels: str):
+    """
+    Send event on channels to every worker now, whatever the state of any
+    transaction. Thread-safe. Best effort: a worker that is reconnecting to
+    the database misses it.
+    """
+    _backend.broadcast(encode_message(event, channels))
@@ -0,0 +1,332 @@
+"""
+Faceted filtering on the physical descriptors of posts: filter parsing,
+the partial indexes behind it, and facet counts. Values are compared in
+the normalized form described in app.descriptors.
+"""
+
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Query
+from sqlalchemy import (
+    Index,
+    String,
+    bindparam,
+    case,
+    cast,
+    func,
+    inspect,
+    literal,
+    null,
+    or_,
+    select,
+    text,
+    union_all,
+)
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.descriptors import (
+    CASED_COLUMNS,
+    CATEGORICAL_COLUMNS,
+    NUMERIC_COLUMNS,
+    normalize_descriptor,
+    normalize_term,
+    parse_measure,
+)
+from app.models import Post
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket edges in canonical units; the last bucket is open-ended
+LENGTH_EDGES = (0, 1, 2, 5, 10, 20, 50, 100)
+HISTOGRAM_EDGES = {
+    "length": LENGTH_EDGES,
+    "width": LENGTH_EDGES,
+    "height": LENGTH_EDGES,
+    "weight": (0, 0.01, 0.05, 0.1, 0.5, 1, 5, 10),
+}
+
+# Most common values returned per categorical facet
+FACET_VALUE_LIMIT = 20
+
+# Posts rewritten per statement when normalizing old descriptors
+NORMALIZE_BATCH_SIZE = 500
+
+# (column, values) pairs, sorted by column: a tuple of normalized terms for
+# categorical columns, a (min, max) pair for numeric ones. Hashable, so it
+# doubles as part of a cache key.
+Filters = Tuple[Tuple[str, tuple], ...]
+
+
+def compared(column: str):
+    """
+    The expression a categorical column is filtered and grouped on: the
+    column, or its lower case for CASED_COLUMNS.
+    """
+    attr = getattr(Post.__table__.c, column)
+    return func.lower(attr) if column in CASED_COLUMNS else attr
+
+
+def _index_name(column: str) -> str:
+    return f"ix_posts_{column}_lower" if column in CASED_COLUMNS else f"ix_posts_{column}"
+
+
+def descriptor_indexes() -> List[Index]:
+    """
+    Partial indexes for the filters: (compared column, id) over the posts
+    that have the descriptor, so equality filters can also serve the
+    default id ordering, and plain ones over the measurements for range
+    filters.
+    """
+    indexes = []
+    for column in CATEGORICAL_COLUMNS + NUMERIC_COLUMNS:
+        attr = getattr(Post.__table__.c, column)
+        if column in CATEGORICAL_COLUMNS:
+            columns = (compared(column), Post.__table__.c.id)
+        else:
+            columns = (attr,)
+        indexes.append(
+            Index(
+                _index_name(column),
+                *columns,
+                postgresql_where=attr.isnot(None),
+                sqlite_where=attr.isnot(None),
+            )
+        )
+    return indexes
+
+
+DESCRIPTOR_INDEXES = descriptor_indexes()
+# Indexes of CASED_COLUMNS from when they were stored in lower case
+_FOLDED_INDEXES = tuple(f"ix_posts_{column}" for column in CASED_COLUMNS)
+
+
+def _normalize_descriptors(conn) -> int:
+    """
+    Rewrite the categorical descriptors of every post in the form
+    normalize_descriptor gives them. Returns the number of posts changed.
+    """
+    posts = Post.__table__
+    columns = [posts.c[column] for column in CATEGORICAL_COLUMNS]
+    changed = []
+    for row in conn.execute(
+        select(posts.c.id, *columns).where(or_(*(column.isnot(None) for column in columns)))
+    ):
+        values = {
+            column: normalize_descriptor(column, getattr(row, column))
+            for column in CATEGORICAL_COLUMNS
+        }
+        if any(values[column] != getattr(row, column) for column in CATEGORICAL_COLUMNS):
+            changed.append({"post_id": row.id, **values})
+    for start in range(0, len(changed), NORMALIZE_BATCH_SIZE):
+        conn.execute(
+            posts.update().where(posts.c.id == bindparam("post_id")),
+            changed[start : start + NORMALIZE_BATCH_SIZE],
+        )
+    return len(changed)
+
+
+def setup_facets(engine):
+    """
+    Create the descriptor indexes on posts tables created before they
+    existed, and normalize the descriptors those posts were written with.
+    """
+    with engine.begin() as conn:
+        existing = _index_names(conn)
+        missing = [index for index in DESCRIPTOR_INDEXES if index.name not in existing]
+        if not missing:
+            return
+        for name in _FOLDED_INDEXES:
+            if name in existing:
+                conn.execute(text(f"DROP INDEX {name}"))
+        # Normalized before indexing, so the indexes are built once
+        normalized = _normalize_descriptors(conn)
+        for index in missing:
+            index.create(conn)
+    logger.info("Normalized the descriptors of %d posts", normalized)
+
+
+def _index_names(conn) -> set:
+    if conn.dialect.name == "sqlite":
+        # SQLite reflection leaves out expression indexes
+        rows = conn.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table"),
+            {"table": Post.__tablename__},
+        )
+        return set(rows.scalars())
+    return {index["name"] for index in inspect(conn).get_indexes(Post.__tablename__)}
+
+
+def _terms(values: Optional[List[str]]) -> tuple:
+    # Accept both repeated parameters and comma-separated values
+    terms = {
+        normalize_term(term)
+        for value in values or ()
+        for term in value.split(",")
+    }
+    return tuple(sorted(term for term in terms if term))
+
+
+def _range(column: str, low: Optional[str], high: Optional[str]) -> Optional[tuple]:
+    try:
+        low, high = parse_measure(column, low), parse_measure(column, high)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if low is None and high is None:
+        return None
+    return (low, high)
+
+
+def post_filters(
+    material: Optional[List[str]] = Query(None),
+    color: Optional[List[str]] = Query(None),
+    shape: Optional[List[str]] = Query(None),
+    origin: Optional[List[str]] = Query(None),
+    location: Optional[List[str]] = Query(None),
+    min_length: Optional[str] = None,
+    max_length: Optional[str] = None,
+    min_width: Optional[str] = None,
+    max_width: Optional[str] = None,
+    min_height: Optional[str] = None,
+    max_height: Optional[str] = None,
+    min_weight: Optional[str] = None,
+    max_weight: Optional[str] = None,
+) -> Filters:
+    """
+    Dependency parsing the descriptor filters: any of the listed values for
+    a categorical column (repeat the parameter or separate with commas),
+    inclusive bounds, optionally with units, for a measurement.
+    """
+    filters = {}
+    for column, values in (
+        ("material", material),
+        ("color", color),
+        ("shape", shape),
+        ("origin", origin),
+        ("location", location),
+    ):
+        terms = _terms(values)
+        if terms:
+            filters[column] = terms
+    for column, low, high in (
+        ("length", min_length, max_length),
+        ("width", min_width, max_width),
+        ("height", min_height, max_height),
+        ("weight", min_weight, max_weight),
+    ):
+        bounds = _range(column, low, high)
+        if bounds:
+            filters[column] = bounds
+    return tuple(sorted(filters.items()))
+
+
+def filter_conditions(filters: Filters, exclude: Optional[str] = None) -> list:
+    conditions = []
+    for column, values in filters:
+        if column == exclude:
+            continue
+        if column in CATEGORICAL_COLUMNS:
+            if column in CASED_COLUMNS:
+                # Lets the planner see the partial index applies
+                conditions.append(getattr(Post, column).isnot(None))
+            conditions.append(compared(column).in_(values))
+        else:
+            attr = getattr(Post, column)
+            low, high = values
+            if low is not None:
+                conditions.append(attr >= low)
+            if high is not None:
+                conditions.append(attr <= high)
+    return conditions
+
+
+def apply_filters(statement, filters: Filters):
+    conditions = filter_conditions(filters)
+    return statement.where(*conditions) if conditions else statement
+
+
+def _bucket(attr, edges: tuple):
+    return case(
+        *((attr < edge, index) for index, edge in enumerate(edges[1:])),
+        else_=len(edges) - 1,
+    )
+
+
+def facet_statement(filters: Filters):
+    """
+    One UNION ALL of grouped aggregates: the total, the most common values
+    of every categorical column and a histogram of every measurement.
+
+    A facet's counts ignore its own column's filter, so they show how many
+    posts each alternative value would match alongside the other filters.
+    """
+    branches = [
+        select(
+            literal("total").label("facet"),
+            cast(null(), String).label("value"),
+            func.count().label("count"),
+        )
+        .select_from(Post)
+        .where(*filter_conditions(filters))
+    ]
+    for column in CATEGORICAL_COLUMNS:
+        attr, key = getattr(Post, column), compared(column)
+        # Values differing only in case count together, shown as one of them
+        top = (
+            select(
+                literal(column).label("facet"),
+                (func.min(attr) if column in CASED_COLUMNS else attr).label("value"),
+                func.count().label("count"),
+            )
+            .where(attr.isnot(None), *filter_conditions(filters, exclude=column))
+            .group_by(key)
+            .order_by(func.count().desc(), key)
+            .limit(FACET_VALUE_LIMIT)
+            .subquery()
+        )
+        branches.append(select(top))
+    for column in NUMERIC_COLUMNS:
+        attr = getattr(Post, column)
+        # Bucket in a subquery so the GROUP BY is on a plain column
+        buckets = (
+            select(_bucket(attr, HISTOGRAM_EDGES[column]).label("bucket"))
+            .where(attr.isnot(None), *filter_conditions(filters, exclude=column))
+            .subquery()
+        )
+        branches.append(
+            select(
+                literal(column).label("facet"),
+                cast(buckets.c.bucket, String).label("value"),
+                func.count().label("count"),
+            ).group_by(buckets.c.bucket)
+        )
+    return union_all(*branches)
+
+
+async def facet_counts(db: AsyncSession, filters: Filters) -> Dict:
+    """
+    PostFacets-shaped counts for the posts matching filters, in one query.
+    """
+    values = {column: [] for column in CATEGORICAL_COLUMNS}
+    buckets = {column: {} for column in NUMERIC_COLUMNS}
+    total = 0
+    for facet, value, count in (await db.execute(facet_statement(filters))).all():
+        if facet == "total":
+            total = count
+        elif facet in values:
+            values[facet].append({"value": value, "count": count})
+        else:
+            buckets[facet][int(value)] = count
+
+    # UNION ALL keeps no order across branches
+    for column_values in values.values():
+        column_values.sort(key=lambda item: (-item["count"], item["value"]))
+
+    histograms = {}
+    for column, edges in HISTOGRAM_EDGES.items():
+        bounds = list(edges) + [None]
+        histograms[column] = [
+            {"min": bounds[i], "max": bounds[i + 1], "count": buckets[column].get(i, 0)}
+            for i in range(len(edges))
+        ]
+    return {"total": total, "values": values, "histograms": histograms}
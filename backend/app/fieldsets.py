@@ -0,0 +1,96 @@
+"""
+Sparse fieldsets for the post list endpoints.
+
+`?fields=` names the PostWithTags fields a client wants, comma-separated,
+and/or presets standing for several of them: "card" for what a grid of
+posts shows, "full" (the default) for everything. Only what the selected
+fields need is read: a posts column per column field, the join to users
+for `creator`, and the tag query for `tags`. `id` is always included, as
+cursors and cache invalidation are keyed on it.
+"""
+
+from typing import List, Optional, Tuple, Type
+
+from fastapi import HTTPException, Query
+from pydantic import BaseModel, create_model
+
+from app.models import Post
+from app.schemas import PostWithTags
+
+Fields = Tuple[str, ...]
+
+POST_FIELDS: Fields = tuple(PostWithTags.model_fields)
+# Fields read straight from a posts column; creator comes from the join to
+# users, tags from a query of their own and resolved is a constant
+POST_COLUMN_FIELDS: Fields = tuple(
+    field for field in POST_FIELDS if field in Post.__table__.c
+)
+FIELD_PRESETS = {
+    "card": ("id", "title", "image_url", "thumbnail_url", "creator", "interest_count"),
+    "full": POST_FIELDS,
+}
+DEFAULT_FIELDS = "full"
+
+
+def parse_fields(value: str) -> Fields:
+    """
+    The fields named by a `fields` parameter, in PostWithTags order so that
+    equivalent selections share cache entries.
+    """
+    selected = {"id"}
+    for name in value.split(","):
+        name = name.strip()
+        if not name:
+            continue
+        if name in FIELD_PRESETS:
+            selected.update(FIELD_PRESETS[name])
+        elif name in POST_FIELDS:
+            selected.add(name)
+        else:
+            raise HTTPException(
+                status_code=422,
+                detail=f"Unknown field {name!r}; expected a preset "
+                f"({', '.join(FIELD_PRESETS)}) or one of {', '.join(POST_FIELDS)}",
+            )
+    return tuple(field for field in POST_FIELDS if field in selected)
+
+
+FULL_FIELDS = parse_fields("full")
+CARD_FIELDS = parse_fields("card")
+
+
+def post_fields(
+    fields: Optional[str] = Query(
+        None,
+        description="Comma-separated post fields and/or presets "
+        f"({', '.join(FIELD_PRESETS)}); default {DEFAULT_FIELDS}",
+    ),
+) -> Fields:
+    """
+    Dependency parsing the fields to return for each post of a list page.
+    """
+    return parse_fields(fields or DEFAULT_FIELDS)
+
+
+def post_schema(fields: Fields, name: str = "PostFields") -> Type[BaseModel]:
+    """
+    Model of a post narrowed to fields, built from PostWithTags.
+    """
+    return create_model(
+        name,
+        **{
+            field: (PostWithTags.model_fields[field].annotation, PostWithTags.model_fields[field])
+            for field in fields
+        },
+    )
+
+
+def page_schema(item: Type[BaseModel], name: str) -> Type[BaseModel]:
+    """
+    Model of a list page of item.
+    """
+    return create_model(name, items=(List[item], []), next_cursor=(Optional[str], None))
+
+
+PostCard = post_schema(CARD_FIELDS, "PostCard")
+PostCardPage = page_schema(PostCard, "PostCardPage")
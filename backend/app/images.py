@@ -0,0 +1,190 @@
+import logging
+import os
+import shutil
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Optional
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from sqlalchemy import inspect, text, update
+from starlette.concurrency import run_in_threadpool
+
+from app.database import SessionLocal
+from app.models import Post
+from app.response_cache import card_tag, post_tag, response_cache
+
+logger = logging.getLogger(__name__)
+
+IMAGE_DIR = os.path.join("static", "images")
+IMAGE_URL_PREFIX = "/static/images"
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 10 * 1024 * 1024))
+# Allowance for the other fields of a post form and the multipart framing
+FORM_OVERHEAD_BYTES = 1024 * 1024
+# (method, path) of the routes taking an image upload
+UPLOAD_ROUTES = {("POST", "/posts")}
+UPLOAD_CHUNK_SIZE = 256 * 1024
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", 2))
+
+# Derivatives generated for every upload: name -> bounding box in pixels.
+# Each is stored as <upload stem>_<name>.webp and exposed as <name>_url.
+IMAGE_VARIANTS = {
+    "thumbnail": (320, 320),
+    "preview": (1024, 1024),
+}
+VARIANT_QUALITY = 80
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def setup_images(engine):
+    """
+    Add the variant URL columns to posts tables created before they existed.
+    Older posts keep no variants and are shown with image_url.
+    """
+    with engine.begin() as conn:
+        columns = {column["name"] for column in inspect(conn).get_columns(Post.__tablename__)}
+        for name in IMAGE_VARIANTS:
+            if f"{name}_url" not in columns:
+                conn.execute(text(f"ALTER TABLE posts ADD COLUMN {name}_url VARCHAR"))
+
+
+class UploadLimitMiddleware:
+    """
+    Pure ASGI middleware bounding the request body of UPLOAD_ROUTES before
+    the form is parsed, since parsing spools every uploaded file to disk
+    whole. A Content-Length over the limit is refused outright, and a body
+    sent without one is cut off with a 413 once it grows past the limit.
+    save_upload then checks the image itself against MAX_UPLOAD_BYTES.
+    """
+
+    def __init__(self, app, limit: int = MAX_UPLOAD_BYTES + FORM_OVERHEAD_BYTES):
+        self.app = app
+        self.limit = limit
+
+    def _too_large(self) -> HTTPException:
+        return HTTPException(
+            status_code=413, detail=f"Request body is larger than {self.limit} bytes"
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or (scope["method"], scope["path"]) not in UPLOAD_ROUTES:
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope["headers"]:
+            if name == b"content-length" and value.isdigit() and int(value) > self.limit:
+                response = JSONResponse({"detail": self._too_large().detail}, status_code=413)
+                await response(scope, receive, send)
+                return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.limit:
+                    # Raised inside the form parsing, which lets HTTPException through
+                    raise self._too_large()
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def _copy_limited(src, dst_path: str, limit: int) -> bool:
+    """
+    Copy src to dst_path in chunks, giving up (and removing the partial file)
+    once more than limit bytes have been read. Returns False if the limit was
+    exceeded.
+    """
+    written = 0
+    with open(dst_path, "wb") as dst:
+        while True:
+            chunk = src.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                return True
+            written += len(chunk)
+            if written > limit:
+                break
+            dst.write(chunk)
+    os.remove(dst_path)
+    return False
+
+
+async def save_upload(image: UploadFile) -> str:
+    """
+    Stream an uploaded image to disk off the event loop and return the path.
+    Raises 413 if it's larger than MAX_UPLOAD_BYTES.
+    """
+    os.makedirs(IMAGE_DIR, exist_ok=True)
+    unique_name = f"{uuid.uuid4()}_{os.path.basename(image.filename or 'upload')}"
+    file_path = os.path.join(IMAGE_DIR, unique_name)
+
+    if not await run_in_threadpool(
+        _copy_limited, image.file, file_path, MAX_UPLOAD_BYTES
+    ):
+        raise HTTPException(
+            status_code=413,
+            detail=f"Image is larger than {MAX_UPLOAD_BYTES} bytes",
+        )
+    return file_path
+
+
+def static_url(file_path: str) -> str:
+    return f"{IMAGE_URL_PREFIX}/{os.path.basename(file_path)}"
+
+
+def generate_variants(file_path: str) -> dict:
+    """
+    Write the resized WebP variants of file_path next to it. Runs in a worker
+    process; returns {"<name>_url": url}.
+    """
+    from PIL import Image, ImageOps
+
+    stem = os.path.splitext(file_path)[0]
+    urls = {}
+    with Image.open(file_path) as original:
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ("RGB", "RGBA"):
+            original = original.convert("RGBA" if "A" in original.getbands() else "RGB")
+        for name, size in IMAGE_VARIANTS.items():
+            variant = original.copy()
+            variant.thumbnail(size)
+            variant_path = f"{stem}_{name}.webp"
+            variant.save(variant_path, "WEBP", quality=VARIANT_QUALITY, method=4)
+            urls[f"{name}_url"] = static_url(variant_path)
+    return urls
+
+
+def _store_variant_urls(post_id: int, future: Future):
+    try:
+        urls = future.result()
+    except Exception:
+        logger.warning("Could not generate image variants for post %s", post_id, exc_info=True)
+        return
+    with SessionLocal() as db:
+        db.execute(update(Post).where(Post.id == post_id).values(**urls))
+        db.commit()
+    response_cache.invalidate(post_tag(post_id), card_tag(post_id))
+
+
+def schedule_variants(post_id: int, file_path: str):
+    """
+    Generate the variants of a post's image in the process pool and record
+    their URLs on the post once they're written.
+    """
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+    future = _pool.submit(generate_variants, file_path)
+    future.add_done_callback(lambda done: _store_variant_urls(post_id, done))
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True)
+        _pool = None
@@ -0,0 +1,260 @@
+"""
+Logging for the server: JSON lines written off the request path.
+
+Loggers hand records to a QueueHandler; a QueueListener thread formats them
+and writes them to stderr, so a request thread never blocks on I/O. Log
+calls use lazy %-style arguments, which are only rendered on the listener
+thread (or earlier, when an argument is a mutable object that could change
+before then).
+
+Every record carries the request ID and route of the request it was logged
+from. Below ERROR, each call site (logger and message template) may log at
+most LOG_RATE_LIMIT records per second; the rest are dropped and counted
+on the next record let through, so a hot path can't flood the output.
+Secrets (the SECRET_KEY value, JWTs, bearer tokens, token and password
+fields) are redacted from messages and tracebacks.
+
+Settings:
+- LOG_LEVEL: root level (default INFO)
+- LOG_LEVELS: per-logger levels, e.g. "app.utils=DEBUG,uvicorn.access=WARNING"
+- LOG_RATE_LIMIT: records per second per call site below ERROR (default 20;
+  0 disables sampling)
+"""
+
+import atexit
+import contextvars
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, Tuple
+
+import orjson
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_RATE_LIMIT = float(os.getenv("LOG_RATE_LIMIT", 20))
+
+# Bound on tracked call sites, in case some logger formats its own messages
+MAX_CALL_SITES = 10000
+
+REQUEST_ID_HEADER = "x-request-id"
+# Incoming request IDs are echoed back, so only accept plain ones
+_VALID_REQUEST_ID = re.compile(r"^[\w.-]{1,64}$")
+
+_request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "request_id", default=None
+)
+_scope: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("scope", default=None)
+
+REDACTED = "[REDACTED]"
+_SECRET_PATTERNS = (
+    # JWTs
+    (re.compile(r"eyJ[\w-]+\.[\w-]+\.[\w-]*"), REDACTED),
+    (re.compile(r"(?i)(bearer\s+)\S+"), r"\1" + REDACTED),
+    (
+        # key=value, or "key": "value" in JSON / dict reprs
+        re.compile(
+            r"(?i)((?:access_token|token|password|secret_key)(?:=|[\"']\s*:\s*[\"']?))[^\s\"'&,;}]+"
+        ),
+        r"\1" + REDACTED,
+    ),
+)
+
+# Attributes of every LogRecord (and uvicorn's ANSI-colored duplicate of
+# the message); anything else was passed with extra=
+_RECORD_ATTRIBUTES = frozenset(
+    vars(logging.LogRecord("", 0, "", 0, "", (), None))
+) | {"message", "asctime", "request_id", "route", "suppressed", "color_message"}
+
+_IMMUTABLE = (str, int, float, bool, bytes, type(None))
+
+
+def redact(text: str) -> str:
+    secret = os.getenv("SECRET_KEY")
+    if secret and len(secret) >= 8:
+        text = text.replace(secret, REDACTED)
+    for pattern, replacement in _SECRET_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+class ContextFilter(logging.Filter):
+    """
+    Stamp records with the current request's ID and route. Runs on the
+    thread that logs, where the request's context is visible.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = _request_id.get()
+        scope = _scope.get()
+        route = scope.get("route") if scope is not None else None
+        record.route = getattr(route, "path", None)
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    At most rate records per second per (logger, message template) below
+    ERROR. The first record let through after some were dropped carries
+    their number as `suppressed`.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+        # call site -> (tokens, last refill, dropped)
+        self._buckets: Dict[Tuple[str, str], list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate <= 0 or record.levelno >= logging.ERROR:
+            return True
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= MAX_CALL_SITES:
+                    # Messages that aren't templates; start over
+                    self._buckets.clear()
+                bucket = self._buckets[key] = [self.rate, now, 0]
+            tokens, last, dropped = bucket
+            tokens = min(self.rate, tokens + (now - last) * self.rate)
+            if tokens < 1:
+                bucket[:] = [tokens, now, dropped + 1]
+                return False
+            bucket[:] = [tokens - 1, now, 0]
+        if dropped:
+            record.suppressed = dropped
+        return True
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    A QueueHandler that leaves formatting to the listener. The stock one
+    renders the message on the calling thread.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        args = record.args
+        if args and not all(
+            isinstance(arg, _IMMUTABLE)
+            for arg in (args.values() if isinstance(args, dict) else args)
+        ):
+            # Render now rather than risk the arguments changing meanwhile
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": redact(record.getMessage()),
+        }
+        for field in ("request_id", "route", "suppressed"):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = redact(self.formatException(record.exc_info))
+        elif record.exc_text:
+            entry["exception"] = redact(record.exc_text)
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return orjson.dumps(entry, default=str).decode()
+
+
+_listener: Optional[QueueListener] = None
+
+
+def setup_logging():
+    """
+    Route every logger, uvicorn's included, through one queue to a JSON
+    stderr handler on a listener thread. Idempotent.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    handler = DeferredQueueHandler(log_queue)
+    handler.addFilter(RateLimitFilter(LOG_RATE_LIMIT))
+    handler.addFilter(ContextFilter())
+
+    output = logging.StreamHandler()
+    output.setFormatter(JsonFormatter())
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+
+    # uvicorn installs its own stderr handlers; send its records here too,
+    # unless it silenced the logger (--no-access-log)
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        if uvicorn_logger.handlers or uvicorn_logger.propagate:
+            uvicorn_logger.handlers.clear()
+            uvicorn_logger.propagate = True
+
+    for item in filter(None, (part.strip() for part in LOG_LEVELS.split(","))):
+        name, _, level = item.partition("=")
+        logging.getLogger(name.strip()).setLevel(level.strip().upper())
+
+
+class RequestContextMiddleware:
+    """
+    Pure ASGI middleware giving every request an ID (the client's
+    X-Request-ID if it sent a plain one) that is logged with its records and
+    returned in the X-Request-ID response header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == REQUEST_ID_HEADER.encode():
+                request_id = value.decode("latin-1")
+                break
+        if not request_id or not _VALID_REQUEST_ID.match(request_id):
+            request_id = uuid.uuid4().hex
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", ()))
+                headers.append((REQUEST_ID_HEADER.encode(), request_id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        id_token = _request_id.set(request_id)
+        scope_token = _scope.set(scope)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_id.reset(id_token)
+            _scope.reset(scope_token)
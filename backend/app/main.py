@@ -1,25 +1,56 @@
 from fastapi import FastAPI, HTTPException, Depends, Response
 from sqlalchemy.orm import Session
-from sqlalchemy import text
-from .routers import post
-from .database import engine, Base, get_db  # Import get_db here
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from .routers import events as event_routes, post, tag
+from .database import (
+    engine,
+    async_engine,
+    replicas,
+    Base,
+    PrimaryPinMiddleware,
+    get_db,
+    get_async_db,
+    startup_lock,
+)
+from .search import setup_search_index
+from .facets import setup_facets
+from .comments import setup_comments
+from .similarity import load_similarity_index
+from .wikidata import wikidata, WikidataError
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 import os
 from dotenv import load_dotenv
 from fastapi.middleware.cors import CORSMiddleware
-from . import models, schemas, utils
+from . import events, images, logs, metrics, models, schemas, tags, utils, votes
 from fastapi.openapi.models import OAuthFlows as OAuthFlowsModel
 from fastapi.security import OAuth2
 from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 import logging
-import requests
+from contextlib import asynccontextmanager
 
-logging.basicConfig(level=logging.INFO)
+logs.setup_logging()
 
 load_dotenv()
 
-Base.metadata.create_all(bind=engine)
+# Workers of a multi-worker server start together; one sets up at a time
+with startup_lock(engine):
+    Base.metadata.create_all(bind=engine)
+    votes.setup_hot_ranking(engine)
+    images.setup_images(engine)
+    tags.setup_tags(engine)
+    votes.setup_votes(engine)
+    setup_comments(engine)
+    # Reads whole posts, so runs once their columns are all in place
+    setup_search_index(engine)
+    setup_facets(engine)
+load_similarity_index(engine)
+metrics.instrument_engine(engine, "sync")
+metrics.instrument_engine(async_engine.sync_engine, "async")
+for number, replica in enumerate(replicas.engines):
+    metrics.instrument_engine(replica.sync_engine, f"replica{number}")
+events.configure(engine, async_engine)
 # Load environment variables
 
 # Environment variable loading with defaults and validation
@@ -30,11 +61,25 @@ if not SECRET_KEY:
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
 
-logging.info(f"DEBUG: SECRET_KEY is: {SECRET_KEY}")
-
 # Initialize database tables
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await events.start()
+    await votes.start()
+    await replicas.start()
+    yield
+    await replicas.stop()
+    await votes.stop()
+    await events.stop()
+    await wikidata.aclose()
+    images.shutdown()
+    await async_engine.dispose()
+    metrics.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
 
 os.makedirs("static/images", exist_ok=True)
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -49,6 +94,10 @@ class OAuth2PasswordBearerWithCookie(OAuth2):
 oauth2_scheme = OAuth2PasswordBearerWithCookie(tokenUrl="login")
 
 
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(logs.RequestContextMiddleware)
+app.add_middleware(PrimaryPinMiddleware)
+app.add_middleware(images.UploadLimitMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # Allow all origins for development
@@ -64,6 +113,18 @@ app.include_router(
     tags=["posts"],
     dependencies=[Depends(utils.get_current_user)],
 )
+app.include_router(
+    tag.router,
+    prefix="",
+    tags=["tags"],
+    dependencies=[Depends(utils.get_current_user)],
+)
+app.include_router(
+    event_routes.router,
+    prefix="",
+    tags=["events"],
+    dependencies=[Depends(utils.get_current_user)],
+)
 app.state.SECRET_KEY = SECRET_KEY
 app.state.ALGORITHM = ALGORITHM
 
@@ -73,26 +134,19 @@ def read_root():
     return {"message": "Welcome to the SWE573 - root endpoint"}
 
 
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    content, media_type = metrics.render_metrics()
+    return Response(content=content, media_type=media_type)
+
+
 @app.get("/tags/search", response_model=list[dict])
-def search_tags(query: str):
-    response = requests.get(
-        "https://www.wikidata.org/w/api.php",
-        params={
-            "action": "wbsearchentities",
-            "language": "en",
-            "format": "json",
-            "search": query,
-        },
-    )
-    if response.status_code != 200:
+async def search_tags(query: str):
+    try:
+        return await wikidata.search(query)
+    except WikidataError:
         raise HTTPException(status_code=500, detail="Error fetching tags from Wikidata")
 
-    data = response.json()
-    return [
-        {"label": item["label"], "description": item.get("description", "")}
-        for item in data.get("search", [])
-    ]
-
 
 @app.post("/register", response_model=schemas.UserOut)
 def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
@@ -145,11 +199,6 @@ def login(
     return response
 
 
-@app.get("/users")
-def list_users(db: Session = Depends(get_db)):
-    return db.query(models.User).all()
-
-
 @app.post("/logout")
 def logout(response: Response):
     response.delete_cookie(key="access_token")
@@ -157,8 +206,8 @@ def logout(response: Response):
 
 
 @app.get("/users")
-def list_users(db: Session = Depends(get_db)):
-    return db.query(models.User).all()
+async def list_users(db: AsyncSession = Depends(get_async_db)):
+    return (await db.execute(select(models.User))).scalars().all()
 
 
 @app.get("/users/me")
@@ -170,10 +219,10 @@ def get_me(
 
 
 @app.get("/health/db")
-def check_db_connection(db: Session = Depends(get_db)):
+async def check_db_connection(db: AsyncSession = Depends(get_async_db)):
     try:
         # Use text() to execute a raw SQL query
-        result = db.execute(text("SELECT 1"))
+        result = await db.execute(text("SELECT 1"))
         if result:
             return {"status": "Database is connected!"}
     except Exception:
@@ -0,0 +1,272 @@
+"""
+Request, SQL, connection pool, response cache and upstream metrics, exposed
+in Prometheus text format on /metrics.
+
+MetricsMiddleware opens a per-request scope; SQLAlchemy cursor events on
+every instrumented engine add to the current scope's statement count and DB
+time. Requests that run more than N_PLUS_ONE_THRESHOLD statements are
+logged as suspected N+1 patterns.
+
+With several workers, set PROMETHEUS_MULTIPROC_DIR to an empty directory
+shared by them (cleared before they start): each worker then writes its
+values there and /metrics, whichever worker serves it, adds them up.
+Gauges that one worker can't read for the others are written as they
+change instead of on scrape; the response cache gauges are reported per
+worker (a pid label).
+"""
+
+import logging
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    Counter,
+    Gauge,
+    CollectorRegistry,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", 20))
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route",
+    ["method", "route", "status"],
+)
+REQUEST_STATEMENTS = Histogram(
+    "http_request_db_statements",
+    "SQL statements executed per HTTP request",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144),
+)
+REQUEST_DB_TIME = Histogram(
+    "http_request_db_seconds",
+    "Total time spent in SQL per HTTP request",
+    ["route"],
+)
+N_PLUS_ONE = Counter(
+    "http_request_suspected_n_plus_one_total",
+    "Requests that exceeded N_PLUS_ONE_THRESHOLD SQL statements",
+    ["route"],
+)
+POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a pooled connection",
+    ["engine"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out",
+    "Connections currently checked out",
+    ["engine"],
+    multiprocess_mode="livesum",
+)
+POOL_SIZE = Gauge(
+    "db_pool_size", "Configured pool size", ["engine"], multiprocess_mode="livesum"
+)
+POOL_OVERFLOW = Gauge(
+    "db_pool_overflow",
+    "Connections open beyond the pool size",
+    ["engine"],
+    multiprocess_mode="livesum",
+)
+UPSTREAM_LATENCY = Histogram(
+    "upstream_request_duration_seconds",
+    "Latency of calls to upstream services",
+    ["upstream", "outcome"],
+)
+RESPONSE_CACHE_LOOKUPS = Counter(
+    "response_cache_lookups_total", "Response cache lookups", ["result"]
+)
+RESPONSE_CACHE_EVICTIONS = Counter(
+    "response_cache_evictions_total", "Response cache entries evicted for space"
+)
+RESPONSE_CACHE_BYTES = Gauge(
+    "response_cache_bytes", "Response cache memory in use", multiprocess_mode="liveall"
+)
+RESPONSE_CACHE_ENTRIES = Gauge(
+    "response_cache_entries", "Responses currently cached", multiprocess_mode="liveall"
+)
+EVENT_SUBSCRIBERS = Gauge(
+    "event_subscribers", "Open live update streams", multiprocess_mode="livesum"
+)
+EVENTS_DELIVERED = Counter(
+    "events_delivered_total", "Live update events queued to subscribers"
+)
+EVENT_EVICTIONS = Counter(
+    "event_evictions_total", "Live update subscribers evicted for falling behind"
+)
+
+
+class RequestStats:
+    __slots__ = ("statements", "db_time")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_time = 0.0
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar(
+    "request_stats", default=None
+)
+
+
+# Start times are kept on the execution context rather than the connection,
+# so a statement that fails (and never reaches after_cursor_execute) leaves
+# nothing behind to be paired with a later one
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_metrics_started", None)
+    stats = _request_stats.get()
+    if stats is not None and started is not None:
+        stats.statements += 1
+        stats.db_time += time.perf_counter() - started
+
+
+def _pool_stat(pool, name: str):
+    # Not every pool class (e.g. SQLite's SingletonThreadPool) keeps counters
+    method = getattr(pool, name, None)
+    return method() if callable(method) else 0
+
+
+_tracked = []
+
+
+def track(gauge, function):
+    """
+    Have gauge report function(). In multiprocess mode a scrape can't call
+    the other workers' functions, so call update_tracked() after changing
+    what they read.
+    """
+    if MULTIPROCESS:
+        _tracked.append((gauge, function))
+        gauge.set(function())
+    else:
+        gauge.set_function(function)
+
+
+def update_tracked():
+    for gauge, function in _tracked:
+        gauge.set(function())
+
+
+def instrument_engine(engine, name: str):
+    """
+    Count statements and DB time per request on a (sync) engine, and track
+    its pool's checkout wait and saturation. For an AsyncEngine pass
+    async_engine.sync_engine.
+    """
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+    pool = engine.pool
+    do_get = pool._do_get
+    do_return_conn = pool._do_return_conn
+
+    # Set on every checkout and return, so the values are current in the
+    # multiprocess files too
+    def update_saturation():
+        POOL_CHECKED_OUT.labels(name).set(_pool_stat(pool, "checkedout"))
+        POOL_OVERFLOW.labels(name).set(max(_pool_stat(pool, "overflow"), 0))
+
+    def timed_do_get():
+        started = time.perf_counter()
+        try:
+            return do_get()
+        finally:
+            POOL_CHECKOUT_WAIT.labels(name).observe(time.perf_counter() - started)
+            update_saturation()
+
+    def counted_do_return_conn(record):
+        try:
+            do_return_conn(record)
+        finally:
+            update_saturation()
+
+    pool._do_get = timed_do_get
+    pool._do_return_conn = counted_do_return_conn
+
+    POOL_SIZE.labels(name).set(_pool_stat(pool, "size"))
+    update_saturation()
+
+
+def observe_upstream(upstream: str, outcome: str, seconds: float):
+    UPSTREAM_LATENCY.labels(upstream, outcome).observe(seconds)
+
+
+def _route_name(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware so the stats contextvar it sets is visible to the
+    endpoint, its dependencies and the threadpool they run in.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_stats.reset(token)
+            route = _route_name(scope)
+            REQUEST_LATENCY.labels(scope["method"], route, status["code"]).observe(elapsed)
+            REQUEST_STATEMENTS.labels(route).observe(stats.statements)
+            REQUEST_DB_TIME.labels(route).observe(stats.db_time)
+            if stats.statements > N_PLUS_ONE_THRESHOLD:
+                N_PLUS_ONE.labels(route).inc()
+                logger.warning(
+                    "Suspected N+1 on %s %s: %d SQL statements in %.1f ms",
+                    scope["method"],
+                    route,
+                    stats.statements,
+                    stats.db_time * 1000,
+                )
+
+
+def render_metrics():
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def shutdown():
+    """
+    Drop this worker's live gauges from the multiprocess files.
+    """
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
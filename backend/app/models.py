@@ -8,6 +8,7 @@ from sqlalchemy import (
     Float,
     JSON,
     Table,
+    Index,
 )
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
@@ -15,6 +16,8 @@ import os
 from sqlalchemy.sql import func
 from sqlalchemy import DateTime
 
+from app.database import startup_lock
+
 try:
     DATABASE_URL = os.getenv("DATABASE_URL")
     if not DATABASE_URL:
@@ -47,11 +50,16 @@ post_tag_table = Table(
     Column(
         "tag_id", Integer, ForeignKey("tags.id", ondelete="CASCADE"), primary_key=True
     ),
+    # The primary key serves lookups by post; this one serves a tag's posts
+    Index("ix_post_tag_tag_id_post_id", "tag_id", "post_id"),
 )
 
 
 class PostInterest(Base):
     __tablename__ = "post_interests"
+    __table_args__ = (
+        Index("uq_post_interests_post_id_user_id", "post_id", "user_id", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     post_id = Column(Integer, ForeignKey("posts.id"), nullable=False)
@@ -64,22 +72,49 @@ class PostInterest(Base):
 
 class Tag(Base):
     __tablename__ = "tags"
+    __table_args__ = (Index("ix_tags_post_count_id", "post_count", "id"),)
 
     id = Column(Integer, primary_key=True, index=True)
-    label = Column(String, nullable=False)
+    label = Column(String, nullable=False, unique=True, index=True)
     wikidata_url = Column(String, nullable=True)
     description = Column(String, nullable=True)
+    # Denormalized from post_tag, maintained by app.tags.update_tag_stats
+    post_count = Column(Integer, default=0, server_default="0", nullable=False)
 
     # Relationship with posts
     posts = relationship("Post", secondary=post_tag_table, back_populates="tags")
 
 
+class TagCooccurrence(Base):
+    """
+    Number of posts that have both tags, stored in both directions.
+    Denormalized from post_tag, maintained by app.tags.update_tag_stats.
+    """
+
+    __tablename__ = "tag_cooccurrence"
+    __table_args__ = (
+        Index("ix_tag_cooccurrence_tag_id_post_count", "tag_id", "post_count", "other_id"),
+    )
+
+    tag_id = Column(
+        Integer, ForeignKey("tags.id", ondelete="CASCADE"), primary_key=True
+    )
+    other_id = Column(
+        Integer, ForeignKey("tags.id", ondelete="CASCADE"), primary_key=True
+    )
+    post_count = Column(Integer, default=0, server_default="0", nullable=False)
+
+
 class Post(Base):
     __tablename__ = "posts"
     __allow_unmapped__ = True
+    __table_args__ = (Index("ix_posts_hot_score_id", "hot_score", "id"),)
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True, nullable=False)
     image_url = Column(String, nullable=True)
+    # Resized WebP variants of image_url, filled in once generated
+    thumbnail_url = Column(String, nullable=True)
+    preview_url = Column(String, nullable=True)
     description = Column(String, nullable=False)
     material = Column(String, nullable=True)
     length = Column(Float, nullable=True)
@@ -92,6 +127,13 @@ class Post(Base):
     smell = Column(String, nullable=True)
     taste = Column(String, nullable=True)
     origin = Column(String, nullable=True)
+    created_at = Column(DateTime, default=func.now(), nullable=False)
+    # Denormalized from post_interests, maintained by app.votes
+    interest_count = Column(Integer, default=0, server_default="0", nullable=False)
+    # Denormalized from comments, maintained by create_comment
+    comment_count = Column(Integer, default=0, server_default="0", nullable=False)
+    # Time-decayed ranking for /posts/hot, see app.ranking.hot_score
+    hot_score = Column(Float, default=0.0, server_default="0", nullable=False)
     tags = relationship("Tag", secondary=post_tag_table, back_populates="posts")
     interests = relationship(
         "PostInterest", back_populates="post", cascade="all, delete-orphan"
@@ -105,19 +147,24 @@ class Post(Base):
         "Comment", back_populates="post", cascade="all, delete-orphan"
     )
 
-    @property
-    def interest_count(self):
-        return len(self.interests)
-
 
 class Comment(Base):
     __tablename__ = "comments"
+    # A post's thread, newest first or by score; see app.comments
+    __table_args__ = (
+        Index("ix_comments_post_id_created_at_id", "post_id", "created_at", "id"),
+        Index("ix_comments_post_id_score_id", "post_id", "score", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     post_id = Column(Integer, ForeignKey("posts.id"), nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     content = Column(String, nullable=False)
     created_at = Column(DateTime, default=func.now())
+    # Denormalized from comment_votes, maintained by app.votes
+    upvotes = Column(Integer, default=0, server_default="0", nullable=False)
+    downvotes = Column(Integer, default=0, server_default="0", nullable=False)
+    score = Column(Integer, default=0, server_default="0", nullable=False)
 
     post = relationship("Post", back_populates="comments")
     user = relationship("User")
@@ -128,6 +175,9 @@ class Comment(Base):
 
 class CommentVote(Base):
     __tablename__ = "comment_votes"
+    __table_args__ = (
+        Index("uq_comment_votes_comment_id_user_id", "comment_id", "user_id", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     comment_id = Column(Integer, ForeignKey("comments.id"), nullable=False)
@@ -138,4 +188,5 @@ class CommentVote(Base):
     user = relationship("User")
 
 
-Base.metadata.create_all(bind=engine)
+with startup_lock(engine):
+    Base.metadata.create_all(bind=engine)
@@ -0,0 +1,216 @@
+"""
+Content negotiation for the read endpoints.
+
+The representation is picked from the Accept header:
+
+- application/json (the default, and for */* or anything unknown)
+- application/msgpack: the same data in MessagePack
+- application/vnd.swe573.columnar+json: JSON in which every list of
+  objects is a table, {"columns": [...], "rows": [[...], ...]}, so a page
+  names each key once instead of once per row. A column holding lists of
+  objects itself (a post's tags) is named [name, [columns]], and its values
+  are lists of rows; other objects in rows are left as they are.
+
+and the content coding from Accept-Encoding: brotli, then gzip, for bodies
+of at least RESPONSE_COMPRESS_MIN_BYTES; smaller ones gain too little to be
+worth the CPU. Most bodies are compressed once and cached (see
+app.response_cache), but search pages are compressed on every request, so
+the default levels stop where the returns drop: a level higher saves
+another 1-3% of the bytes for up to half again the CPU, and brotli 11 is a
+hundred times slower (python -m benchmarks.formats).
+"""
+
+import gzip
+import os
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import brotli
+import msgpack
+from fastapi import Request, Response
+
+from app.serialization import dump_json
+
+COMPRESS_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESS_MIN_BYTES", 1024))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", 5))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", 5))
+
+JSON = "json"
+MSGPACK = "msgpack"
+COLUMNAR = "columnar"
+
+MEDIA_TYPES = {
+    JSON: "application/json",
+    MSGPACK: "application/msgpack",
+    COLUMNAR: "application/vnd.swe573.columnar+json",
+}
+_FORMATS_BY_TYPE = {
+    "application/json": JSON,
+    "application/msgpack": MSGPACK,
+    "application/x-msgpack": MSGPACK,
+    "application/vnd.msgpack": MSGPACK,
+    MEDIA_TYPES[COLUMNAR]: COLUMNAR,
+}
+
+IDENTITY = "identity"
+# Most preferred first
+CODINGS = ("br", "gzip")
+
+VARY = "Accept, Accept-Encoding"
+
+
+def _preferences(header: Optional[str]) -> List[Tuple[str, float]]:
+    """
+    (value, q) pairs of an Accept or Accept-Encoding header, in order.
+    """
+    preferences = []
+    for part in (header or "").split(","):
+        value, *params = (piece.strip() for piece in part.split(";"))
+        if not value:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, number = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(number)
+                except ValueError:
+                    q = 0.0
+        preferences.append((value.lower(), q))
+    return preferences
+
+
+def negotiate_format(accept: Optional[str]) -> str:
+    """
+    The representation the Accept header prefers most (the first listed of
+    equally preferred ones), JSON if it names none.
+    """
+    best, best_q = JSON, 0.0
+    for media_type, q in _preferences(accept):
+        format = _FORMATS_BY_TYPE.get(media_type)
+        if format is not None and q > best_q:
+            best, best_q = format, q
+    return best
+
+
+def negotiate_coding(accept_encoding: Optional[str]) -> str:
+    """
+    The first of CODINGS the Accept-Encoding header accepts, or identity.
+    """
+    accepted = {}
+    for coding, q in _preferences(accept_encoding):
+        accepted[coding] = q
+    for coding in CODINGS:
+        if accepted.get(coding, accepted.get("*", 0.0)) > 0:
+            return coding
+    return IDENTITY
+
+
+def negotiate(request: Request) -> Tuple[str, str]:
+    return (
+        negotiate_format(request.headers.get("accept")),
+        negotiate_coding(request.headers.get("accept-encoding")),
+    )
+
+
+def _is_records(value: Any) -> bool:
+    return isinstance(value, list) and bool(value) and isinstance(value[0], dict)
+
+
+def _schema(records: List[dict], schema: Optional[dict] = None) -> Dict[str, Optional[dict]]:
+    # Keys in order of appearance, each mapped to the schema of the records
+    # it holds, if it holds any
+    schema = {} if schema is None else schema
+    for record in records:
+        if record.keys() != schema.keys():
+            for key in record:
+                schema.setdefault(key, None)
+        # Inlined _is_records: this runs for every value of every record
+        for key in [
+            key
+            for key, value in record.items()
+            if type(value) is list and value and type(value[0]) is dict
+        ]:
+            schema[key] = _schema(record[key], schema[key] or {})
+    return schema
+
+
+def _columns(schema: Dict[str, Optional[dict]]) -> list:
+    return [key if nested is None else [key, _columns(nested)] for key, nested in schema.items()]
+
+
+def _table_rows(records: List[dict], schema: Dict[str, Optional[dict]]) -> list:
+    keys = list(schema)
+    nested = [(position, schema[key]) for position, key in enumerate(keys) if schema[key]]
+    rows = []
+    for record in records:
+        # Records built alike have their keys in the same order
+        row = list(record.values()) if list(record) == keys else [record.get(key) for key in keys]
+        for position, columns in nested:
+            if row[position]:
+                row[position] = _table_rows(row[position], columns)
+        rows.append(row)
+    return rows
+
+
+def to_columnar(value: Any) -> Any:
+    """
+    value with every list of objects turned into a table.
+    """
+    if _is_records(value):
+        schema = _schema(value)
+        return {"columns": _columns(schema), "rows": _table_rows(value, schema)}
+    if isinstance(value, dict):
+        return {key: to_columnar(item) for key, item in value.items()}
+    return value
+
+
+def _msgpack_default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Cannot encode {type(value).__name__} as MessagePack")
+
+
+def encode(payload: Any, format: str) -> bytes:
+    """
+    payload (plain data, as dump_json takes) in the given representation.
+    """
+    if format == MSGPACK:
+        return msgpack.packb(payload, default=_msgpack_default)
+    if format == COLUMNAR:
+        return dump_json(to_columnar(payload))
+    return dump_json(payload)
+
+
+def compress(body: bytes, coding: str) -> bytes:
+    if coding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if coding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    return body
+
+
+def compressible(body: bytes) -> bool:
+    return len(body) >= COMPRESS_MIN_BYTES
+
+
+def headers_for(coding: str) -> dict:
+    headers = {"Vary": VARY}
+    if coding != IDENTITY:
+        headers["Content-Encoding"] = coding
+    return headers
+
+
+def negotiated_response(request: Request, payload: Any) -> Response:
+    """
+    Uncached response encoding a trusted payload as the client prefers.
+    """
+    format, coding = negotiate(request)
+    body = encode(payload, format)
+    if not compressible(body):
+        coding = IDENTITY
+    return Response(
+        content=compress(body, coding),
+        media_type=MEDIA_TYPES[format],
+        headers=headers_for(coding),
+    )
@@ -0,0 +1,72 @@
+import base64
+import json
+from typing import Any, List, Optional, Sequence
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+
+
+# Cursors are opaque to clients: the keyset values of the last row of a page,
+# JSON encoded and base64url'd so they survive being put in a query string.
+def encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps(list(values), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str], size: int) -> Optional[List[Any]]:
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def keyset_filter(columns, values, descending: bool = False):
+    """
+    Build the "rows after (values)" predicate for a keyset ordered by columns.
+
+    Expanded into OR/AND form instead of a row-value comparison so it works
+    the same on PostgreSQL and SQLite.
+    """
+    clauses = []
+    for i, column in enumerate(columns):
+        equal = [columns[j] == values[j] for j in range(i)]
+        after = column < values[i] if descending else column > values[i]
+        clauses.append(and_(*equal, after))
+    return or_(*clauses)
+
+
+def keyset_order(columns, descending: bool = False):
+    return [column.desc() if descending else column.asc() for column in columns]
+
+
+async def paginate(
+    db, statement, columns, cursor, limit, cursor_values, descending=False, parse_cursor=None
+):
+    """
+    Run a select() with keyset pagination on an AsyncSession. cursor_values
+    maps the last row of the page to the JSON-encodable values of columns,
+    and parse_cursor (if given) maps them back, e.g. ISO strings to
+    datetimes; returns (rows, next_cursor).
+    """
+    after = decode_cursor(cursor, len(columns))
+    if after is not None and parse_cursor is not None:
+        try:
+            after = parse_cursor(after)
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    if after is not None:
+        statement = statement.where(keyset_filter(columns, after, descending))
+    statement = statement.order_by(*keyset_order(columns, descending)).limit(limit + 1)
+    rows = (await db.execute(statement)).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(cursor_values(rows[-1]))
+    return rows, next_cursor
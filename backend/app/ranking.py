@@ -0,0 +1,24 @@
+import math
+from datetime import datetime
+
+# Reference point for the time component of the hot score. Any fixed date
+# works; it only keeps the numbers small.
+HOT_EPOCH = datetime(2024, 1, 1)
+
+# A post created this many seconds later needs 10x the interest to rank
+# equally with an older one.
+HOT_DECAY_SECONDS = 45000
+
+
+def hot_score(interest_count: int, created_at: datetime) -> float:
+    """
+    Time-decayed hotness of a post.
+
+    The decay is expressed as a bonus for newer posts rather than a penalty
+    that grows with age, so a post's score only changes when its interest
+    count does and can be kept in an indexed column.
+    """
+    # + 1 so that the first interest counts as much as the step from 1 to 2
+    order = math.log10(interest_count + 1)
+    seconds = (created_at - HOT_EPOCH).total_seconds()
+    return round(order + seconds / HOT_DECAY_SECONDS, 7)
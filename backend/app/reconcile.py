@@ -0,0 +1,141 @@
+"""
+Repair drift in the denormalized counters by recomputing them from the
+rows they summarize. Safe to run while the app is serving traffic; meant to
+be scheduled (e.g. from cron) with:
+
+    python -m app.reconcile
+"""
+
+from sqlalchemy import and_, delete, func, insert, or_, select, update
+from sqlalchemy.orm import Session, aliased
+
+from app.database import SessionLocal
+from app.models import (
+    Comment,
+    CommentVote,
+    Post,
+    PostInterest,
+    Tag,
+    TagCooccurrence,
+    post_tag_table,
+)
+from app.ranking import hot_score
+
+
+def reconcile_comment_votes(db: Session) -> int:
+    """
+    Recompute upvotes/downvotes/score on every comment whose counters don't
+    match comment_votes. Returns the number of comments repaired.
+    """
+    upvotes = (
+        select(func.count(CommentVote.id))
+        .where(and_(CommentVote.comment_id == Comment.id, CommentVote.is_upvote))
+        .scalar_subquery()
+    )
+    downvotes = (
+        select(func.count(CommentVote.id))
+        .where(and_(CommentVote.comment_id == Comment.id, ~CommentVote.is_upvote))
+        .scalar_subquery()
+    )
+    result = db.execute(
+        update(Comment)
+        .where(or_(Comment.upvotes != upvotes, Comment.downvotes != downvotes))
+        .values(upvotes=upvotes, downvotes=downvotes, score=upvotes - downvotes)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+def reconcile_interest_counts(db: Session, rescore: bool = False) -> int:
+    """
+    Recompute interest_count (and with it hot_score) on every post whose
+    counter doesn't match post_interests, or on every post with rescore.
+    Returns the number of posts repaired.
+    """
+    actual = (
+        select(func.count(PostInterest.id))
+        .where(PostInterest.post_id == Post.id)
+        .scalar_subquery()
+    )
+    query = select(Post.id, Post.created_at, actual.label("actual"))
+    if not rescore:
+        query = query.where(Post.interest_count != actual)
+    drifted = db.execute(query).all()
+    for post_id, created_at, count in drifted:
+        db.execute(
+            update(Post)
+            .where(Post.id == post_id)
+            .values(interest_count=count, hot_score=hot_score(count, created_at))
+            .execution_options(synchronize_session=False)
+        )
+    return len(drifted)
+
+
+def reconcile_comment_counts(db: Session) -> int:
+    """
+    Recompute comment_count on every post whose counter doesn't match
+    comments. Returns the number of posts repaired.
+    """
+    actual = (
+        select(func.count(Comment.id))
+        .where(Comment.post_id == Post.id)
+        .scalar_subquery()
+    )
+    result = db.execute(
+        update(Post)
+        .where(Post.comment_count != actual)
+        .values(comment_count=actual)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+def reconcile_tag_stats(db: Session) -> int:
+    """
+    Recompute tags.post_count where it drifted from post_tag, and rebuild
+    tag_cooccurrence from post_tag. Returns the number of tags repaired.
+    """
+    actual = (
+        select(func.count())
+        .select_from(post_tag_table)
+        .where(post_tag_table.c.tag_id == Tag.id)
+        .scalar_subquery()
+    )
+    repaired = db.execute(
+        update(Tag)
+        .where(Tag.post_count != actual)
+        .values(post_count=actual)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+    this, other = aliased(post_tag_table), aliased(post_tag_table)
+    db.execute(delete(TagCooccurrence))
+    db.execute(
+        insert(TagCooccurrence).from_select(
+            ["tag_id", "other_id", "post_count"],
+            select(this.c.tag_id, other.c.tag_id, func.count())
+            .join(
+                other,
+                and_(other.c.post_id == this.c.post_id, other.c.tag_id != this.c.tag_id),
+            )
+            .group_by(this.c.tag_id, other.c.tag_id),
+        )
+    )
+    return repaired
+
+
+def main():
+    with SessionLocal() as db:
+        comments = reconcile_comment_votes(db)
+        posts = reconcile_interest_counts(db)
+        threads = reconcile_comment_counts(db)
+        tags = reconcile_tag_stats(db)
+        db.commit()
+    print(
+        f"Repaired {comments} comment scores, {posts} post interest counts, "
+        f"{threads} post comment counts and {tags} tag post counts"
+    )
+
+
+if __name__ == "__main__":
+    main()
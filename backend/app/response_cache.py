@@ -0,0 +1,287 @@
+"""
+Server-side cache of rendered read responses, with strong ETags.
+
+Entries are keyed by route and parameters and labelled with tags naming
+what they were built from, so writes can drop exactly the entries they
+affect:
+
+- LIST_PAGES: every page of GET /posts (any sort)
+- HOT_PAGES: every page of GET /posts/hot
+- post_tag(id): the detail page of one post
+- card_tag(id): every list page that shows the post
+
+Each representation and content coding of a response (see
+app.negotiation) is an entry of its own, all stored together when the
+response is built, so compressed bodies are compressed once.
+
+Where entries are kept depends on RESPONSE_CACHE_URL, see
+app.cache_backends: in this process (the default), in a file shared by the
+workers of one host, or in Redis. With the per-process store, invalidations
+are also broadcast to the other workers. Responses built within
+REPLICA_MAX_LAG of an invalidation are read from the primary rather than a
+read replica, which may not have the write yet. Writes made outside the server
+(the bulk import and reconcile CLIs) are only picked up after
+RESPONSE_CACHE_TTL. The file and Redis stores block on I/O, so async code
+uses the a-prefixed methods, which call them from the threadpool.
+"""
+
+import hashlib
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+from fastapi import Request, Response
+from starlette.concurrency import run_in_threadpool
+
+from app import events, metrics
+from app.database import REPLICA_MAX_LAG, primary_reads
+from app.cache_backends import CachedResponse, make_store
+from app.negotiation import (
+    CODINGS,
+    IDENTITY,
+    MEDIA_TYPES,
+    compress,
+    compressible,
+    encode,
+    headers_for,
+    negotiate,
+)
+
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 300))
+RESPONSE_CACHE_URL = os.getenv("RESPONSE_CACHE_URL", "memory://")
+
+LIST_PAGES = "posts"
+HOT_PAGES = "posts:hot"
+
+# Events channel of invalidations broadcast between workers, and the most
+# tags one may name (NOTIFY payloads are small) before it clears instead
+CACHE_CHANNEL = "cache"
+BROADCAST_MAX_TAGS = 300
+
+# Bookkeeping per entry (key, tags, tuple) on top of the body, roughly
+ENTRY_OVERHEAD = 512
+
+
+def post_tag(post_id: int) -> str:
+    return f"post:{post_id}"
+
+
+def card_tag(post_id: int) -> str:
+    return f"card:{post_id}"
+
+
+class ResponseCache:
+    """
+    Rendered bodies by key, with tag-based invalidation, kept in a store
+    from app.cache_backends.
+    """
+
+    def __init__(self, store, ttl: float):
+        self.store = store
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._seen_version = None
+        self._version_seen_at = float("-inf")
+
+    @property
+    def version(self) -> Optional[int]:
+        """
+        Bumped by every invalidation. Read it before building a response and
+        pass it to set_many(), so a response built from data that a concurrent
+        write has since replaced is not stored.
+        """
+        return self.store.version
+
+    def recently_invalidated(self, version: Optional[int]) -> bool:
+        """
+        Whether this worker saw the version change (or can't read it) within
+        REPLICA_MAX_LAG: read replicas may not have the write behind it yet.
+        """
+        now = time.monotonic()
+        if version is None:
+            return True
+        if version != self._seen_version:
+            self._seen_version = version
+            self._version_seen_at = now
+        return now - self._version_seen_at < REPLICA_MAX_LAG
+
+    @property
+    def size(self) -> float:
+        return self.store.size
+
+    @property
+    def entries(self) -> float:
+        return self.store.entries
+
+    @property
+    def evictions(self) -> int:
+        return self.store.evictions
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        entry = self.store.get(key)
+        if entry is None:
+            self.misses += 1
+            metrics.RESPONSE_CACHE_LOOKUPS.labels("miss").inc()
+            return None
+        self.hits += 1
+        metrics.RESPONSE_CACHE_LOOKUPS.labels("hit").inc()
+        return entry
+
+    def set_many(
+        self,
+        bodies: Dict[Hashable, Tuple[bytes, str]],
+        tags: Iterable[str],
+        version: Optional[int],
+    ) -> Dict[Hashable, CachedResponse]:
+        """
+        Store each (body, coding) under its key, in one write (unless
+        something was invalidated since version was read), and return the
+        entries with their ETags.
+        """
+        tags = frozenset(tags)
+        expires_at = time.time() + self.ttl
+        entries = {
+            key: CachedResponse(
+                body=body,
+                etag=make_etag(body, coding),
+                tags=tags,
+                expires_at=expires_at,
+                size=len(body) + ENTRY_OVERHEAD,
+            )
+            for key, (body, coding) in bodies.items()
+        }
+        evicted = self.store.set_many(
+            {key: entry for key, entry in entries.items() if entry.size <= self.store.max_bytes},
+            version,
+        )
+        if evicted:
+            metrics.RESPONSE_CACHE_EVICTIONS.inc(evicted)
+        metrics.update_tracked()
+        return entries
+
+    def invalidate(self, *tags: str):
+        self.store.invalidate(tags)
+        metrics.update_tracked()
+        if not self.store.shared:
+            event = (
+                {"type": "cache.invalidate", "tags": tags}
+                if len(tags) <= BROADCAST_MAX_TAGS
+                else {"type": "cache.clear"}
+            )
+            events.broadcast(event, CACHE_CHANNEL)
+
+    def clear(self):
+        self.store.clear()
+        metrics.update_tracked()
+        if not self.store.shared:
+            events.broadcast({"type": "cache.clear"}, CACHE_CHANNEL)
+
+    async def _call(self, function: Callable, *args):
+        if self.store.shared:
+            return await run_in_threadpool(function, *args)
+        # The in-process store only takes a lock
+        return function(*args)
+
+    async def aversion(self) -> Optional[int]:
+        return await self._call(lambda: self.version)
+
+    async def aget(self, key: Hashable) -> Optional[CachedResponse]:
+        return await self._call(self.get, key)
+
+    async def aset_many(
+        self,
+        bodies: Dict[Hashable, Tuple[bytes, str]],
+        tags: Iterable[str],
+        version: Optional[int],
+    ) -> Dict[Hashable, CachedResponse]:
+        return await self._call(self.set_many, bodies, tags, version)
+
+    async def ainvalidate(self, *tags: str):
+        await self._call(self.invalidate, *tags)
+
+    def apply(self, event: dict):
+        """
+        Apply an invalidation broadcast by another worker.
+        """
+        if event["type"] == "cache.invalidate":
+            self.store.invalidate(event["tags"])
+        elif event["type"] == "cache.clear":
+            self.store.clear()
+        metrics.update_tracked()
+
+
+def make_etag(body: bytes, coding: str = IDENTITY) -> str:
+    # The content coding of a body is recorded in its ETag, as in "...-br"
+    suffix = "" if coding == IDENTITY else "-" + coding
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + suffix + '"'
+
+
+def etag_coding(etag: str) -> str:
+    _, dash, coding = etag.strip('"').rpartition("-")
+    return coding if dash else IDENTITY
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison
+    candidates = (value.strip() for value in header.split(","))
+    return etag in (value[2:] if value.startswith("W/") else value for value in candidates)
+
+
+response_cache = ResponseCache(
+    make_store(RESPONSE_CACHE_URL, RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_TTL),
+    RESPONSE_CACHE_TTL,
+)
+events.broker.listen(CACHE_CHANNEL, response_cache.apply)
+metrics.track(metrics.RESPONSE_CACHE_BYTES, lambda: response_cache.size)
+metrics.track(metrics.RESPONSE_CACHE_ENTRIES, lambda: response_cache.entries)
+
+
+async def cached_json(
+    request: Request,
+    key: Hashable,
+    build: Callable[[], Awaitable[Tuple[Any, Iterable[str]]]],
+    prepare: Optional[Callable[[Any], Any]] = None,
+) -> Response:
+    """
+    Serve key from the cache, or await build() for (payload, tags), encode
+    the payload and cache it. Payloads are encoded as they are, so they
+    must be trusted plain data (see app.serialization) unless prepare turns
+    them into some. The representation and compression are negotiated with
+    the client (see app.negotiation). Answers 304 when the client's
+    If-None-Match already has the current body.
+    """
+    format, coding = negotiate(request)
+    entry = await response_cache.aget((key, format, coding))
+    if entry is None:
+        version = await response_cache.aversion()
+        if response_cache.recently_invalidated(version):
+            # Don't cache what a lagging replica still has
+            with primary_reads():
+                payload, tags = await build()
+        else:
+            payload, tags = await build()
+        if prepare is not None:
+            payload = prepare(payload)
+        body = encode(payload, format)
+        # Store every coding now, while the tags are at hand; bodies too
+        # small to compress are stored as they are
+        bodies = {(key, format, IDENTITY): (body, IDENTITY)}
+        for other in CODINGS:
+            bodies[(key, format, other)] = (
+                (compress(body, other), other) if compressible(body) else (body, IDENTITY)
+            )
+        entries = await response_cache.aset_many(bodies, tags, version)
+        entry = entries[(key, format, coding)]
+
+    headers = {"ETag": entry.etag, "Cache-Control": "private, no-cache", **headers_for(IDENTITY)}
+    if etag_matches(request, entry.etag):
+        return Response(status_code=304, headers=headers)
+    headers.update(headers_for(etag_coding(entry.etag)))
+    return Response(content=entry.body, media_type=MEDIA_TYPES[format], headers=headers)
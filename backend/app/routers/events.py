@@ -0,0 +1,57 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.database import get_db
+from app.events import FEED, broker, post_channel, stream
+from app.models import Post as PostModel
+
+router = APIRouter()
+
+STREAM_HEADERS = {
+    "Cache-Control": "no-cache",
+    # Tell nginx-style proxies not to buffer the stream
+    "X-Accel-Buffering": "no",
+}
+
+
+def event_stream(*channels: str) -> StreamingResponse:
+    subscription = broker.subscribe(*channels)
+    if subscription is None:
+        raise HTTPException(status_code=503, detail="Too many live update streams")
+    return StreamingResponse(
+        stream(subscription), media_type="text/event-stream", headers=STREAM_HEADERS
+    )
+
+
+# Streams outlive the request's dependencies, so they give back the session
+# (shared with get_current_user) before streaming rather than holding a
+# pooled connection for as long as the client stays subscribed.
+
+
+@router.get("/events")
+async def get_feed_events(db: Session = Depends(get_db)):
+    """
+    Server-Sent Events for new posts and interest count changes.
+    """
+    await run_in_threadpool(db.close)
+    return event_stream(FEED)
+
+
+@router.get("/posts/{post_id}/events")
+async def get_post_events(post_id: int, db: Session = Depends(get_db)):
+    """
+    Server-Sent Events for one post: new comments, comment score changes
+    and interest count changes.
+    """
+
+    def find_post():
+        try:
+            return db.query(PostModel.id).filter(PostModel.id == post_id).first()
+        finally:
+            db.close()
+
+    if await run_in_threadpool(find_post) is None:
+        raise HTTPException(status_code=404, detail="Post not found")
+    return event_stream(post_channel(post_id))
@@ -1,65 +1,86 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from sqlalchemy import desc, func, or_
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    UploadFile,
+    File,
+    Form,
+    Query,
+    Request,
+)
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session, selectinload, joinedload
-from app.database import get_db
+from app.database import get_async_db, get_db
 from app.utils import get_current_user
 from app.schemas import (
-    PostCreate,
-    Post,
-    PostWithComments,
     CommentCreate,
     CommentVoteCreate,
     CommentWithScore,
+    CommentPage,
     PostWithTags,
     PostWithDetails,
+    PostPage,
+    PostFacets,
+    SimilarPost,
+    ImportResult,
 )
 from app.models import Post as PostModel
 from app.models import Comment as CommentModel
-from app.models import User, CommentVote, Tag, PostInterest
-from typing import List, Optional
-import uuid
-import os
-import requests
-import logging
-
-logging.basicConfig(level=logging.INFO)
+from app.models import User, Tag, post_tag_table
+from app.ranking import hot_score
+from app.comments import DETAIL_COMMENTS, DETAIL_COMMENTS_SORT, comment_page
+from app.descriptors import normalize_descriptor, parse_measure
+from app.events import FEED, post_channel, publish
+from app.facets import Filters, apply_filters, facet_counts, post_filters
+from app.fieldsets import (
+    FULL_FIELDS,
+    POST_COLUMN_FIELDS,
+    Fields,
+    PostCardPage,
+    post_fields,
+)
+from app.pagination import paginate
+from app.response_cache import (
+    HOT_PAGES,
+    LIST_PAGES,
+    cached_json,
+    card_tag,
+    post_tag,
+    response_cache,
+)
+from app.search import index_post, search_post_ids
+from app.negotiation import negotiated_response
+from app.serialization import model_data
+from app.similarity import similarity_index
+from app.tags import link_tags, resolve_tags
+from app.votes import cast_vote, toggle_interest
+from app.bulk_import import (
+    IMPORT_IMAGE_ROOT,
+    detect_format,
+    import_posts,
+    iter_records,
+)
+from app.images import save_upload, static_url, schedule_variants
+from typing import List, Optional, Union
+from datetime import datetime
+import io
 
 router = APIRouter()
 
 
-# @router.get("/tags/search", response_model=List[dict])
-# def search_tags(query: str, db: Session = Depends(get_db)):
-#     # Fetch results from Wikidata
-#     response = requests.get(
-#         "https://www.wikidata.org/w/api.php",
-#         params={
-#             "action": "wbsearchentities",
-#             "language": "en",
-#             "format": "json",
-#             "search": query,
-#         },
-#     )
-#     if response.status_code != 200:
-#         raise HTTPException(status_code=500, detail="Error fetching tags from Wikidata")
-
-#     data = response.json()
-#     return [
-#         {"label": item["label"], "description": item.get("description", "")}
-#         for item in data.get("search", [])
-#     ]
-
-
 @router.post("/posts", response_model=PostWithTags)
 async def create_post(
     title: str = Form(...),
     description: Optional[str] = Form(None),
     material: Optional[str] = Form(None),
-    length: Optional[float] = Form(None),
-    width: Optional[float] = Form(None),
-    height: Optional[float] = Form(None),
+    # Measurements take an optional unit, e.g. "5 mm" or "50 g"
+    length: Optional[str] = Form(None),
+    width: Optional[str] = Form(None),
+    height: Optional[str] = Form(None),
     color: Optional[str] = Form(None),
     shape: Optional[str] = Form(None),
-    weight: Optional[float] = Form(None),
+    weight: Optional[str] = Form(None),
     location: Optional[str] = Form(None),
     smell: Optional[str] = Form(None),
     taste: Optional[str] = Form(None),
@@ -72,70 +93,69 @@ async def create_post(
     """
     Endpoint to create a post with all fields, including tags and image upload.
     """
+    try:
+        measures = {
+            column: parse_measure(column, value)
+            for column, value in (
+                ("length", length),
+                ("width", width),
+                ("height", height),
+                ("weight", weight),
+            )
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
     # Handle image upload
-    image_url = None
+    file_path = None
     if image:
-        os.makedirs("static/images", exist_ok=True)
-        unique_name = f"{uuid.uuid4()}_{image.filename}"
-        file_path = os.path.join("static", "images", unique_name)
-
-        with open(file_path, "wb") as f:
-            f.write(await image.read())
-        image_url = f"/static/images/{unique_name}"
+        file_path = await save_upload(image)
 
     # Create the post with all fields
+    created_at = datetime.utcnow()
     db_post = PostModel(
         title=title,
         description=description,
-        material=material,
-        length=length,
-        width=width,
-        height=height,
-        color=color,
-        shape=shape,
-        weight=weight,
-        location=location,
+        material=normalize_descriptor("material", material),
+        length=measures["length"],
+        width=measures["width"],
+        height=measures["height"],
+        color=normalize_descriptor("color", color),
+        shape=normalize_descriptor("shape", shape),
+        weight=measures["weight"],
+        location=normalize_descriptor("location", location),
         smell=smell,
         taste=taste,
-        origin=origin,
-        image_url=image_url,
+        origin=normalize_descriptor("origin", origin),
+        image_url=static_url(file_path) if file_path else None,
         owner_id=current_user.id,
+        created_at=created_at,
+        hot_score=hot_score(0, created_at),
     )
 
-    # Handle tags (if provided)
-    if tags:
-        for tag_info in tags:
-            if isinstance(tag_info, dict):
-                label = tag_info.get("label")
-                wikidata_url = tag_info.get("wikidata_url")
-                description = tag_info.get("description")
-            else:  # Treat it as a string if not a dictionary
-                label = tag_info
-                wikidata_url = "https://www.wikidata.org"  # Default URL
-                description = "No description available"
-
-            # Check if tag already exists
-            existing_tag = db.query(Tag).filter(Tag.label == label).first()
-
-            if not existing_tag:
-                # Create new tag if it doesn't exist
-                new_tag = Tag(
-                    label=label, wikidata_url=wikidata_url, description=description
-                )
-                db.add(new_tag)
-                db.commit()
-                db.refresh(new_tag)
-                tag_object = new_tag
-            else:
-                tag_object = existing_tag
-
-            # Associate tag with post
-            db_post.tags.append(tag_object)
-
-    # Save post to database
+    # Save post, tags and search document in one transaction
     db.add(db_post)
+    db.flush()
+    post_tags = resolve_tags(db, tags or [])
+    link_tags(db, db_post.id, post_tags)
+    index_post(db, db_post, [tag["label"] for tag in post_tags])
+    publish(
+        db,
+        {
+            "type": "post.created",
+            "post_id": db_post.id,
+            "title": db_post.title,
+            "creator": current_user.username,
+        },
+        FEED,
+    )
     db.commit()
     db.refresh(db_post)
+    await response_cache.ainvalidate(LIST_PAGES, HOT_PAGES)
+    similarity_index.add(db_post.id, db_post, [tag["id"] for tag in post_tags])
+
+    if file_path:
+        schedule_variants(db_post.id, file_path)
 
     # Return post with creator and all fields
     return {
@@ -154,189 +174,369 @@ async def create_post(
         "taste": db_post.taste,
         "origin": db_post.origin,
         "image_url": db_post.image_url,
+        "thumbnail_url": db_post.thumbnail_url,
+        "preview_url": db_post.preview_url,
         "creator": current_user.username,
         "interest_count": 0,
         "tags": [
             {
-                "label": tag.label,
-                "wikidata_url": tag.wikidata_url,
-                "description": tag.description,
+                "label": tag["label"],
+                "wikidata_url": tag["wikidata_url"],
+                "description": tag["description"],
             }
-            for tag in db_post.tags
+            for tag in post_tags
         ],
     }
 
 
-@router.get("/posts", response_model=List[PostWithTags])
-def get_posts(db: Session = Depends(get_db)):
-    posts = db.query(PostModel).options(joinedload(PostModel.owner)).all()
+@router.post("/posts/import", response_model=ImportResult)
+def import_posts_file(
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None, pattern="^(ndjson|csv)$"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Bulk create posts from an NDJSON or CSV upload (format defaults to the
+    file's extension / content type). Invalid records are reported by line
+    number and skipped; the rest are imported.
+    """
+    fmt = format or detect_format(file.filename, file.content_type)
+    stream = io.TextIOWrapper(file.file, encoding="utf-8", errors="replace", newline="")
+    try:
+        result = import_posts(
+            db, iter_records(stream, fmt), current_user.id, IMPORT_IMAGE_ROOT
+        )
+    finally:
+        stream.detach()
+    if result.imported:
+        response_cache.invalidate(LIST_PAGES, HOT_PAGES)
+    return result
+
+
+# Keyset sort keys accepted by GET /posts; every key is tie-broken on the id.
+POST_SORT_KEYS = {
+    "id": [PostModel.id],
+    "title": [PostModel.title, PostModel.id],
+}
 
-    # Serialize posts
-    serialized_posts = []
-    for post in posts:
-        serialized_posts.append(
+
+def post_rows_statement(*extra_columns, fields: Fields = FULL_FIELDS):
+    """
+    select() of post rows for the list endpoints to page over: the columns
+    behind fields, creator if asked for, and any extra_columns (what the
+    page is ordered by).
+    """
+    columns = [getattr(PostModel, field) for field in fields if field in POST_COLUMN_FIELDS]
+    if "creator" in fields:
+        columns.append(User.username.label("creator"))
+    # The sort keys may already be among the fields
+    columns.extend(column for column in extra_columns if column.key not in fields)
+    statement = select(*columns)
+    if "creator" in fields:
+        statement = statement.join(User, User.id == PostModel.owner_id)
+    return statement
+
+
+def tags_for_posts_statement(post_ids: List[int]):
+    return (
+        select(post_tag_table.c.post_id, Tag.label, Tag.wikidata_url, Tag.description)
+        .join(Tag, Tag.id == post_tag_table.c.tag_id)
+        .where(post_tag_table.c.post_id.in_(post_ids))
+        .order_by(post_tag_table.c.post_id, Tag.id)
+    )
+
+
+def group_tags(post_ids: List[int], rows) -> dict:
+    tags_by_post = {post_id: [] for post_id in post_ids}
+    for post_id, label, wikidata_url, description in rows:
+        tags_by_post[post_id].append(
             {
-                "id": post.id,
-                "title": post.title,
-                "description": post.description,
-                "image_url": post.image_url,
-                "material": post.material,
-                "length": post.length,
-                "width": post.width,
-                "height": post.height,
-                "color": post.color,
-                "shape": post.shape,
-                "weight": post.weight,
-                "location": post.location,
-                "smell": post.smell,
-                "taste": post.taste,
-                "origin": post.origin,
-                "resolved": False,  # Default to unresolved
-                "creator": post.owner.username,
-                "interest_count": len(post.interests),
-                "tags": [
-                    {
-                        "label": tag.label,
-                        "wikidata_url": tag.wikidata_url,
-                        "description": tag.description,
-                    }
-                    for tag in post.tags
-                ],
+                "label": label,
+                "wikidata_url": wikidata_url,
+                "description": description,
             }
         )
-    return serialized_posts
+    return tags_by_post
 
 
-@router.get("/posts/hot", response_model=List[PostWithTags])
-def get_hot_posts(db: Session = Depends(get_db)):
+async def load_tags_for_posts(db: AsyncSession, post_ids: List[int]) -> dict:
     """
-    Fetch posts ordered by interest count in descending order.
+    Fetch the tags of a whole page of posts in one query.
     """
-    # Subquery for interest count
-    interest_count_subquery = (
-        db.query(
-            PostInterest.post_id, func.count(PostInterest.id).label("interest_count")
-        )
-        .group_by(PostInterest.post_id)
-        .subquery()
-    )
+    if not post_ids:
+        return {}
+    rows = (await db.execute(tags_for_posts_statement(post_ids))).all()
+    return group_tags(post_ids, rows)
 
-    # Query posts with the interest count and the owner's username
-    posts = (
-        db.query(
-            PostModel,
-            User.username.label("creator"),
-            func.coalesce(interest_count_subquery.c.interest_count, 0).label(
-                "interest_count"
-            ),
-        )
-        .outerjoin(
-            interest_count_subquery, interest_count_subquery.c.post_id == PostModel.id
+
+def serialize_post(row, tags: Optional[list], fields: Fields = FULL_FIELDS) -> dict:
+    """
+    PostWithTags-shaped dict, narrowed to fields, for a row of
+    post_rows_statement(fields=fields); trusted, so it is encoded without
+    validation.
+    """
+    # The column fields lead every row, in order; zip is much cheaper than
+    # attribute access on Row
+    post = dict(zip((field for field in fields if field in POST_COLUMN_FIELDS), row))
+    if "resolved" in fields:
+        post["resolved"] = False  # Default to unresolved
+    if "creator" in fields:
+        post["creator"] = row.creator
+    if "tags" in fields:
+        post["tags"] = tags
+    return post
+
+
+def page_tags(items: list, *tags: str) -> list:
+    """
+    Cache tags for a list page: its own, plus one per post it shows.
+    """
+    return [*tags, *(card_tag(item["id"]) for item in items)]
+
+
+async def serialize_posts(db: AsyncSession, rows, fields: Fields = FULL_FIELDS) -> list:
+    """
+    Serialize post rows, batching the tag lookup (when tags are asked for)
+    so the number of queries does not depend on the number of rows.
+    """
+    if "tags" not in fields:
+        return [serialize_post(row, None, fields) for row in rows]
+    tags_by_post = await load_tags_for_posts(db, [row.id for row in rows])
+    return [serialize_post(row, tags_by_post[row.id], fields) for row in rows]
+
+
+@router.get("/posts", response_model=Union[PostPage, PostCardPage])
+async def get_posts(
+    request: Request,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    sort: str = Query("id", pattern="^-?(id|title)$"),
+    filters: Filters = Depends(post_filters),
+    fields: Fields = Depends(post_fields),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Fetch a page of posts ordered by `sort` (prefix with "-" for descending).
+    Pass the returned `next_cursor` back as `cursor` to get the next page.
+    Narrow the posts by descriptor, e.g.
+    `?material=metal&shape=round&min_length=2&max_length=5&max_weight=50g`,
+    and the fields returned for each with e.g. `?fields=card` or
+    `?fields=id,title,tags`.
+    """
+    descending = sort.startswith("-")
+    columns = POST_SORT_KEYS[sort.lstrip("-")]
+
+    async def build():
+        rows, next_cursor = await paginate(
+            db,
+            apply_filters(post_rows_statement(*columns, fields=fields), filters),
+            columns,
+            cursor,
+            limit,
+            lambda row: [getattr(row, c.key) for c in columns],
+            descending,
         )
-        .outerjoin(User, User.id == PostModel.owner_id)
-        .order_by(desc("interest_count"))
-        .all()
-    )
+        items = await serialize_posts(db, rows, fields)
+        return {"items": items, "next_cursor": next_cursor}, page_tags(items, LIST_PAGES)
 
-    # Convert query results to the response model
-    result = []
-    for post, creator, interest_count in posts:
-        post_data = post.__dict__.copy()
-        post_data["creator"] = creator
-        post_data["interest_count"] = interest_count
+    return await cached_json(request, ("posts", sort, limit, cursor, filters, fields), build)
 
-        # Serialize tags
-        post_data["tags"] = [
-            {
-                "label": tag.label,
-                "wikidata_url": tag.wikidata_url,
-                "description": tag.description,
-            }
-            for tag in post.tags
-        ]
 
-        result.append(post_data)
+@router.get("/posts/facets", response_model=PostFacets)
+async def get_post_facets(
+    request: Request,
+    filters: Filters = Depends(post_filters),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Counts for the posts matching the same filters as GET /posts: the most
+    common values of each categorical descriptor and a histogram of each
+    measurement. A facet's counts ignore that facet's own filter, so they
+    show what selecting another value would match.
+    """
 
-    return result
+    async def build():
+        return await facet_counts(db, filters), [LIST_PAGES]
+
+    return await cached_json(request, ("posts:facets", filters), build)
 
 
-@router.get("/posts/search", response_model=List[PostWithTags])
-def search_posts(query: str, db: Session = Depends(get_db)):
+@router.get("/posts/hot", response_model=Union[PostPage, PostCardPage])
+async def get_hot_posts(
+    request: Request,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    fields: Fields = Depends(post_fields),
+    db: AsyncSession = Depends(get_async_db),
+):
     """
-    Search posts based on query string. Matches title and description.
+    Fetch posts ordered by their time-decayed hot score, highest first.
+    Reads straight off the (hot_score, id) index. `fields` narrows the
+    posts as on GET /posts.
     """
-    if not query:
-        return []
-
-    # Fetch posts and join with User table to get creator username
-    posts = (
-        db.query(PostModel, User.username.label("creator"))
-        .join(User, User.id == PostModel.owner_id)
-        .filter(
-            or_(
-                PostModel.title.ilike(f"%{query}%"),
-                PostModel.description.ilike(f"%{query}%"),
-            )
+
+    async def build():
+        rows, next_cursor = await paginate(
+            db,
+            post_rows_statement(PostModel.hot_score, fields=fields),
+            [PostModel.hot_score, PostModel.id],
+            cursor,
+            limit,
+            lambda row: [row.hot_score, row.id],
+            descending=True,
         )
-        .all()
+        items = await serialize_posts(db, rows, fields)
+        return {"items": items, "next_cursor": next_cursor}, page_tags(items, HOT_PAGES)
+
+    return await cached_json(request, ("posts:hot", limit, cursor, fields), build)
+
+
+@router.get("/posts/search", response_model=Union[PostPage, PostCardPage])
+async def search_posts(
+    request: Request,
+    query: str,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    fields: Fields = Depends(post_fields),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Full-text search over title, description, tag labels and the descriptor
+    columns, most relevant first. `fields` narrows the posts as on GET /posts.
+    """
+    post_ids, next_cursor = await search_post_ids(db, query, limit, cursor)
+    if not post_ids:
+        return negotiated_response(request, {"items": [], "next_cursor": None})
+
+    rows = (
+        await db.execute(
+            post_rows_statement(fields=fields).where(PostModel.id.in_(post_ids))
+        )
+    ).all()
+    # Restore relevance order
+    position = {post_id: i for i, post_id in enumerate(post_ids)}
+    rows.sort(key=lambda row: position[row.id])
+
+    return negotiated_response(
+        request, {"items": await serialize_posts(db, rows, fields), "next_cursor": next_cursor}
     )
 
-    # Serialize the results to match PostWithTags schema
-    result = []
-    for post, creator in posts:
-        post_data = post.__dict__.copy()
-        post_data["creator"] = creator
 
-        # Serialize tags
-        post_data["tags"] = [
-            {
-                "label": tag.label,
-                "wikidata_url": tag.wikidata_url,
-                "description": tag.description,
-            }
-            for tag in post.tags
-        ]
+@router.get("/posts/{post_id}/similar", response_model=List[SimilarPost])
+async def get_similar_posts(
+    request: Request,
+    post_id: int,
+    limit: int = Query(10, ge=1, le=50),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Posts most similar to this one by measurements, descriptors and tags,
+    most similar first.
+    """
+
+    async def build():
+        matches = similarity_index.similar(post_id, limit)
+        if matches is None:
+            # Created by another process since the index was loaded
+            post = (
+                await db.execute(
+                    select(PostModel).where(PostModel.id == post_id)
+                )
+            ).scalar_one_or_none()
+            if not post:
+                raise HTTPException(status_code=404, detail="Post not found")
+            tag_ids = (
+                await db.execute(
+                    select(post_tag_table.c.tag_id).where(
+                        post_tag_table.c.post_id == post_id
+                    )
+                )
+            ).scalars().all()
+            similarity_index.add(post_id, post, tag_ids)
+            matches = similarity_index.similar(post_id, limit) or []
+
+        scores = dict(matches)
+        rows = []
+        if scores:
+            rows = (
+                await db.execute(
+                    post_rows_statement().where(PostModel.id.in_(list(scores)))
+                )
+            ).all()
+            rows.sort(key=lambda row: -scores[row.id])
+        items = await serialize_posts(db, rows)
+        for item in items:
+            item["score"] = scores[item["id"]]
+        # Any new post may be more similar than the current ones
+        return items, page_tags(items, LIST_PAGES)
 
-        # Calculate interest count
-        interest_count = len(post.interests)
-        post_data["interest_count"] = interest_count
+    return await cached_json(request, ("post:similar", post_id, limit), build)
 
-        result.append(post_data)
 
-    return result
+prepare_post_details = model_data(PostWithDetails)
 
 
 @router.get("/posts/{post_id}", response_model=PostWithDetails)
-def get_post(post_id: int, db: Session = Depends(get_db)):
-    post = (
-        db.query(PostModel)
-        .options(
-            selectinload(PostModel.comments).selectinload(
-                CommentModel.user
-            ),  # Load comments with users
-            selectinload(PostModel.tags),  # Load tags
-        )
-        .filter(PostModel.id == post_id)
-        .first()
-    )
-    if not post:
-        raise HTTPException(status_code=404, detail="Post not found")
+async def get_post(
+    request: Request, post_id: int, db: AsyncSession = Depends(get_async_db)
+):
+    """
+    A post with its tags, its number of comments and their first page by
+    score; the rest of the thread is served by GET /posts/{id}/comments.
+    """
 
-    # Calculate scores for comments
-    for c in post.comments:
-        upvotes = (
-            db.query(CommentVote)
-            .filter(CommentVote.comment_id == c.id, CommentVote.is_upvote == True)
-            .count()
-        )
-        downvotes = (
-            db.query(CommentVote)
-            .filter(CommentVote.comment_id == c.id, CommentVote.is_upvote == False)
-            .count()
+    async def build():
+        post = (
+            await db.execute(
+                select(PostModel)
+                .options(
+                    selectinload(PostModel.tags),  # Load tags
+                    joinedload(PostModel.owner),
+                )
+                .where(PostModel.id == post_id)
+            )
+        ).scalar_one_or_none()
+        if not post:
+            raise HTTPException(status_code=404, detail="Post not found")
+
+        thread = await comment_page(db, post_id, DETAIL_COMMENTS_SORT, DETAIL_COMMENTS)
+        details = {column.key: getattr(post, column.key) for column in PostModel.__table__.columns}
+        details.update(
+            creator=post.owner.username,
+            tags=post.tags,
+            comments=thread["items"],
+            comments_next_cursor=thread["next_cursor"],
         )
-        c.score = upvotes - downvotes
-    post.creator = post.owner.username
-    return post
+        return details, [post_tag(post_id)]
+
+    return await cached_json(request, ("post", post_id), build, prepare_post_details)
+
+
+@router.get("/posts/{post_id}/comments", response_model=CommentPage)
+async def get_post_comments(
+    request: Request,
+    post_id: int,
+    sort: str = Query("top", pattern="^(new|top)$"),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    A page of a post's comments, newest first (sort=new) or highest score
+    first (sort=top). Pass the returned `next_cursor` back as `cursor` to
+    get the next page.
+    """
+
+    async def build():
+        page = await comment_page(db, post_id, sort, limit, cursor)
+        if not page["items"] and not await db.scalar(
+            select(PostModel.id).where(PostModel.id == post_id)
+        ):
+            raise HTTPException(status_code=404, detail="Post not found")
+        return page, [post_tag(post_id)]
+
+    return await cached_json(request, ("post:comments", post_id, sort, limit, cursor), build)
 
 
 @router.post("/posts/{post_id}/comments", response_model=CommentWithScore)
@@ -346,28 +546,47 @@ def create_comment(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    post = db.query(PostModel).filter(PostModel.id == post_id).first()
+    post = db.execute(
+        update(PostModel)
+        .where(PostModel.id == post_id)
+        .values(comment_count=PostModel.comment_count + 1)
+        .returning(PostModel.id, PostModel.comment_count)
+        .execution_options(synchronize_session=False)
+    ).first()
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
 
     db_comment = CommentModel(
-        post_id=post.id, user_id=current_user.id, content=comment.content
+        post_id=post.id,
+        user_id=current_user.id,
+        content=comment.content,
+        created_at=datetime.utcnow(),
     )
     db.add(db_comment)
-    db.commit()
-    db.refresh(db_comment)
-
-    return CommentWithScore(
-        id=db_comment.id,
-        post_id=db_comment.post_id,
-        user_id=db_comment.user_id,
-        content=db_comment.content,
-        score=0,
-        user={
-            "id": db_comment.user.id,
-            "username": db_comment.user.username,
-        },  # Include user info
+    db.flush()
+    created = {
+        "id": db_comment.id,
+        "post_id": db_comment.post_id,
+        "user_id": db_comment.user_id,
+        "content": db_comment.content,
+        "score": 0,
+        "created_at": db_comment.created_at,
+        "user": {"id": current_user.id, "username": current_user.username},
+    }
+    publish(
+        db,
+        {
+            "type": "comment.created",
+            "post_id": post.id,
+            "comment": created,
+            "comment_count": post.comment_count,
+        },
+        post_channel(post.id),
     )
+    db.commit()
+    response_cache.invalidate(post_tag(post.id))
+
+    return CommentWithScore(**created)
 
 
 @router.post("/comments/{comment_id}/vote", response_model=CommentWithScore)
@@ -377,83 +596,19 @@ def vote_on_comment(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    db_comment = db.query(CommentModel).filter(CommentModel.id == comment_id).first()
-    if not db_comment:
+    comment = cast_vote(db, comment_id, current_user.id, vote.is_upvote)
+    if comment is None:
         raise HTTPException(status_code=404, detail="Comment not found")
-
-    # Check existing votes
-    existing_vote = (
-        db.query(CommentVote)
-        .filter(
-            CommentVote.comment_id == comment_id, CommentVote.user_id == current_user.id
-        )
-        .first()
-    )
-
-    if existing_vote:
-        existing_vote.is_upvote = vote.is_upvote
-    else:
-        new_vote = CommentVote(
-            comment_id=comment_id, user_id=current_user.id, is_upvote=vote.is_upvote
-        )
-        db.add(new_vote)
-
-    db.commit()
-
-    # Calculate score
-    upvotes = (
-        db.query(CommentVote)
-        .filter(CommentVote.comment_id == comment_id, CommentVote.is_upvote == True)
-        .count()
-    )
-    downvotes = (
-        db.query(CommentVote)
-        .filter(CommentVote.comment_id == comment_id, CommentVote.is_upvote == False)
-        .count()
-    )
-    score = upvotes - downvotes
-
-    # Refresh to include user relationship
-    db.refresh(db_comment)
-
-    return CommentWithScore(
-        id=db_comment.id,
-        post_id=db_comment.post_id,
-        user_id=db_comment.user_id,
-        content=db_comment.content,
-        score=score,
-        user={
-            "id": db_comment.user.id,
-            "username": db_comment.user.username,
-        },  # Include user info
-    )
+    return CommentWithScore(**comment)
 
 
 @router.post("/posts/{post_id}/interested")
-def toggle_interest(
+def toggle_post_interest(
     post_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    post = db.query(PostModel).filter(PostModel.id == post_id).first()
-    if not post:
+    interest_count = toggle_interest(db, post_id, current_user.id)
+    if interest_count is None:
         raise HTTPException(status_code=404, detail="Post not found")
-
-    # Check if user has already shown interest
-    existing_interest = (
-        db.query(PostInterest)
-        .filter_by(post_id=post_id, user_id=current_user.id)
-        .first()
-    )
-
-    if existing_interest:
-        db.delete(existing_interest)  # Remove interest if already present
-    else:
-        new_interest = PostInterest(post_id=post_id, user_id=current_user.id)
-        db.add(new_interest)
-
-    db.commit()
-
-    # Return updated interest count
-    interest_count = db.query(PostInterest).filter_by(post_id=post_id).count()
     return {"interest_count": interest_count}
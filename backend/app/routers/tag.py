@@ -0,0 +1,139 @@
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import get_async_db
+from app.models import Post as PostModel
+from app.models import Tag, TagCooccurrence, post_tag_table
+from app.pagination import paginate
+from app.response_cache import LIST_PAGES, cached_json
+from app.routers.post import page_tags, post_rows_statement, serialize_posts
+from app.schemas import PostPage, RelatedTag, TagPage
+
+router = APIRouter()
+
+TAG_COLUMNS = (Tag.id, Tag.label, Tag.wikidata_url, Tag.description, Tag.post_count)
+
+
+def serialize_tag(row) -> dict:
+    return {
+        "id": row.id,
+        "label": row.label,
+        "wikidata_url": row.wikidata_url,
+        "description": row.description,
+        "post_count": row.post_count,
+    }
+
+
+async def ensure_tag(db: AsyncSession, tag_id: int):
+    if await db.get(Tag, tag_id) is None:
+        raise HTTPException(status_code=404, detail="Tag not found")
+
+
+@router.get("/tags/popular", response_model=TagPage)
+async def get_popular_tags(
+    request: Request,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Tags by the number of posts that have them, most used first. Reads the
+    maintained post_count off the (post_count, id) index.
+    """
+
+    async def build():
+        rows, next_cursor = await paginate(
+            db,
+            select(*TAG_COLUMNS).where(Tag.post_count > 0),
+            [Tag.post_count, Tag.id],
+            cursor,
+            limit,
+            lambda row: [row.post_count, row.id],
+            descending=True,
+        )
+        items = [serialize_tag(row) for row in rows]
+        return {"items": items, "next_cursor": next_cursor}, [LIST_PAGES]
+
+    return await cached_json(request, ("tags:popular", limit, cursor), build)
+
+
+@router.get("/tags/{tag_id}/posts", response_model=PostPage)
+async def get_tag_posts(
+    request: Request,
+    tag_id: int,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Posts with this tag, newest first, read off the post_tag (tag_id,
+    post_id) index.
+    """
+
+    async def build():
+        if cursor is None:
+            await ensure_tag(db, tag_id)
+        rows, next_cursor = await paginate(
+            db,
+            post_rows_statement()
+            .join(post_tag_table, post_tag_table.c.post_id == PostModel.id)
+            .where(post_tag_table.c.tag_id == tag_id),
+            [post_tag_table.c.post_id],
+            cursor,
+            limit,
+            lambda row: [row.id],
+            descending=True,
+        )
+        items = await serialize_posts(db, rows)
+        return {"items": items, "next_cursor": next_cursor}, page_tags(items, LIST_PAGES)
+
+    return await cached_json(request, ("tag:posts", tag_id, limit, cursor), build)
+
+
+@router.get("/tags/{tag_id}/related", response_model=List[RelatedTag])
+async def get_related_tags(
+    request: Request,
+    tag_id: int,
+    limit: int = Query(10, ge=1, le=50),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Tags that most often appear on the same posts as this one, from the
+    maintained co-occurrence counts.
+    """
+
+    async def build():
+        await ensure_tag(db, tag_id)
+        rows = (
+            await db.execute(
+                select(
+                    Tag.id,
+                    Tag.label,
+                    Tag.wikidata_url,
+                    Tag.description,
+                    TagCooccurrence.post_count.label("shared_posts"),
+                )
+                .join(Tag, Tag.id == TagCooccurrence.other_id)
+                .where(TagCooccurrence.tag_id == tag_id)
+                .order_by(
+                    TagCooccurrence.post_count.desc(), TagCooccurrence.other_id
+                )
+                .limit(limit)
+            )
+        ).all()
+        items = [
+            {
+                "id": row.id,
+                "label": row.label,
+                "wikidata_url": row.wikidata_url,
+                "description": row.description,
+                "shared_posts": row.shared_posts,
+            }
+            for row in rows
+        ]
+        return items, [LIST_PAGES]
+
+    return await cached_json(request, ("tag:related", tag_id, limit), build)
@@ -1,5 +1,7 @@
+from datetime import datetime
 from pydantic import BaseModel, field_validator
-from typing import Optional, List
+from typing import Dict, Optional, List
+from app.descriptors import normalize_descriptor, parse_measure
 
 
 class UserCreate(BaseModel):
@@ -27,6 +29,8 @@ class TagBase(BaseModel):
 class PostBase(BaseModel):
     title: str
     image_url: Optional[str] = None
+    thumbnail_url: Optional[str] = None
+    preview_url: Optional[str] = None
     description: Optional[str] = None
     material: Optional[str] = None
     length: Optional[float] = None
@@ -83,12 +87,18 @@ class CommentWithScore(CommentBase):
     post_id: int
     user_id: int
     score: int
+    created_at: Optional[datetime] = None
     user: CommentUser  # Include user data
 
     class Config:
         from_attributes = True
 
 
+class CommentPage(BaseModel):
+    items: List[CommentWithScore] = []
+    next_cursor: Optional[str] = None
+
+
 class CommentVoteCreate(BaseModel):
     is_upvote: bool
 
@@ -108,11 +118,26 @@ class Tag(TagBase):
         from_attributes = True
 
 
+class TagWithCount(Tag):
+    post_count: int
+
+
+class TagPage(BaseModel):
+    items: List[TagWithCount] = []
+    next_cursor: Optional[str] = None
+
+
+class RelatedTag(Tag):
+    shared_posts: int  # Posts that have both tags
+
+
 class PostWithTags(BaseModel):
     id: int
     title: str
     description: Optional[str]
     image_url: Optional[str]
+    thumbnail_url: Optional[str] = None
+    preview_url: Optional[str] = None
     material: Optional[str]
     length: Optional[float]
     width: Optional[float]
@@ -136,8 +161,75 @@ class PostWithTags(BaseModel):
 class PostWithDetails(PostBase):
     id: int
     owner_id: int
-    comments: List[CommentWithScore] = []  # Include comments
+    # The first page of comments by score; fetch the rest from
+    # GET /posts/{id}/comments with comments_next_cursor
+    comments: List[CommentWithScore] = []
+    comment_count: int = 0
+    comments_next_cursor: Optional[str] = None
     tags: List[Tag] = []  # Include tags
 
     class Config:
         from_attributes = True
+
+
+class PostPage(BaseModel):
+    items: List[PostWithTags] = []
+    next_cursor: Optional[str] = None
+
+
+class SimilarPost(PostWithTags):
+    score: float  # 0-1, higher is more similar
+
+
+class FacetValue(BaseModel):
+    value: str
+    count: int
+
+
+class FacetBucket(BaseModel):
+    min: float
+    max: Optional[float] = None  # None for the open-ended last bucket
+    count: int
+
+
+class PostFacets(BaseModel):
+    total: int
+    values: Dict[str, List[FacetValue]]
+    histograms: Dict[str, List[FacetBucket]]
+
+
+class PostImport(BaseModel):
+    title: str
+    description: str = ""
+    material: Optional[str] = None
+    length: Optional[float] = None
+    width: Optional[float] = None
+    height: Optional[float] = None
+    color: Optional[str] = None
+    shape: Optional[str] = None
+    weight: Optional[float] = None
+    location: Optional[str] = None
+    smell: Optional[str] = None
+    taste: Optional[str] = None
+    origin: Optional[str] = None
+    tags: List[str] = []
+    image_path: Optional[str] = None
+
+    @field_validator("material", "color", "shape", "origin", "location")
+    def normalize(cls, v, info):
+        return normalize_descriptor(info.field_name, v)
+
+    @field_validator("length", "width", "height", "weight", mode="before")
+    def to_canonical_units(cls, v, info):
+        return parse_measure(info.field_name, v)
+
+
+class ImportRecordError(BaseModel):
+    line: int
+    error: str
+
+
+class ImportResult(BaseModel):
+    imported: int = 0
+    failed: int = 0
+    errors: List[ImportRecordError] = []
@@ -0,0 +1,216 @@
+import re
+from typing import Iterable, List, Optional
+
+from sqlalchemy import Float, Integer, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.models import Post as PostModel
+from app.models import Tag, post_tag_table
+from app.pagination import paginate
+
+# Free-text descriptor columns that are searchable alongside title and
+# description.
+ATTRIBUTE_COLUMNS = ("material", "color", "shape", "origin", "location")
+
+# Relative weight of each part of a post when ranking. PostgreSQL stores the
+# parts as tsvector weights A-D and passes these to ts_rank_cd(), SQLite
+# passes them to bm25().
+TITLE_WEIGHT = 10.0
+TAGS_WEIGHT = 5.0
+ATTRIBUTES_WEIGHT = 2.0
+DESCRIPTION_WEIGHT = 1.0
+
+# ts_rank_cd() takes the weights as a {D,C,B,A} array of values up to 1
+_TS_WEIGHTS = "{%s}" % ",".join(
+    str(weight / TITLE_WEIGHT)
+    for weight in (DESCRIPTION_WEIGHT, ATTRIBUTES_WEIGHT, TAGS_WEIGHT, TITLE_WEIGHT)
+)
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def setup_search_index(engine):
+    """
+    Create the full-text search structures for the engine's dialect and
+    index any posts that are not in the index yet.
+
+    PostgreSQL: a weighted tsvector column on posts with a GIN index, plus a
+    pg_trgm index on title for fuzzy matches.
+    SQLite: an FTS5 table keyed by post id.
+    """
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            conn.execute(
+                text("ALTER TABLE posts ADD COLUMN IF NOT EXISTS search_vector tsvector")
+            )
+            conn.execute(
+                text(
+                    "CREATE INDEX IF NOT EXISTS ix_posts_search_vector "
+                    "ON posts USING GIN (search_vector)"
+                )
+            )
+            conn.execute(
+                text(
+                    "CREATE INDEX IF NOT EXISTS ix_posts_title_trgm "
+                    "ON posts USING GIN (title gin_trgm_ops)"
+                )
+            )
+        else:
+            conn.execute(
+                text(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5("
+                    "title, tags, attributes, description, "
+                    "tokenize='porter unicode61')"
+                )
+            )
+
+    with Session(bind=engine) as db:
+        index_missing_posts(db)
+        db.commit()
+
+
+def _document(post: PostModel, tag_labels: Iterable[str]) -> dict:
+    return {
+        "id": post.id,
+        "title": post.title or "",
+        "tags": " ".join(tag_labels),
+        "attributes": " ".join(
+            getattr(post, column) for column in ATTRIBUTE_COLUMNS if getattr(post, column)
+        ),
+        "description": post.description or "",
+    }
+
+
+def index_post(db: Session, post: PostModel, tag_labels: Optional[List[str]] = None):
+    """
+    (Re)index a single post. Runs in the caller's transaction, so the post
+    must already be flushed.
+    """
+    if tag_labels is None:
+        tag_labels = [tag.label for tag in post.tags]
+    _write_documents(db, [_document(post, tag_labels)])
+
+
+def index_posts(db: Session, posts: Iterable, labels_by_id: dict):
+    """
+    Index many posts in one batched write. posts can be any objects with the
+    Post column attributes; labels_by_id maps post id to tag labels.
+    """
+    _write_documents(
+        db, [_document(post, labels_by_id.get(post.id, [])) for post in posts]
+    )
+
+
+def _write_documents(db: Session, documents: List[dict]):
+    if not documents:
+        return
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(
+            text(
+                "UPDATE posts SET search_vector = "
+                "setweight(to_tsvector('english', :title), 'A') || "
+                "setweight(to_tsvector('english', :tags), 'B') || "
+                "setweight(to_tsvector('english', :attributes), 'C') || "
+                "setweight(to_tsvector('english', :description), 'D') "
+                "WHERE id = :id"
+            ),
+            documents,
+        )
+    else:
+        db.execute(
+            text("DELETE FROM posts_fts WHERE rowid = :id"),
+            [{"id": document["id"]} for document in documents],
+        )
+        db.execute(
+            text(
+                "INSERT INTO posts_fts (rowid, title, tags, attributes, description) "
+                "VALUES (:id, :title, :tags, :attributes, :description)"
+            ),
+            documents,
+        )
+
+
+def index_missing_posts(db: Session, batch_size: int = 500):
+    """
+    Index every post that has no search document yet, e.g. rows written
+    before the index existed.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        missing = text("SELECT id FROM posts WHERE search_vector IS NULL")
+    else:
+        missing = text(
+            "SELECT id FROM posts WHERE id NOT IN (SELECT rowid FROM posts_fts)"
+        )
+    post_ids = [row[0] for row in db.execute(missing)]
+
+    for start in range(0, len(post_ids), batch_size):
+        batch = post_ids[start : start + batch_size]
+        posts = db.query(PostModel).filter(PostModel.id.in_(batch)).all()
+        labels = {post_id: [] for post_id in batch}
+        rows = (
+            db.query(post_tag_table.c.post_id, Tag.label)
+            .join(Tag, Tag.id == post_tag_table.c.tag_id)
+            .filter(post_tag_table.c.post_id.in_(batch))
+        )
+        for post_id, label in rows:
+            labels[post_id].append(label)
+        _write_documents(db, [_document(post, labels[post.id]) for post in posts])
+
+
+def _fts5_query(query: str) -> str:
+    # Quote every term so user input can't inject FTS5 syntax, and match on
+    # prefixes so partially typed words still hit.
+    return " ".join(f'"{term}"*' for term in _TERM_RE.findall(query))
+
+
+def _ranked_matches(db, query: str):
+    """
+    A (id, rank) subquery of posts matching query, higher rank is better.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        statement = text(
+            "SELECT posts.id AS id, "
+            f"ts_rank_cd('{_TS_WEIGHTS}', posts.search_vector, q.query) "
+            "+ similarity(posts.title, :raw) "
+            "AS rank "
+            "FROM posts, websearch_to_tsquery('english', :raw) AS q(query) "
+            "WHERE posts.search_vector @@ q.query OR posts.title % :raw"
+        ).bindparams(raw=query)
+    else:
+        statement = text(
+            "SELECT rowid AS id, "
+            "-bm25(posts_fts, :w_title, :w_tags, :w_attributes, :w_description) "
+            "AS rank "
+            "FROM posts_fts WHERE posts_fts MATCH :match"
+        ).bindparams(
+            match=_fts5_query(query),
+            w_title=TITLE_WEIGHT,
+            w_tags=TAGS_WEIGHT,
+            w_attributes=ATTRIBUTES_WEIGHT,
+            w_description=DESCRIPTION_WEIGHT,
+        )
+    return statement.columns(id=Integer, rank=Float).subquery("ranked")
+
+
+async def search_post_ids(
+    db: AsyncSession, query: str, limit: int, cursor: Optional[str]
+):
+    """
+    Return one page of post ids matching query, most relevant first, and the
+    cursor for the next page.
+    """
+    if not _TERM_RE.search(query):
+        return [], None
+    ranked = _ranked_matches(db, query)
+    rows, next_cursor = await paginate(
+        db,
+        select(ranked.c.id, ranked.c.rank),
+        [ranked.c.rank, ranked.c.id],
+        cursor,
+        limit,
+        lambda row: [row.rank, row.id],
+        descending=True,
+    )
+    return [row.id for row in rows], next_cursor
@@ -0,0 +1,34 @@
+"""
+Fast JSON encoding for read endpoints.
+
+Payloads built from projected database rows are trusted: their shape is
+fixed by the query, so they are encoded with orjson as they are instead of
+being validated against the response model first. Payloads that are ORM
+objects are turned into plain data by a TypeAdapter built once per model.
+"""
+
+from typing import Any, Callable, Type
+
+import orjson
+from pydantic import BaseModel, TypeAdapter
+
+
+def dump_json(payload: Any) -> bytes:
+    return orjson.dumps(payload)
+
+
+def model_data(model: Type[BaseModel]) -> Callable[[Any], Any]:
+    """
+    Return a function that validates an object (attributes are read, so ORM
+    instances work) against model and dumps it to plain, JSON-compatible
+    data.
+    """
+    adapter = TypeAdapter(model)
+
+    def prepare(value: Any) -> Any:
+        return adapter.dump_python(
+            adapter.validate_python(value, from_attributes=True), mode="json"
+        )
+
+    return prepare
+
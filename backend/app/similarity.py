@@ -0,0 +1,248 @@
+"""
+In-memory index of post descriptors for "similar objects".
+
+Every post is a row of features:
+- measurements (length, width, height, weight) as logs, so two values
+  compare by their ratio
+- categorical descriptors as one code per column; two posts' one-hot
+  vectors for a column have an inner product of 1 exactly when their codes
+  are equal, so codes are compared instead of storing the one-hot matrix
+- tag ids, with an inverted list of rows per tag
+
+Scoring a post against the whole catalog is a handful of NumPy operations
+over all rows at once. A post's score is the weighted mean of its per-feature
+similarities over the features the queried post has. The top k are picked
+with argpartition.
+
+The index is loaded from the database at startup and then grows as posts
+are created, in this process or (from their post.created events) in the
+other workers. Posts are never edited or deleted, so there's nothing else
+to keep in sync. Posts written by other processes (e.g. the bulk import
+CLI) are picked up when first asked for, or at the next restart.
+"""
+
+import asyncio
+import logging
+import math
+import threading
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app import events
+from app.database import SessionLocal
+from app.descriptors import CATEGORICAL_COLUMNS, NUMERIC_COLUMNS
+from app.models import Post, post_tag_table
+
+logger = logging.getLogger(__name__)
+
+NUMERIC_WEIGHTS = np.array([1.0, 1.0, 1.0, 1.5])  # length, width, height, weight
+CATEGORICAL_WEIGHTS = np.array([2.0, 1.0, 1.5, 0.5, 0.5])  # material ... location
+TAGS_WEIGHT = 3.0
+
+INITIAL_CAPACITY = 1024
+
+
+class _State:
+    """
+    The arrays of one generation of the index. Rows [0, size) are in use;
+    arrays are over-allocated and doubled when full.
+    """
+
+    def __init__(self, capacity: int = INITIAL_CAPACITY):
+        self.size = 0
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.numeric = np.full((capacity, len(NUMERIC_COLUMNS)), np.nan)
+        self.codes = np.full((capacity, len(CATEGORICAL_COLUMNS)), -1, dtype=np.int32)
+        self.tag_counts = np.zeros(capacity, dtype=np.int32)
+        self.row_of: Dict[int, int] = {}
+        self.tags_of: List[Tuple[int, ...]] = []
+        self.vocabularies: List[Dict[str, int]] = [{} for _ in CATEGORICAL_COLUMNS]
+        self.postings: Dict[int, array] = {}
+
+    def _grow(self):
+        capacity = len(self.ids) * 2
+        self.ids = np.resize(self.ids, capacity)
+        numeric = np.full((capacity, len(NUMERIC_COLUMNS)), np.nan)
+        numeric[: self.size] = self.numeric[: self.size]
+        self.numeric = numeric
+        codes = np.full((capacity, len(CATEGORICAL_COLUMNS)), -1, dtype=np.int32)
+        codes[: self.size] = self.codes[: self.size]
+        self.codes = codes
+        self.tag_counts = np.resize(self.tag_counts, capacity)
+
+    def insert(self, post_id: int, post, tag_ids: Iterable[int]):
+        if post_id in self.row_of:
+            return
+        if self.size == len(self.ids):
+            self._grow()
+        row = self.size
+        self.ids[row] = post_id
+        for j, column in enumerate(NUMERIC_COLUMNS):
+            value = getattr(post, column)
+            # Zero or negative measurements carry no information
+            self.numeric[row, j] = math.log(value) if value and value > 0 else np.nan
+        for j, column in enumerate(CATEGORICAL_COLUMNS):
+            value = getattr(post, column)
+            vocabulary = self.vocabularies[j]
+            # Equal when the filters would count them equal (see app.facets)
+            self.codes[row, j] = (
+                vocabulary.setdefault(value.lower(), len(vocabulary)) if value else -1
+            )
+        tags = tuple(dict.fromkeys(tag_ids))
+        for tag_id in tags:
+            self.postings.setdefault(tag_id, array("q")).append(row)
+        self.tag_counts[row] = len(tags)
+        self.tags_of.append(tags)
+        self.row_of[post_id] = row
+        self.size += 1
+
+
+class SimilarityIndex:
+    def __init__(self):
+        self._state = _State()
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def __contains__(self, post_id: int) -> bool:
+        return post_id in self._state.row_of
+
+    def __len__(self):
+        return self._state.size
+
+    def rebuild(self, db: Session):
+        """
+        Replace the index with every post in the database.
+        """
+        state = _State()
+        for post_id, row, tag_ids in _post_rows(db):
+            state.insert(post_id, row, tag_ids)
+        with self._lock:
+            self._state = state
+            self.loaded = True
+
+    def load(self, db: Session, post_ids: List[int]):
+        """
+        Index posts created elsewhere, reading them from the database.
+        """
+        if not self.loaded:
+            return
+        rows = list(_post_rows(db, post_ids))
+        with self._lock:
+            for post_id, row, tag_ids in rows:
+                self._state.insert(post_id, row, tag_ids)
+
+    def add(self, post_id: int, post, tag_ids: Iterable[int]):
+        """
+        Index a newly created post; post has the descriptor attributes.
+        Ignored until the index has been loaded, so processes that don't
+        serve it (e.g. the import CLI) don't build one.
+        """
+        if not self.loaded:
+            return
+        with self._lock:
+            self._state.insert(post_id, post, tag_ids)
+
+    def similar(self, post_id: int, k: int) -> Optional[List[Tuple[int, float]]]:
+        """
+        Up to k (post id, score) pairs most similar to post_id, best first,
+        with scores in (0, 1]. None if the post isn't indexed.
+        """
+        with self._lock:
+            state = self._state
+            row = state.row_of.get(post_id)
+            if row is None:
+                return None
+            n = state.size
+            score = np.zeros(n)
+            total_weight = 0.0
+
+            numeric = state.numeric[:n]
+            present = ~np.isnan(numeric[row])
+            if present.any():
+                # exp(-|log a - log b|) is min(a, b) / max(a, b); missing is 0
+                ratios = np.exp(-np.abs(numeric[:, present] - numeric[row, present]))
+                score += np.nan_to_num(ratios, copy=False) @ NUMERIC_WEIGHTS[present]
+                total_weight += NUMERIC_WEIGHTS[present].sum()
+
+            codes = state.codes[:n]
+            present = codes[row] >= 0
+            if present.any():
+                matches = codes[:, present] == codes[row, present]
+                score += matches @ CATEGORICAL_WEIGHTS[present]
+                total_weight += CATEGORICAL_WEIGHTS[present].sum()
+
+            tags = state.tags_of[row]
+            if tags:
+                # Jaccard similarity of tag sets from the inverted lists;
+                # the frombuffer views are gone once concatenate returns
+                rows = np.concatenate(
+                    [np.frombuffer(state.postings[tag_id], dtype=np.int64) for tag_id in tags]
+                )
+                shared = np.bincount(rows, minlength=n)[:n]
+                union = state.tag_counts[:n] + len(tags) - shared
+                score += TAGS_WEIGHT * shared / np.maximum(union, 1)
+                total_weight += TAGS_WEIGHT
+
+            ids = state.ids[:n].copy()
+
+        if total_weight == 0 or n < 2:
+            return []
+        score /= total_weight
+        score[row] = -1.0
+        k = min(k, n - 1)
+        top = np.argpartition(-score, k - 1)[:k]
+        top = top[np.argsort(-score[top], kind="stable")]
+        return [
+            (int(ids[i]), round(float(score[i]), 4)) for i in top if score[i] > 0
+        ]
+
+
+def _post_rows(db: Session, post_ids: Optional[List[int]] = None):
+    """
+    (id, descriptor row, tag ids) of the given posts, or of every post.
+    """
+    tags_statement = select(post_tag_table.c.post_id, post_tag_table.c.tag_id)
+    columns = [getattr(Post, column) for column in NUMERIC_COLUMNS + CATEGORICAL_COLUMNS]
+    posts_statement = select(Post.id, *columns).order_by(Post.id)
+    if post_ids is not None:
+        tags_statement = tags_statement.where(post_tag_table.c.post_id.in_(post_ids))
+        posts_statement = posts_statement.where(Post.id.in_(post_ids))
+    tags_by_post: Dict[int, List[int]] = {}
+    for post_id, tag_id in db.execute(tags_statement):
+        tags_by_post.setdefault(post_id, []).append(tag_id)
+    for row in db.execute(posts_statement):
+        yield row.id, row, tags_by_post.get(row.id, ())
+
+
+similarity_index = SimilarityIndex()
+
+
+def _load_posts(post_ids: List[int]):
+    try:
+        with SessionLocal() as db:
+            similarity_index.load(db, post_ids)
+    except Exception:
+        logger.exception("Could not index posts %s", post_ids)
+
+
+def _index_new_post(event: dict):
+    # Posts created by other workers
+    post_id = event.get("post_id")
+    if (
+        event.get("type") == "post.created"
+        and similarity_index.loaded
+        and post_id not in similarity_index
+    ):
+        asyncio.get_running_loop().run_in_executor(None, _load_posts, [post_id])
+
+
+events.broker.listen(events.FEED, _index_new_post)
+
+
+def load_similarity_index(engine):
+    with Session(bind=engine) as db:
+        similarity_index.rebuild(db)
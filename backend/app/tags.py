@@ -0,0 +1,217 @@
+import logging
+import os
+from collections import Counter
+from itertools import permutations
+from typing import Dict, Iterable, List
+
+from sqlalchemy import bindparam, delete, func, insert, inspect, select, text, update
+from sqlalchemy.orm import Session
+
+from app.cache import TTLCache
+from app.database import dialect_insert
+from app.models import Tag, TagCooccurrence, post_tag_table
+from app.reconcile import reconcile_tag_stats
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WIKIDATA_URL = "https://www.wikidata.org"
+DEFAULT_DESCRIPTION = "No description available"
+
+TAG_CACHE_SIZE = int(os.getenv("TAG_CACHE_SIZE", 5000))
+TAG_CACHE_TTL = float(os.getenv("TAG_CACHE_TTL", 3600))
+
+# label -> {"id", "label", "wikidata_url", "description"} for tags that are
+# known to be committed. Tags are never renamed, so entries only age out.
+tag_cache = TTLCache(TAG_CACHE_SIZE, TAG_CACHE_TTL)
+
+_TAG_COLUMNS = (Tag.id, Tag.label, Tag.wikidata_url, Tag.description)
+
+
+def _merge_duplicate_tags(conn) -> int:
+    """
+    Fold tags sharing a label into the one with the lowest id, moving their
+    posts over. Returns the number of tags removed.
+    """
+    survivors = dict(
+        conn.execute(
+            select(Tag.label, func.min(Tag.id)).group_by(Tag.label).having(func.count() > 1)
+        ).all()
+    )
+    if not survivors:
+        return 0
+    # duplicate id -> surviving id
+    merged = {
+        tag_id: survivors[label]
+        for tag_id, label in conn.execute(
+            select(Tag.id, Tag.label).where(
+                Tag.label.in_(list(survivors)), Tag.id.not_in(list(survivors.values()))
+            )
+        )
+    }
+    links = conn.execute(
+        select(post_tag_table.c.post_id, post_tag_table.c.tag_id).where(
+            post_tag_table.c.tag_id.in_(list(merged) + list(survivors.values()))
+        )
+    ).all()
+    kept = {(post_id, tag_id) for post_id, tag_id in links if tag_id not in merged}
+    moved = {
+        (post_id, merged[tag_id]) for post_id, tag_id in links if tag_id in merged
+    } - kept
+    conn.execute(delete(post_tag_table).where(post_tag_table.c.tag_id.in_(list(merged))))
+    if moved:
+        conn.execute(
+            insert(post_tag_table),
+            [{"post_id": post_id, "tag_id": tag_id} for post_id, tag_id in moved],
+        )
+    conn.execute(
+        delete(TagCooccurrence).where(
+            TagCooccurrence.tag_id.in_(list(merged)) | TagCooccurrence.other_id.in_(list(merged))
+        )
+    )
+    conn.execute(delete(Tag).where(Tag.id.in_(list(merged))))
+    return len(merged)
+
+
+def setup_tags(engine):
+    """
+    Add tags.post_count and the indexes on tags to tables created before
+    they existed. Tags created twice under one label are merged before the
+    unique index on labels is created. The tag stats are then rebuilt.
+    """
+    merged = 0
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        columns = {column["name"] for column in inspector.get_columns(Tag.__tablename__)}
+        added = "post_count" not in columns
+        if added:
+            conn.execute(text("ALTER TABLE tags ADD COLUMN post_count INTEGER NOT NULL DEFAULT 0"))
+        existing = {index["name"] for index in inspector.get_indexes(Tag.__tablename__)}
+        for index in Tag.__table__.indexes:
+            if index.name in existing:
+                continue
+            if index.unique:
+                merged += _merge_duplicate_tags(conn)
+            index.create(conn)
+    if merged:
+        logger.warning("Merged %d duplicate tags", merged)
+    if merged or added:
+        with Session(bind=engine) as db:
+            counted = reconcile_tag_stats(db)
+            db.commit()
+        if added:
+            logger.info("Counted the posts of %d tags", counted)
+
+
+def _row(row) -> dict:
+    return {
+        "id": row.id,
+        "label": row.label,
+        "wikidata_url": row.wikidata_url,
+        "description": row.description,
+    }
+
+
+def _insert_ignoring_conflicts(db: Session, labels: List[str]):
+    statement = (
+        dialect_insert(db)(Tag)
+        .values(
+            [
+                {
+                    "label": label,
+                    "wikidata_url": DEFAULT_WIKIDATA_URL,
+                    "description": DEFAULT_DESCRIPTION,
+                }
+                for label in labels
+            ]
+        )
+        .on_conflict_do_nothing(index_elements=["label"])
+        .returning(*_TAG_COLUMNS)
+    )
+    return db.execute(statement).all()
+
+
+def resolve_tags(db: Session, labels: List[str]) -> List[dict]:
+    """
+    Map labels to tag rows, creating the missing ones, in at most three
+    statements: one SELECT for the uncached labels, one INSERT ... ON
+    CONFLICT DO NOTHING RETURNING for the new ones, and a final SELECT for
+    any that a concurrent transaction inserted first. Runs in the caller's
+    transaction.
+    """
+    labels = list(dict.fromkeys(label for label in labels if label))
+    found: Dict[str, dict] = {}
+    for label in labels:
+        cached = tag_cache.get_fresh(label)
+        if cached is not None:
+            found[label] = cached
+
+    missing = [label for label in labels if label not in found]
+    if missing:
+        for row in db.query(*_TAG_COLUMNS).filter(Tag.label.in_(missing)):
+            found[row.label] = _row(row)
+            tag_cache.set(row.label, found[row.label])
+
+    missing = [label for label in labels if label not in found]
+    if missing:
+        for row in _insert_ignoring_conflicts(db, missing):
+            found[row.label] = _row(row)
+
+    missing = [label for label in labels if label not in found]
+    if missing:
+        for row in db.query(*_TAG_COLUMNS).filter(Tag.label.in_(missing)):
+            found[row.label] = _row(row)
+
+    return [found[label] for label in labels]
+
+
+def link_tags(db: Session, post_id: int, tags: List[dict]):
+    if tags:
+        db.execute(
+            insert(post_tag_table),
+            [{"post_id": post_id, "tag_id": tag["id"]} for tag in tags],
+        )
+        update_tag_stats(db, [[tag["id"] for tag in tags]])
+
+
+def update_tag_stats(db: Session, tag_id_sets: Iterable[Iterable[int]], sign: int = 1):
+    """
+    Apply posts gaining (sign=1) or losing (sign=-1) tags to tags.post_count
+    and tag_cooccurrence, given one set of tag ids per post. Whatever the
+    number of posts, this is one UPDATE and one upsert, each run with
+    executemany. Runs in the caller's transaction.
+    """
+    counts = Counter()
+    pairs = Counter()
+    for tag_ids in tag_id_sets:
+        tag_ids = set(tag_ids)
+        counts.update(tag_ids)
+        pairs.update(permutations(tag_ids, 2))
+    if not counts:
+        return
+
+    tags = Tag.__table__
+    db.execute(
+        update(tags)
+        .where(tags.c.id == bindparam("tag_id"))
+        .values(post_count=tags.c.post_count + bindparam("delta")),
+        [{"tag_id": tag_id, "delta": sign * n} for tag_id, n in counts.items()],
+    )
+
+    if pairs:
+        cooccurrence = TagCooccurrence.__table__
+        statement = dialect_insert(db)(cooccurrence)
+        statement = statement.on_conflict_do_update(
+            index_elements=["tag_id", "other_id"],
+            set_={
+                "post_count": cooccurrence.c.post_count + statement.excluded.post_count
+            },
+        )
+        db.execute(
+            statement,
+            [
+                {"tag_id": tag_id, "other_id": other_id, "post_count": sign * n}
+                for (tag_id, other_id), n in pairs.items()
+            ],
+        )
+        if sign < 0:
+            db.execute(delete(cooccurrence).where(cooccurrence.c.post_count <= 0))
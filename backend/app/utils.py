@@ -5,14 +5,18 @@ from typing import Optional
 from fastapi import Depends, HTTPException, Request
 from fastapi.security.utils import get_authorization_scheme_param
 from fastapi.security import OAuth2PasswordBearer, OAuth2
+from sqlalchemy import event
 from sqlalchemy.orm import Session
+from app.cache import TTLCache
 from app.database import get_db
 from app.models import User
 
 import os
+import time
 import logging
 
-logging.basicConfig(level=logging.INFO)
+# Auth path logging is opt-in: enable DEBUG on this logger to see it
+logger = logging.getLogger(__name__)
 
 
 class OAuth2PasswordBearerWithCookie(OAuth2):
@@ -46,6 +50,15 @@ if not SECRET_KEY:
     raise ValueError("SECRET_KEY environment variable is not set")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", 10000))
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", 60))
+
+# Verified token payloads keyed by the raw token, and (id, username) keyed by
+# username, so a steady stream of requests from the same user skips both the
+# signature check and the users lookup.
+token_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+user_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+
 
 # Function to hash a password
 def hash_password(password: str) -> str:
@@ -63,42 +76,66 @@ def create_access_token(
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=expires_delta)
     to_encode.update({"exp": expire})
-    logging.info(f"DEBUG: Payload for token creation: {to_encode}")
-    token = jwt.encode(to_encode, secret_key, algorithm=algorithm)
-    logging.info(f"DEBUG: Token created: {token}")
-    return token
+    logger.debug("Creating token for %s", to_encode.get("sub"))
+    return jwt.encode(to_encode, secret_key, algorithm=algorithm)
 
 
 def verify_token(token: str):
+    payload = token_cache.get_fresh(token)
+    if payload is not None:
+        return payload
     try:
-        logging.info(f"DEBUG: Verifying token: {token}")
-        logging.info(
-            f"DEBUG: Using SECRET_KEY: {SECRET_KEY} and ALGORITHM: {ALGORITHM}"
-        )
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        logging.info(f"DEBUG: Decoded payload: {payload}")
-        return payload
     except jwt.ExpiredSignatureError:
-        logging.error("DEBUG: Token has expired")
+        logger.debug("Token has expired")
         raise HTTPException(status_code=401, detail="Token has expired")
     except jwt.InvalidTokenError as e:
-        logging.error(f"DEBUG: Invalid token - {e}")
+        logger.debug("Invalid token: %s", e)
         raise HTTPException(status_code=401, detail="Invalid token")
 
+    # Never keep a token cached past its own expiry
+    ttl = AUTH_CACHE_TTL
+    if "exp" in payload:
+        ttl = min(ttl, payload["exp"] - time.time())
+    if ttl > 0:
+        token_cache.set(token, payload, ttl=ttl)
+    return payload
+
+
+def invalidate_user(username: str):
+    user_cache.delete(username)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_cached_user(mapper, connection, target):
+    invalidate_user(target.username)
+
 
 def get_current_user(
     token: str = Depends(oauth2_scheme),
     db: Session = Depends(get_db),
 ):
-    logging.info(f"DEBUG: Received token in Authorization header: {token}")
+    """
+    Resolve the authenticated user. Routers and endpoints should all depend
+    on this same function so FastAPI resolves it once per request.
+
+    Returns a transient User carrying id and username; it is not attached to
+    the request's session.
+    """
     payload = verify_token(token)  # No need to pass SECRET_KEY or ALGORITHM
     username: str = payload.get("sub")
     if not username:
-        logging.error("DEBUG: Invalid token payload - 'sub' claim missing")
+        logger.debug("Invalid token payload - 'sub' claim missing")
         raise HTTPException(status_code=401, detail="Invalid token payload")
-    logging.info(f"DEBUG: Token belongs to user: {username}")
-    user = db.query(User).filter(User.username == username).first()
-    if not user:
-        logging.error("DEBUG: User not found in database")
-        raise HTTPException(status_code=404, detail="User not found")
-    return user
+
+    cached = user_cache.get_fresh(username)
+    if cached is None:
+        row = db.query(User.id, User.username).filter(User.username == username).first()
+        if not row:
+            logger.debug("User %s not found in database", username)
+            raise HTTPException(status_code=404, detail="User not found")
+        cached = tuple(row)
+        user_cache.set(username, cached)
+    user_id, username = cached
+    return User(id=user_id, username=username)
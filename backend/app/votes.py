@@ -0,0 +1,671 @@
+"""
+Comment votes and post interests.
+
+A user has at most one vote per comment and one interest per post, enforced
+by unique indexes, so writes are single statements: a vote is an INSERT ...
+ON CONFLICT DO NOTHING, or an UPDATE when it flips; an interest toggle is a
+DELETE, or an INSERT ... ON CONFLICT DO NOTHING when there was nothing to
+delete. The denormalized counters then move by what actually changed.
+
+With VOTES_FLUSH_INTERVAL set, votes and toggles are write-behind instead:
+a request only reads, records the new state in memory and returns counts
+that include it, and a background task writes everything recorded in one
+transaction per interval. Repeated votes and toggles of the same key within
+an interval collapse into one row write, and each comment's or post's
+counters move once. The flush compares the recorded state with the rows in
+the database, so counters stay exact even when several workers buffer
+votes on the same comment; the counts a worker returns include only its
+own unflushed changes. Live update events and cache invalidation happen
+when the flush commits. A crash loses at most one interval of votes.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import (
+    and_,
+    bindparam,
+    delete,
+    func,
+    inspect,
+    select,
+    text,
+    tuple_,
+    update,
+)
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.database import SessionLocal, dialect_insert
+from app.events import FEED, post_channel, publish
+from app.models import Comment, CommentVote, Post, PostInterest, User
+from app.ranking import hot_score
+from app.reconcile import reconcile_comment_votes, reconcile_interest_counts
+from app.response_cache import HOT_PAGES, card_tag, post_tag, response_cache
+
+logger = logging.getLogger(__name__)
+
+# Seconds between write-behind flushes; 0 writes every vote as it comes
+VOTES_FLUSH_INTERVAL = float(os.getenv("VOTES_FLUSH_INTERVAL", 0))
+
+# Keys per (a, b) IN (...) lookup when flushing
+LOOKUP_CHUNK = 500
+
+Key = Tuple[int, int]
+
+
+def setup_votes(engine):
+    """
+    Add the comment score counters and create the unique indexes on tables
+    created before they existed. Any duplicate rows are removed first,
+    keeping the latest, and the counters they fed are then repaired.
+    """
+    removed = 0
+    with engine.begin() as conn:
+        columns = {column["name"] for column in inspect(conn).get_columns(Comment.__tablename__)}
+        added = [
+            column for column in ("upvotes", "downvotes", "score") if column not in columns
+        ]
+        for column in added:
+            conn.execute(
+                text(f"ALTER TABLE comments ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+            )
+        for model, columns in (
+            (CommentVote, ("comment_id", "user_id")),
+            (PostInterest, ("post_id", "user_id")),
+        ):
+            table = model.__table__
+            existing = {index["name"] for index in inspect(conn).get_indexes(table.name)}
+            for index in table.indexes:
+                if not index.unique or index.name in existing:
+                    continue
+                keep = select(func.max(table.c.id)).group_by(
+                    *(table.c[column] for column in columns)
+                )
+                removed += conn.execute(delete(table).where(table.c.id.not_in(keep))).rowcount
+                index.create(conn)
+    if removed:
+        logger.warning("Removed %d duplicate votes and interests", removed)
+    if removed or added:
+        with Session(bind=engine) as db:
+            scored = reconcile_comment_votes(db)
+            reconcile_interest_counts(db)
+            db.commit()
+        if added:
+            logger.info("Counted the votes of %d comments", scored)
+
+
+def setup_hot_ranking(engine):
+    """
+    Add what /posts/hot ranks by to posts tables created before it existed:
+    created_at, interest_count, hot_score and the index on hot_score, then
+    count and score every post. Posts created before created_at get the
+    time it is rescore. Posts are also rescored when their scores were
+    computed by an older version of hot_score.
+    """
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        columns = {column["name"] for column in inspector.get_columns(Post.__tablename__)}
+        rescore = not {"created_at", "interest_count", "hot_score"} <= columns
+        if "created_at" not in columns:
+            # SQLite can't add a column defaulting to the current time
+            conn.execute(text("ALTER TABLE posts ADD COLUMN created_at TIMESTAMP"))
+            conn.execute(
+                update(Post)
+                .where(Post.created_at.is_(None))
+                .values(created_at=datetime.utcnow())
+            )
+            if engine.dialect.name != "sqlite":
+                conn.execute(text("ALTER TABLE posts ALTER COLUMN created_at SET NOT NULL"))
+        if "interest_count" not in columns:
+            conn.execute(
+                text("ALTER TABLE posts ADD COLUMN interest_count INTEGER NOT NULL DEFAULT 0")
+            )
+        if "hot_score" not in columns:
+            conn.execute(text("ALTER TABLE posts ADD COLUMN hot_score FLOAT NOT NULL DEFAULT 0"))
+        existing = {index["name"] for index in inspector.get_indexes(Post.__tablename__)}
+        for index in Post.__table__.indexes:
+            if index.name == "ix_posts_hot_score_id" and index.name not in existing:
+                index.create(conn)
+        if not rescore:
+            # Whether the latest interested post still has the score
+            # hot_score gives it
+            sample = conn.execute(
+                select(Post.interest_count, Post.created_at, Post.hot_score)
+                .where(Post.interest_count > 0)
+                .order_by(Post.id.desc())
+                .limit(1)
+            ).first()
+            rescore = sample is not None and abs(
+                sample.hot_score - hot_score(sample.interest_count, sample.created_at)
+            ) > 1e-6
+    if rescore:
+        with Session(bind=engine) as db:
+            scored = reconcile_interest_counts(db, rescore=True)
+            db.commit()
+        logger.info("Scored %d posts for /posts/hot", scored)
+
+
+def _author():
+    return (
+        select(User.username)
+        .where(User.id == Comment.user_id)
+        .scalar_subquery()
+        .label("username")
+    )
+
+
+_COMMENT_COLUMNS = (
+    Comment.id,
+    Comment.post_id,
+    Comment.user_id,
+    Comment.content,
+    Comment.score,
+    Comment.created_at,
+)
+
+
+def _comment(row, score: int) -> dict:
+    """
+    CommentWithScore-shaped payload.
+    """
+    return {
+        "id": row.id,
+        "post_id": row.post_id,
+        "user_id": row.user_id,
+        "content": row.content,
+        "score": score,
+        "created_at": row.created_at,
+        "user": {"id": row.user_id, "username": row.username},
+    }
+
+
+def _vote_value(is_upvote: Optional[bool]) -> int:
+    if is_upvote is None:
+        return 0
+    return 1 if is_upvote else -1
+
+
+def _vote_now(db: Session, comment_id: int, user_id: int, is_upvote: bool) -> Optional[dict]:
+    try:
+        inserted = db.execute(
+            dialect_insert(db)(CommentVote)
+            .values(comment_id=comment_id, user_id=user_id, is_upvote=is_upvote)
+            .on_conflict_do_nothing(index_elements=["comment_id", "user_id"])
+            .returning(CommentVote.id)
+        ).first()
+    except IntegrityError:
+        # The comment doesn't exist
+        db.rollback()
+        return None
+
+    # A new vote adds to one side, a flipped vote moves from one side to
+    # the other, a repeat is a no-op
+    if inserted:
+        up_delta, down_delta = (1, 0) if is_upvote else (0, 1)
+    elif db.execute(
+        update(CommentVote)
+        .where(
+            CommentVote.comment_id == comment_id,
+            CommentVote.user_id == user_id,
+            CommentVote.is_upvote != is_upvote,
+        )
+        .values(is_upvote=is_upvote)
+        .returning(CommentVote.id)
+        .execution_options(synchronize_session=False)
+    ).first():
+        up_delta = 1 if is_upvote else -1
+        down_delta = -up_delta
+    else:
+        up_delta = down_delta = 0
+
+    if up_delta or down_delta:
+        row = db.execute(
+            update(Comment)
+            .where(Comment.id == comment_id)
+            .values(
+                upvotes=Comment.upvotes + up_delta,
+                downvotes=Comment.downvotes + down_delta,
+                score=Comment.score + up_delta - down_delta,
+            )
+            .returning(*_COMMENT_COLUMNS, _author())
+            .execution_options(synchronize_session=False)
+        ).first()
+    else:
+        row = db.execute(select(*_COMMENT_COLUMNS, _author()).where(Comment.id == comment_id)).first()
+    if row is None:
+        db.rollback()
+        return None
+
+    if up_delta or down_delta:
+        publish(
+            db,
+            {
+                "type": "comment.voted",
+                "post_id": row.post_id,
+                "comment_id": comment_id,
+                "score": row.score,
+            },
+            post_channel(row.post_id),
+        )
+        db.commit()
+        response_cache.invalidate(post_tag(row.post_id))
+    return _comment(row, row.score)
+
+
+def _set_hot_scores(db: Session, post_ids: Iterable[int]) -> list:
+    """
+    Recompute hot_score of posts from their interest_count. Returns their
+    (id, interest_count) rows.
+    """
+    posts = Post.__table__
+    rows = db.execute(
+        select(posts.c.id, posts.c.interest_count, posts.c.created_at).where(
+            posts.c.id.in_(list(post_ids))
+        )
+    ).all()
+    if rows:
+        db.execute(
+            update(posts)
+            .where(posts.c.id == bindparam("post_id"))
+            .values(hot_score=bindparam("score")),
+            [
+                {"post_id": row.id, "score": hot_score(row.interest_count, row.created_at)}
+                for row in rows
+            ],
+        )
+    return rows
+
+
+def _toggle_now(db: Session, post_id: int, user_id: int) -> Optional[int]:
+    removed = db.execute(
+        delete(PostInterest)
+        .where(PostInterest.post_id == post_id, PostInterest.user_id == user_id)
+        .returning(PostInterest.id)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if removed:
+        delta = -1
+    else:
+        try:
+            inserted = db.execute(
+                dialect_insert(db)(PostInterest)
+                .values(post_id=post_id, user_id=user_id)
+                .on_conflict_do_nothing(index_elements=["post_id", "user_id"])
+                .returning(PostInterest.id)
+            ).first()
+        except IntegrityError:
+            # The post doesn't exist
+            db.rollback()
+            return None
+        # Nothing inserted: a concurrent toggle just did
+        delta = 1 if inserted else 0
+
+    row = db.execute(
+        update(Post)
+        .where(Post.id == post_id)
+        .values(interest_count=Post.interest_count + delta)
+        .returning(Post.interest_count, Post.created_at)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if row is None:
+        db.rollback()
+        return None
+    db.execute(
+        update(Post)
+        .where(Post.id == post_id)
+        .values(hot_score=hot_score(row.interest_count, row.created_at))
+        .execution_options(synchronize_session=False)
+    )
+    publish(
+        db,
+        {"type": "interest", "post_id": post_id, "interest_count": row.interest_count},
+        post_channel(post_id),
+        FEED,
+    )
+    db.commit()
+    # The count shows on the post's own page and every list page showing
+    # it, and moves it in the hot ordering
+    response_cache.invalidate(post_tag(post_id), card_tag(post_id), HOT_PAGES)
+    return row.interest_count
+
+
+def _chunks(items: list, size: int):
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def _existing(db: Session, table, columns: Tuple[str, str], keys: List[Key], value=None) -> dict:
+    """
+    {key: value column (or True)} for the keys that have a row in table.
+    """
+    pair = tuple_(table.c[columns[0]], table.c[columns[1]])
+    selected = (table.c[columns[0]], table.c[columns[1]]) + (
+        (table.c[value],) if value else ()
+    )
+    found = {}
+    for chunk in _chunks(keys, LOOKUP_CHUNK):
+        for row in db.execute(select(*selected).where(pair.in_(chunk))):
+            found[(row[0], row[1])] = row[2] if value else True
+    return found
+
+
+def _write_votes(db: Session, votes: Dict[Key, bool]) -> List[int]:
+    """
+    Bring comment_votes to the recorded state and move the counters by what
+    changed. Returns the ids of the posts whose comments changed.
+    """
+    if not votes:
+        return []
+    table = CommentVote.__table__
+    current = _existing(db, table, ("comment_id", "user_id"), list(votes), "is_upvote")
+
+    rows = []
+    up = Counter()
+    down = Counter()
+    for (comment_id, user_id), is_upvote in votes.items():
+        prior = current.get((comment_id, user_id))
+        if prior == is_upvote:
+            continue
+        rows.append({"comment_id": comment_id, "user_id": user_id, "is_upvote": is_upvote})
+        if prior is not None:
+            (up if prior else down)[comment_id] -= 1
+        (up if is_upvote else down)[comment_id] += 1
+    if not rows:
+        return []
+
+    statement = dialect_insert(db)(table)
+    db.execute(
+        statement.on_conflict_do_update(
+            index_elements=["comment_id", "user_id"],
+            set_={"is_upvote": statement.excluded.is_upvote},
+        ),
+        rows,
+    )
+    comments = Comment.__table__
+    changed = set(up) | set(down)
+    db.execute(
+        update(comments)
+        .where(comments.c.id == bindparam("comment_id"))
+        .values(
+            upvotes=comments.c.upvotes + bindparam("up"),
+            downvotes=comments.c.downvotes + bindparam("down"),
+            score=comments.c.score + bindparam("up") - bindparam("down"),
+        ),
+        [
+            {"comment_id": comment_id, "up": up[comment_id], "down": down[comment_id]}
+            for comment_id in changed
+        ],
+    )
+
+    post_ids = set()
+    for row in db.execute(
+        select(comments.c.id, comments.c.post_id, comments.c.score).where(
+            comments.c.id.in_(changed)
+        )
+    ):
+        post_ids.add(row.post_id)
+        publish(
+            db,
+            {
+                "type": "comment.voted",
+                "post_id": row.post_id,
+                "comment_id": row.id,
+                "score": row.score,
+            },
+            post_channel(row.post_id),
+        )
+    return list(post_ids)
+
+
+def _write_interests(db: Session, interests: Dict[Key, bool]) -> List[int]:
+    """
+    Bring post_interests to the recorded state and move the counters by
+    what changed. Returns the ids of the posts whose count changed.
+    """
+    if not interests:
+        return []
+    table = PostInterest.__table__
+    current = _existing(db, table, ("post_id", "user_id"), list(interests))
+
+    added = []
+    removed = []
+    deltas = Counter()
+    for (post_id, user_id), interested in interests.items():
+        if interested == ((post_id, user_id) in current):
+            continue
+        (added if interested else removed).append({"post_id": post_id, "user_id": user_id})
+        deltas[post_id] += 1 if interested else -1
+    if added:
+        db.execute(
+            dialect_insert(db)(table).on_conflict_do_nothing(
+                index_elements=["post_id", "user_id"]
+            ),
+            added,
+        )
+    if removed:
+        db.execute(
+            delete(table).where(
+                table.c.post_id == bindparam("post_id"),
+                table.c.user_id == bindparam("user_id"),
+            ),
+            removed,
+        )
+    deltas = {post_id: delta for post_id, delta in deltas.items() if delta}
+    if not deltas:
+        return []
+
+    posts = Post.__table__
+    db.execute(
+        update(posts)
+        .where(posts.c.id == bindparam("post_id"))
+        .values(interest_count=posts.c.interest_count + bindparam("delta")),
+        [{"post_id": post_id, "delta": delta} for post_id, delta in deltas.items()],
+    )
+    for row in _set_hot_scores(db, deltas):
+        publish(
+            db,
+            {"type": "interest", "post_id": row.id, "interest_count": row.interest_count},
+            post_channel(row.id),
+            FEED,
+        )
+    return list(deltas)
+
+
+class _Batch:
+    """
+    Recorded state per key, and the counter deltas it implies relative to
+    what came before it.
+    """
+
+    def __init__(self):
+        self.votes: Dict[Key, bool] = {}
+        self.interests: Dict[Key, bool] = {}
+        self.scores = Counter()
+        self.interest_counts = Counter()
+
+    def __bool__(self):
+        return bool(self.votes or self.interests)
+
+    def merge(self, newer: "_Batch"):
+        self.votes.update(newer.votes)
+        self.interests.update(newer.interests)
+        self.scores.update(newer.scores)
+        self.interest_counts.update(newer.interest_counts)
+
+
+class WriteBehind:
+    """
+    Votes and interest toggles recorded in memory until the next flush.
+
+    Counts returned to callers are the database's plus the deltas not yet
+    committed: those recorded since the last flush began (pending) and
+    those the running flush is writing (in flight). A flush commits and
+    forgets its batch under the lock and bumps the generation; a request
+    whose database read may have straddled that reads again.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._pending = _Batch()
+        self._in_flight = _Batch()
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending.votes) + len(self._pending.interests)
+
+    def _prior(self, states: str, key: Key, stored):
+        pending = getattr(self._pending, states)
+        if key in pending:
+            return pending[key]
+        return getattr(self._in_flight, states).get(key, stored)
+
+    def vote(self, db: Session, comment_id: int, user_id: int, is_upvote: bool) -> Optional[dict]:
+        key = (comment_id, user_id)
+        while True:
+            generation = self._generation
+            row = db.execute(
+                select(*_COMMENT_COLUMNS, _author(), CommentVote.is_upvote.label("current"))
+                .outerjoin(
+                    CommentVote,
+                    and_(CommentVote.comment_id == Comment.id, CommentVote.user_id == user_id),
+                )
+                .where(Comment.id == comment_id)
+            ).first()
+            if row is None:
+                return None
+            with self._lock:
+                if generation != self._generation:
+                    continue
+                prior = self._prior("votes", key, row.current)
+                self._pending.votes[key] = is_upvote
+                self._pending.scores[comment_id] += _vote_value(is_upvote) - _vote_value(prior)
+                score = (
+                    row.score
+                    + self._pending.scores[comment_id]
+                    + self._in_flight.scores[comment_id]
+                )
+            return _comment(row, score)
+
+    def toggle_interest(self, db: Session, post_id: int, user_id: int) -> Optional[int]:
+        key = (post_id, user_id)
+        while True:
+            generation = self._generation
+            row = db.execute(
+                select(Post.interest_count, PostInterest.id.label("interest_id"))
+                .select_from(Post)
+                .outerjoin(
+                    PostInterest,
+                    and_(PostInterest.post_id == Post.id, PostInterest.user_id == user_id),
+                )
+                .where(Post.id == post_id)
+            ).first()
+            if row is None:
+                return None
+            with self._lock:
+                if generation != self._generation:
+                    continue
+                interested = not self._prior("interests", key, row.interest_id is not None)
+                self._pending.interests[key] = interested
+                self._pending.interest_counts[post_id] += 1 if interested else -1
+                return (
+                    row.interest_count
+                    + self._pending.interest_counts[post_id]
+                    + self._in_flight.interest_counts[post_id]
+                )
+
+    def flush(self):
+        """
+        Write everything recorded so far in one transaction. Blocking; one
+        flush runs at a time. On failure the batch is kept for the next one.
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, _Batch()
+                self._in_flight = batch
+            if not batch:
+                return
+            try:
+                with SessionLocal() as db:
+                    comment_posts = _write_votes(db, batch.votes)
+                    interest_posts = _write_interests(db, batch.interests)
+                    with self._lock:
+                        db.commit()
+                        self._in_flight = _Batch()
+                        self._generation += 1
+            except Exception:
+                logger.exception(
+                    "Could not write %d votes and %d interest toggles, will retry",
+                    len(batch.votes),
+                    len(batch.interests),
+                )
+                with self._lock:
+                    batch.merge(self._pending)
+                    self._pending = batch
+                    self._in_flight = _Batch()
+                return
+
+        response_cache.invalidate(
+            *(post_tag(post_id) for post_id in comment_posts),
+            *(post_tag(post_id) for post_id in interest_posts),
+            *(card_tag(post_id) for post_id in interest_posts),
+            *((HOT_PAGES,) if interest_posts else ()),
+        )
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await run_in_threadpool(self.flush)
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await run_in_threadpool(self.flush)
+
+
+write_behind = WriteBehind(VOTES_FLUSH_INTERVAL) if VOTES_FLUSH_INTERVAL > 0 else None
+
+
+async def start():
+    if write_behind is not None:
+        write_behind.start()
+
+
+async def stop():
+    if write_behind is not None:
+        await write_behind.stop()
+
+
+def cast_vote(db: Session, comment_id: int, user_id: int, is_upvote: bool) -> Optional[dict]:
+    """
+    Record user_id's vote on a comment. Returns the comment as a
+    CommentWithScore payload with its new score, or None if there's no such
+    comment.
+    """
+    if write_behind is not None:
+        return write_behind.vote(db, comment_id, user_id, is_upvote)
+    return _vote_now(db, comment_id, user_id, is_upvote)
+
+
+def toggle_interest(db: Session, post_id: int, user_id: int) -> Optional[int]:
+    """
+    Add or remove user_id's interest in a post. Returns the post's new
+    interest count, or None if there's no such post.
+    """
+    if write_behind is not None:
+        return write_behind.toggle_interest(db, post_id, user_id)
+    return _toggle_now(db, post_id, user_id)
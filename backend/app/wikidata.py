@@ -0,0 +1,124 @@
+import asyncio
+import os
+import time
+from typing import Optional
+
+import httpx
+
+from app.cache import TTLCache
+from app.metrics import observe_upstream
+
+# Point this at a local stub to run tests and benchmarks without the network
+WIKIDATA_API_URL = os.getenv("WIKIDATA_API_URL", "https://www.wikidata.org/w/api.php")
+WIKIDATA_TIMEOUT = float(os.getenv("WIKIDATA_TIMEOUT", 2.0))
+WIKIDATA_CACHE_SIZE = int(os.getenv("WIKIDATA_CACHE_SIZE", 1024))
+WIKIDATA_CACHE_TTL = float(os.getenv("WIKIDATA_CACHE_TTL", 3600))
+
+
+class WikidataError(Exception):
+    pass
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.split()).casefold()
+
+
+class WikidataClient:
+    """
+    Async proxy for Wikidata's wbsearchentities.
+
+    Shares one connection pool across requests, caches results per
+    normalized query, coalesces concurrent lookups of the same query into a
+    single upstream request, and falls back to a stale cached result when
+    the upstream errors or times out.
+    """
+
+    def __init__(
+        self,
+        base_url: str = WIKIDATA_API_URL,
+        timeout: float = WIKIDATA_TIMEOUT,
+        cache_size: int = WIKIDATA_CACHE_SIZE,
+        cache_ttl: float = WIKIDATA_CACHE_TTL,
+    ):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.cache = TTLCache(cache_size, cache_ttl)
+        self._inflight: dict = {}
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def search(self, query: str) -> list:
+        key = normalize_query(query)
+        if not key:
+            return []
+
+        cached, fresh = self.cache.get(key)
+        if fresh:
+            return cached
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+
+        try:
+            # shield so one cancelled caller doesn't cancel the shared lookup
+            return await asyncio.shield(task)
+        except WikidataError:
+            if cached is not None:
+                return cached
+            raise
+
+    def _forget(self, key: str, task: asyncio.Future):
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # mark retrieved even if every caller went away
+
+    async def _fetch(self, key: str) -> list:
+        started = time.perf_counter()
+        try:
+            response = await self.client.get(
+                self.base_url,
+                params={
+                    "action": "wbsearchentities",
+                    "language": "en",
+                    "format": "json",
+                    "search": key,
+                },
+            )
+        except httpx.HTTPError as e:
+            observe_upstream("wikidata", type(e).__name__, time.perf_counter() - started)
+            raise WikidataError(str(e)) from e
+        observe_upstream(
+            "wikidata", str(response.status_code), time.perf_counter() - started
+        )
+        if response.status_code != 200:
+            raise WikidataError(f"Wikidata returned {response.status_code}")
+
+        # An error page served with a 200 is an upstream failure too
+        try:
+            result = [
+                {"label": item["label"], "description": item.get("description", "")}
+                for item in response.json().get("search", [])
+            ]
+        except (ValueError, AttributeError, KeyError, TypeError) as e:
+            raise WikidataError(f"Unexpected Wikidata response: {e!r}") from e
+        self.cache.set(key, result)
+        return result
+
+
+wikidata = WikidataClient()
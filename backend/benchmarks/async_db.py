@@ -0,0 +1,124 @@
+"""
+Compare the async read path against the old sync-session-in-threadpool
+model under concurrent load.
+
+Both endpoints run the same two queries (a page of posts joined with their
+creators, then their tags) and the same serialization; the only difference
+is AsyncSession on the event loop vs. Session in FastAPI's threadpool.
+Requests go through the ASGI app in-process, so the numbers compare the two
+models against each other rather than measuring the deployed server.
+
+Run from backend/:
+
+    python -m benchmarks.async_db --posts 5000 --concurrency 64 --requests 3000
+
+Uses a throwaway SQLite database unless DATABASE_URL is set.
+"""
+
+import argparse
+import asyncio
+
+from benchmarks.common import asgi_client, load, setup_environment, token_for
+
+
+def seed(count: int) -> str:
+    """
+    Create a user with count posts and return a bearer token for them.
+    """
+    from app import utils
+    from app.bulk_import import import_posts
+    from app.database import SessionLocal
+    from app.models import User
+
+    with SessionLocal() as db:
+        user = db.query(User).filter(User.username == "bench").first()
+        if user is None:
+            user = User(username="bench", hashed_password=utils.hash_password("bench"))
+            db.add(user)
+            db.commit()
+        records = (
+            (
+                i,
+                {
+                    "title": f"Object {i}",
+                    "description": "A benchmark object " * 5,
+                    "material": "metal",
+                    "length": i % 50,
+                    "tags": [f"tag{i % 40}", f"tag{i % 7}"],
+                },
+            )
+            for i in range(count)
+        )
+        import_posts(db, records, user.id)
+    return token_for("bench")
+
+
+def add_sync_endpoint(app):
+    """
+    Mount the sync-session equivalent of GET /posts at /bench/sync/posts.
+    """
+    from fastapi import Depends, Query
+    from sqlalchemy.orm import Session
+
+    from app.database import get_db
+    from app.models import Post
+    from app.routers.post import (
+        group_tags,
+        post_rows_statement,
+        serialize_post,
+        tags_for_posts_statement,
+    )
+    from app.schemas import PostPage
+    from app.utils import get_current_user
+
+    @app.get(
+        "/bench/sync/posts",
+        response_model=PostPage,
+        dependencies=[Depends(get_current_user)],
+    )
+    def sync_posts(limit: int = Query(20), db: Session = Depends(get_db)):
+        rows = db.execute(
+            post_rows_statement().order_by(Post.id).limit(limit + 1)
+        ).all()[:limit]
+        post_ids = [row.id for row in rows]
+        tags = group_tags(post_ids, db.execute(tags_for_posts_statement(post_ids)).all())
+        items = [serialize_post(row, tags[row.id]) for row in rows]
+        return {"items": items, "next_cursor": None}
+
+
+async def run(args):
+    from app.main import app
+
+    token = seed(args.posts)
+    add_sync_endpoint(app)
+    headers = {"Authorization": f"Bearer {token}"}
+    async with asgi_client(app) as client:
+        scenarios = {
+            "sync (threadpool)": f"/bench/sync/posts?limit={args.limit}",
+            "async": f"/posts?limit={args.limit}",
+        }
+        for path in scenarios.values():  # warm up connections and caches
+            await load(client, path, headers, args.concurrency, args.concurrency)
+        print(f"{'model':<20}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+        for name, path in scenarios.items():
+            result = await load(client, path, headers, args.requests, args.concurrency)
+            print(
+                f"{name:<20}{result['rps']:>10.0f}"
+                f"{result['p50_ms']:>10.1f}{result['p99_ms']:>10.1f}"
+            )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--posts", type=int, default=2000)
+    parser.add_argument("--limit", type=int, default=20, help="page size")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args(argv)
+
+    setup_environment()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
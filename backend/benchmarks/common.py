@@ -0,0 +1,90 @@
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, List, Union
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_environment(database_url: str = None, response_cache: bool = True):
+    """
+    Point the app at database_url, DATABASE_URL, or else a throwaway SQLite
+    database, and make the app importable. Without response_cache, rendered
+    responses are never cached, so every request runs its queries. Must run
+    before importing app.
+    """
+    if database_url:
+        os.environ["DATABASE_URL"] = database_url
+    if not response_cache:
+        os.environ["RESPONSE_CACHE_MAX_BYTES"] = "0"
+    if not os.getenv("DATABASE_URL"):
+        workdir = tempfile.mkdtemp(prefix="swe573-bench-")
+        os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/bench.db"
+        os.chdir(workdir)
+    os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-benchmark-secret")
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+
+
+def token_for(username: str) -> str:
+    from app import utils
+
+    return utils.create_access_token(
+        {"sub": username}, utils.SECRET_KEY, utils.ALGORITHM, 60
+    )
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    index = max(int(round(len(sorted_values) * fraction)) - 1, 0)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+def summarize(latencies: List[float], elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+async def load(
+    client,
+    paths: Union[str, Callable[[int], str]],
+    headers: dict,
+    total: int,
+    concurrency: int,
+) -> dict:
+    """
+    Issue total GETs from concurrency workers and summarize their latency.
+    paths is a path, or a function from request number to path for mixes.
+    """
+    path_for = paths if callable(paths) else (lambda _: paths)
+    latencies = []
+    remaining = iter(range(total))
+
+    async def worker():
+        for n in remaining:
+            started = time.perf_counter()
+            response = await client.get(path_for(n), headers=headers)
+            latencies.append(time.perf_counter() - started)
+            response.raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def asgi_client(app):
+    import logging
+
+    import httpx
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    transport = httpx.ASGITransport(app=app)
+    return httpx.AsyncClient(transport=transport, base_url="http://bench")
@@ -0,0 +1,239 @@
+"""
+Seed a database with a synthetic, reproducible dataset.
+
+Popularity is skewed the way real catalogs are: a few tags are on most
+posts, a few posts collect most of the interest, and a few posts have very
+long comment threads. Counters, hot scores and the search index are
+brought up to date the same way the app would, through app.reconcile and
+app.search.
+
+Run from backend/:
+
+    python -m benchmarks.dataset --database-url sqlite:///bench.db --posts 20000
+"""
+
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from itertools import islice
+
+from benchmarks.common import setup_environment
+
+MATERIALS = ["metal", "wood", "plastic", "glass", "ceramic", "stone", "fabric", "bone"]
+COLORS = ["red", "green", "blue", "black", "white", "brown", "gray", "gold", "silver"]
+SHAPES = ["round", "square", "oval", "flat", "cylindrical", "irregular", "triangular"]
+ORIGINS = ["turkey", "germany", "japan", "brazil", "egypt", "india", "unknown"]
+WORDS = (
+    "old small heavy shiny rusty carved engraved broken antique handmade "
+    "strange tiny metal wooden hollow sharp smooth rough painted marked"
+).split()
+
+INSERT_CHUNK = 5000
+
+
+def chunks(rows, size=INSERT_CHUNK):
+    iterator = iter(rows)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def skewed_weights(rng: random.Random, count: int, alpha: float) -> list:
+    """
+    Power-law weights: a handful of items get most of the mass.
+    """
+    return [rng.paretovariate(alpha) for _ in range(count)]
+
+
+def unique_pairs(rng, left, right_weights, total, right):
+    """
+    Sample up to total distinct (left, right) pairs, right drawn with skew.
+    """
+    pairs = set()
+    attempts = 0
+    while len(pairs) < total and attempts < total * 5:
+        batch = rng.choices(right, weights=right_weights, k=min(total, 10000))
+        for item in batch:
+            pairs.add((rng.choice(left), item))
+        attempts += len(batch)
+    return list(pairs)[:total]
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def generate(args):
+    from sqlalchemy import insert
+
+    from app import utils
+    from app.database import SessionLocal, engine
+    from app.models import (
+        Comment,
+        CommentVote,
+        Post,
+        PostInterest,
+        Tag,
+        User,
+        post_tag_table,
+    )
+    from app.ranking import hot_score
+    from app.reconcile import (
+        reconcile_comment_counts,
+        reconcile_comment_votes,
+        reconcile_interest_counts,
+        reconcile_tag_stats,
+    )
+    from app.search import setup_search_index
+
+    rng = random.Random(args.seed)
+    now = datetime.utcnow()
+    started = time.perf_counter()
+
+    def insert_all(db, target, rows):
+        for chunk in chunks(rows):
+            db.execute(insert(target), chunk)
+
+    with SessionLocal() as db:
+        password = utils.hash_password("bench")
+        insert_all(
+            db,
+            User,
+            ({"username": f"user{i}", "hashed_password": password} for i in range(args.users)),
+        )
+        user_ids = [row[0] for row in db.query(User.id).order_by(User.id)]
+
+        insert_all(
+            db,
+            Tag,
+            (
+                {
+                    "label": f"tag{i}",
+                    "wikidata_url": f"https://www.wikidata.org/wiki/Q{1000 + i}",
+                    "description": sentence(rng, 6),
+                }
+                for i in range(args.tags)
+            ),
+        )
+        tag_ids = [row[0] for row in db.query(Tag.id).order_by(Tag.id)]
+
+        def post_rows():
+            for i in range(args.posts):
+                created_at = now - timedelta(seconds=rng.uniform(0, args.days * 86400))
+                yield {
+                    "title": f"{sentence(rng, 3)} object {i}",
+                    "description": sentence(rng, rng.randint(10, 60)),
+                    "material": rng.choice(MATERIALS),
+                    "color": rng.choice(COLORS),
+                    "shape": rng.choice(SHAPES),
+                    "origin": rng.choice(ORIGINS),
+                    "location": rng.choice(ORIGINS),
+                    "length": round(rng.lognormvariate(1.5, 0.8), 1),
+                    "width": round(rng.lognormvariate(1.2, 0.8), 1),
+                    "height": round(rng.lognormvariate(0.8, 0.8), 1),
+                    "weight": round(rng.lognormvariate(3, 1.2), 1),
+                    "owner_id": rng.choice(user_ids),
+                    "created_at": created_at,
+                    "interest_count": 0,
+                    "hot_score": hot_score(0, created_at),
+                }
+
+        insert_all(db, Post, post_rows())
+        post_ids = [row[0] for row in db.query(Post.id).order_by(Post.id)]
+
+        tag_weights = skewed_weights(rng, len(tag_ids), 1.2)
+        links = set()
+        for post_id in post_ids:
+            for tag_id in rng.choices(tag_ids, weights=tag_weights, k=rng.randint(1, 5)):
+                links.add((post_id, tag_id))
+        insert_all(
+            db,
+            post_tag_table,
+            ({"post_id": post_id, "tag_id": tag_id} for post_id, tag_id in links),
+        )
+
+        post_weights = skewed_weights(rng, len(post_ids), 1.1)
+        interests = unique_pairs(rng, user_ids, post_weights, args.interests, post_ids)
+        insert_all(
+            db,
+            PostInterest,
+            ({"user_id": user_id, "post_id": post_id} for user_id, post_id in interests),
+        )
+
+        # Threads are even more skewed than interest: a few posts get
+        # thousands of comments
+        thread_weights = skewed_weights(rng, len(post_ids), 0.8)
+        insert_all(
+            db,
+            Comment,
+            (
+                {
+                    "post_id": post_id,
+                    "user_id": rng.choice(user_ids),
+                    "content": sentence(rng, rng.randint(3, 30)),
+                    "created_at": now - timedelta(seconds=rng.uniform(0, args.days * 86400)),
+                }
+                for post_id in rng.choices(post_ids, weights=thread_weights, k=args.comments)
+            ),
+        )
+        comment_ids = [row[0] for row in db.query(Comment.id).order_by(Comment.id)]
+
+        if comment_ids:
+            comment_weights = skewed_weights(rng, len(comment_ids), 1.1)
+            votes = unique_pairs(rng, user_ids, comment_weights, args.votes, comment_ids)
+            insert_all(
+                db,
+                CommentVote,
+                (
+                    {
+                        "user_id": user_id,
+                        "comment_id": comment_id,
+                        "is_upvote": rng.random() < 0.75,
+                    }
+                    for user_id, comment_id in votes
+                ),
+            )
+
+        reconcile_comment_votes(db)
+        reconcile_interest_counts(db)
+        reconcile_comment_counts(db)
+        reconcile_tag_stats(db)
+        db.commit()
+
+    setup_search_index(engine)
+    print(
+        f"Seeded {args.users} users, {args.posts} posts, {args.tags} tags, "
+        f"{args.comments} comments, {args.votes} votes and {args.interests} interests "
+        f"in {time.perf_counter() - started:.1f}s"
+    )
+
+
+def add_arguments(parser):
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--posts", type=int, default=5000)
+    parser.add_argument("--tags", type=int, default=300)
+    parser.add_argument("--comments", type=int, default=20000)
+    parser.add_argument("--votes", type=int, default=40000)
+    parser.add_argument("--interests", type=int, default=20000)
+    parser.add_argument("--days", type=int, default=90, help="spread of created_at")
+    parser.add_argument("--seed", type=int, default=573)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Seed a synthetic dataset")
+    parser.add_argument("--database-url", help="default: DATABASE_URL")
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+    if not (args.database_url or os.getenv("DATABASE_URL")):
+        parser.error("pass --database-url or set DATABASE_URL")
+
+    setup_environment(args.database_url)
+    generate(args)
+
+
+if __name__ == "__main__":
+    main()
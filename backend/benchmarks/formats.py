@@ -0,0 +1,143 @@
+"""
+Bytes on the wire and CPU time per response representation and content
+coding, for the pages of the read endpoints.
+
+Each page is fetched once through the app in-process, then encoded as JSON,
+columnar JSON and MessagePack (see app.negotiation), and each body is
+compressed with gzip and brotli at a few levels, the defaults marked with
+"*". Times are process CPU time per body, best of --repeat runs.
+
+Run from backend/:
+
+    python -m benchmarks.formats --posts 2000
+"""
+
+import argparse
+import asyncio
+import gzip
+import time
+
+from benchmarks import dataset
+from benchmarks.common import asgi_client, setup_environment, token_for
+
+GZIP_LEVELS = (1, 5, 6, 9)
+BROTLI_QUALITIES = (1, 4, 5, 6, 11)
+
+
+def pages(db) -> dict:
+    from sqlalchemy import func
+
+    from app.models import Comment, Post
+
+    longest_thread = (
+        db.query(Comment.post_id)
+        .group_by(Comment.post_id)
+        .order_by(func.count(Comment.id).desc())
+        .limit(1)
+        .scalar()
+    ) or db.query(func.min(Post.id)).scalar()
+    return {
+        "posts (20)": "/posts?limit=20",
+        "posts (100)": "/posts?limit=100",
+        "posts card (100)": "/posts?limit=100&fields=card",
+        "posts_hot (20)": "/posts/hot?limit=20",
+        "post_detail": f"/posts/{longest_thread}",
+    }
+
+
+async def fetch(paths: dict, headers: dict) -> dict:
+    import orjson
+
+    from app.main import app
+
+    payloads = {}
+    async with asgi_client(app) as client:
+        for name, path in paths.items():
+            response = await client.get(
+                path, headers={**headers, "Accept-Encoding": "identity"}
+            )
+            response.raise_for_status()
+            payloads[name] = orjson.loads(response.content)
+    return payloads
+
+
+def cpu_time(function, repeat: int) -> float:
+    """
+    Best CPU seconds of one call of function, over repeat runs.
+    """
+    # Enough calls per run for the clock's resolution
+    calls = 1
+    while True:
+        started = time.process_time()
+        for _ in range(calls):
+            function()
+        if time.process_time() - started > 0.01:
+            break
+        calls *= 4
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.process_time()
+        for _ in range(calls):
+            function()
+        best = min(best, (time.process_time() - started) / calls)
+    return best
+
+
+def codings():
+    import brotli
+
+    from app import negotiation
+
+    yield "identity", lambda body: body, False
+    for level in GZIP_LEVELS:
+        yield (
+            f"gzip {level}",
+            lambda body, level=level: gzip.compress(body, compresslevel=level, mtime=0),
+            level == negotiation.GZIP_LEVEL,
+        )
+    for quality in BROTLI_QUALITIES:
+        yield (
+            f"br {quality}",
+            lambda body, quality=quality: brotli.compress(body, quality=quality),
+            quality == negotiation.BROTLI_QUALITY,
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Response size and CPU by format")
+    parser.add_argument("--repeat", type=int, default=5)
+    dataset.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    setup_environment()
+    dataset.generate(args)
+
+    from app.database import SessionLocal
+    from app.models import User
+    from app.negotiation import COLUMNAR, JSON, MSGPACK, encode
+
+    with SessionLocal() as db:
+        username = db.query(User.username).order_by(User.id).limit(1).scalar()
+        paths = pages(db)
+    headers = {"Authorization": f"Bearer {token_for(username)}"}
+    payloads = asyncio.run(fetch(paths, headers))
+
+    print(f"{'page':<18}{'format':<10}{'coding':<10}{'bytes':>9}{'encode':>11}{'compress':>11}")
+    for name, payload in payloads.items():
+        for format in (JSON, COLUMNAR, MSGPACK):
+            body = encode(payload, format)
+            encode_us = cpu_time(lambda: encode(payload, format), args.repeat) * 1e6
+            for coding, compress, default in codings():
+                compressed = compress(body)
+                compress_us = (
+                    cpu_time(lambda: compress(body), args.repeat) * 1e6 if compressed is not body else 0.0
+                )
+                print(
+                    f"{name:<18}{format:<10}{coding + ('*' if default else ''):<10}"
+                    f"{len(compressed):>9}{encode_us:>9.0f}us{compress_us:>9.0f}us"
+                )
+        print()
+
+
+if __name__ == "__main__":
+    main()
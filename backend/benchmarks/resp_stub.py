@@ -0,0 +1,346 @@
+"""
+A small in-memory server speaking the Redis protocol (RESP2, and RESP3
+after HELLO 3), enough of it
+for the redis:// response cache store: strings with expiry, sets, INCR,
+WATCH / MULTI / EXEC and SCAN. A stand-in for benchmarks and tests on
+machines without Redis; single process, nothing persisted.
+
+Run from backend/:
+
+    python -m benchmarks.resp_stub --port 6390
+
+and point the app at it with RESPONSE_CACHE_URL=redis://127.0.0.1:6390/0.
+"""
+
+import argparse
+import asyncio
+import fnmatch
+import time
+from typing import Dict, List, Optional
+
+
+class ProtocolError(Exception):
+    pass
+
+
+class CommandError(Exception):
+    pass
+
+
+class Status(bytes):
+    """A simple string reply, as opposed to a bulk string."""
+
+
+OK = Status(b"OK")
+QUEUED = Status(b"QUEUED")
+
+
+class Map(dict):
+    """A RESP3 map reply."""
+
+
+def encode(value, protocol: int = 2) -> bytes:
+    if value is None:
+        return b"_\r\n" if protocol == 3 else b"$-1\r\n"
+    if isinstance(value, Status):
+        return b"+" + value + b"\r\n"
+    if isinstance(value, CommandError):
+        return b"-ERR " + str(value).encode() + b"\r\n"
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, bytes):
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+    if isinstance(value, Map):
+        if protocol == 2:
+            return encode([item for pair in value.items() for item in pair])
+        return b"%%%d\r\n" % len(value) + b"".join(
+            encode(key, protocol) + encode(item, protocol) for key, item in value.items()
+        )
+    if isinstance(value, (list, tuple, set)):
+        return b"*%d\r\n" % len(value) + b"".join(encode(item, protocol) for item in value)
+    raise TypeError(type(value))
+
+
+class Store:
+    def __init__(self):
+        self.data: Dict[bytes, object] = {}
+        self.expires: Dict[bytes, float] = {}
+        # Bumped on every change to a key, for WATCH
+        self.revisions: Dict[bytes, int] = {}
+
+    def _touch(self, key: bytes):
+        self.revisions[key] = self.revisions.get(key, 0) + 1
+
+    def lookup(self, key: bytes):
+        expires = self.expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self.delete(key)
+        return self.data.get(key)
+
+    def delete(self, key: bytes) -> int:
+        self.expires.pop(key, None)
+        if self.data.pop(key, None) is None:
+            return 0
+        self._touch(key)
+        return 1
+
+    def store(self, key: bytes, value, ttl: Optional[float] = None):
+        self.data[key] = value
+        if ttl is None:
+            self.expires.pop(key, None)
+        else:
+            self.expires[key] = time.monotonic() + ttl
+        self._touch(key)
+
+    def revision(self, key: bytes) -> int:
+        self.lookup(key)
+        return self.revisions.get(key, 0)
+
+    def live_keys(self) -> List[bytes]:
+        return [key for key in list(self.data) if self.lookup(key) is not None]
+
+
+class Connection:
+    def __init__(self, store: Store):
+        self.store = store
+        self.watched: Dict[bytes, int] = {}
+        self.queued: Optional[List[list]] = None
+        self.protocol = 2
+
+    def execute(self, args: List[bytes]):
+        name = args[0].upper().decode()
+        if self.queued is not None and name not in ("EXEC", "DISCARD", "MULTI", "WATCH"):
+            self.queued.append(args)
+            return QUEUED
+        handler = getattr(self, "cmd_" + name.replace(" ", "_"), None)
+        if handler is None:
+            return CommandError(f"unknown command '{name}'")
+        try:
+            return handler(*args[1:])
+        except TypeError:
+            return CommandError(f"wrong number of arguments for '{name}'")
+        except CommandError as error:
+            return error
+
+    # Connection
+    def cmd_PING(self, message=None):
+        return OK if message is None else message
+
+    def cmd_HELLO(self, protocol=b"2", *options):
+        if protocol not in (b"2", b"3"):
+            raise CommandError("unsupported protocol version")
+        self.protocol = int(protocol)
+        return Map(
+            {
+                b"server": b"resp_stub",
+                b"version": b"7.0.0",
+                b"proto": self.protocol,
+                b"id": id(self),
+                b"mode": b"standalone",
+                b"role": b"master",
+                b"modules": [],
+            }
+        )
+
+    def cmd_ECHO(self, message):
+        return message
+
+    def cmd_SELECT(self, index):
+        return OK
+
+    def cmd_CLIENT(self, *args):
+        return OK
+
+    # Strings
+    def _string(self, key):
+        value = self.store.lookup(key)
+        if value is not None and not isinstance(value, bytes):
+            raise CommandError("WRONGTYPE")
+        return value
+
+    def cmd_GET(self, key):
+        return self._string(key)
+
+    def cmd_SET(self, key, value, *options):
+        ttl = None
+        options = [option.upper() for option in options]
+        for position, option in enumerate(options):
+            if option == b"PX":
+                ttl = int(options[position + 1]) / 1000
+            elif option == b"EX":
+                ttl = int(options[position + 1])
+        if b"NX" in options and self.store.lookup(key) is not None:
+            return None
+        if b"XX" in options and self.store.lookup(key) is None:
+            return None
+        self.store.store(key, value, ttl)
+        return OK
+
+    def cmd_INCR(self, key):
+        return self.cmd_INCRBY(key, b"1")
+
+    def cmd_INCRBY(self, key, amount):
+        value = int(self._string(key) or 0) + int(amount)
+        ttl = self.store.expires.get(key)
+        self.store.store(key, str(value).encode(), None if ttl is None else ttl - time.monotonic())
+        return value
+
+    # Keys
+    def cmd_DEL(self, *keys):
+        return sum(self.store.delete(key) for key in keys)
+
+    cmd_UNLINK = cmd_DEL
+
+    def cmd_EXISTS(self, *keys):
+        return sum(self.store.lookup(key) is not None for key in keys)
+
+    def cmd_PEXPIRE(self, key, milliseconds):
+        if self.store.lookup(key) is None:
+            return 0
+        self.store.expires[key] = time.monotonic() + int(milliseconds) / 1000
+        return 1
+
+    def cmd_EXPIRE(self, key, seconds):
+        return self.cmd_PEXPIRE(key, str(int(seconds) * 1000).encode())
+
+    def cmd_KEYS(self, pattern):
+        return [key for key in self.store.live_keys() if fnmatch.fnmatchcase(key, pattern)]
+
+    def cmd_SCAN(self, cursor, *options):
+        # Everything in one go
+        pattern = b"*"
+        for position, option in enumerate(options):
+            if option.upper() == b"MATCH":
+                pattern = options[position + 1]
+        return [b"0", self.cmd_KEYS(pattern)]
+
+    def cmd_DBSIZE(self):
+        return len(self.store.live_keys())
+
+    def cmd_FLUSHDB(self, *options):
+        for key in list(self.store.data):
+            self.store.delete(key)
+        return OK
+
+    cmd_FLUSHALL = cmd_FLUSHDB
+
+    # Sets
+    def _set(self, key):
+        value = self.store.lookup(key)
+        if value is not None and not isinstance(value, set):
+            raise CommandError("WRONGTYPE")
+        return value
+
+    def cmd_SADD(self, key, *members):
+        members_set = self._set(key)
+        if members_set is None:
+            members_set = set()
+            self.store.store(key, members_set)
+        else:
+            self.store._touch(key)
+        added = len(set(members) - members_set)
+        members_set.update(members)
+        return added
+
+    def cmd_SMEMBERS(self, key):
+        return list(self._set(key) or ())
+
+    def cmd_SCARD(self, key):
+        return len(self._set(key) or ())
+
+    # Transactions
+    def cmd_WATCH(self, *keys):
+        if self.queued is not None:
+            raise CommandError("WATCH inside MULTI is not allowed")
+        for key in keys:
+            self.watched[key] = self.store.revision(key)
+        return OK
+
+    def cmd_UNWATCH(self):
+        self.watched.clear()
+        return OK
+
+    def cmd_MULTI(self):
+        if self.queued is not None:
+            raise CommandError("MULTI calls can not be nested")
+        self.queued = []
+        return OK
+
+    def cmd_DISCARD(self):
+        if self.queued is None:
+            raise CommandError("DISCARD without MULTI")
+        self.queued = None
+        self.watched.clear()
+        return OK
+
+    def cmd_EXEC(self):
+        if self.queued is None:
+            raise CommandError("EXEC without MULTI")
+        queued, self.queued = self.queued, None
+        watched, self.watched = self.watched, {}
+        if any(self.store.revision(key) != revision for key, revision in watched.items()):
+            return None
+        return [self.execute(args) for args in queued]
+
+
+async def read_command(reader: asyncio.StreamReader) -> Optional[List[bytes]]:
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        # Inline command
+        return line.split()
+    args = []
+    for _ in range(int(line[1:])):
+        header = await reader.readline()
+        if not header.startswith(b"$"):
+            raise ProtocolError(header)
+        length = int(header[1:])
+        args.append((await reader.readexactly(length + 2))[:-2])
+    return args
+
+
+def serve(store: Store):
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        connection = Connection(store)
+        try:
+            while True:
+                args = await read_command(reader)
+                if args is None:
+                    break
+                if not args:
+                    continue
+                writer.write(encode(connection.execute(args), connection.protocol))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ProtocolError):
+            pass
+        finally:
+            writer.close()
+
+    return handle
+
+
+async def start_server(host: str = "127.0.0.1", port: int = 6390) -> asyncio.AbstractServer:
+    return await asyncio.start_server(serve(Store()), host, port)
+
+
+async def main_async(args):
+    server = await start_server(args.host, args.port)
+    print(f"Serving RESP on {args.host}:{args.port}", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="In-memory Redis protocol stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(main_async(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
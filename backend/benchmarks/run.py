@@ -0,0 +1,178 @@
+"""
+Per-endpoint benchmarks and a concurrent load scenario through the ASGI app
+in-process, with a JSON results file and regression checks.
+
+Run from backend/:
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --compare results.json --threshold 0.2
+
+Without DATABASE_URL (or --database-url) a throwaway SQLite database is
+seeded with benchmarks.dataset first; pass --no-seed to benchmark an
+already seeded database. With --compare, exits non-zero when a tracked
+endpoint's p50 latency or the load scenario's throughput regresses by more
+than the threshold.
+
+The response cache is off unless --response-cache is passed: with it, most
+requests are cache hits and the numbers stop tracking the queries and
+serialization behind each endpoint. Compare runs made the same way.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+
+from benchmarks import dataset
+from benchmarks.common import asgi_client, load, setup_environment, token_for
+
+
+def tracked_endpoints(db) -> dict:
+    """
+    name -> path for every tracked endpoint, picking ids and terms that
+    exist in the seeded data.
+    """
+    from sqlalchemy import func
+
+    from app.models import Comment, Post
+
+    first_post = db.query(func.min(Post.id)).scalar()
+    longest_thread = (
+        db.query(Comment.post_id)
+        .group_by(Comment.post_id)
+        .order_by(func.count(Comment.id).desc())
+        .limit(1)
+        .scalar()
+    ) or first_post
+    return {
+        "posts": "/posts?limit=20",
+        "posts_by_title": "/posts?limit=20&sort=-title",
+        "posts_hot": "/posts/hot?limit=20",
+        "posts_search": "/posts/search?query=antique%20metal&limit=20",
+        "post_detail": f"/posts/{first_post}",
+        "post_detail_long_thread": f"/posts/{longest_thread}",
+    }
+
+
+async def run(args) -> dict:
+    from app.database import SessionLocal
+    from app.main import app
+    from app.models import User
+
+    with SessionLocal() as db:
+        username = db.query(User.username).order_by(User.id).limit(1).scalar()
+        endpoints = tracked_endpoints(db)
+    headers = {"Authorization": f"Bearer {token_for(username)}"}
+
+    results = {"endpoints": {}, "load": {}}
+    async with asgi_client(app) as client:
+        for name, path in endpoints.items():
+            await load(client, path, headers, args.warmup, 1)
+            results["endpoints"][name] = await load(
+                client, path, headers, args.iterations, 1
+            )
+            print(f"{name:<26}" + format_row(results["endpoints"][name]))
+
+        # Mixed read traffic at the configured concurrency
+        mix = list(endpoints.values())
+        results["load"] = await load(
+            client,
+            lambda n: mix[n % len(mix)],
+            headers,
+            args.load_requests,
+            args.concurrency,
+        )
+        print(f"{'load (mixed)':<26}" + format_row(results["load"]))
+    return results
+
+
+def format_row(result: dict) -> str:
+    return (
+        f"{result['rps']:>9.0f} req/s"
+        f"{result['p50_ms']:>9.1f}{result['p95_ms']:>9.1f}{result['p99_ms']:>9.1f} ms"
+    )
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """
+    Return a description of every regression beyond threshold.
+    """
+    regressions = []
+    for name, before in baseline.get("endpoints", {}).items():
+        after = current["endpoints"].get(name)
+        if after and after["p50_ms"] > before["p50_ms"] * (1 + threshold):
+            regressions.append(
+                f"{name}: p50 {before['p50_ms']:.1f} -> {after['p50_ms']:.1f} ms"
+            )
+    before, after = baseline.get("load"), current.get("load")
+    if before and after and after["rps"] < before["rps"] * (1 - threshold):
+        regressions.append(f"load: {before['rps']:.0f} -> {after['rps']:.0f} req/s")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the read endpoints")
+    parser.add_argument("--database-url", help="default: DATABASE_URL or a temp SQLite file")
+    parser.add_argument("--no-seed", action="store_true", help="use the existing data")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--load-requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="baseline JSON results to check against")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument(
+        "--response-cache",
+        action="store_true",
+        help="serve repeated requests from the response cache (warm runs)",
+    )
+    dataset.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    output = os.path.abspath(args.output) if args.output else None
+
+    setup_environment(args.database_url, response_cache=args.response_cache)
+    if not args.no_seed:
+        dataset.generate(args)
+
+    print(f"{'endpoint':<26}{'throughput':>15}{'p50':>9}{'p95':>9}{'p99':>9}")
+    results = asyncio.run(run(args))
+    results["meta"] = {
+        "timestamp": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "database": os.environ["DATABASE_URL"].split("://")[0],
+        "dataset": {
+            key: getattr(args, key)
+            for key in ("users", "posts", "tags", "comments", "votes", "interests", "seed")
+        },
+        "iterations": args.iterations,
+        "concurrency": args.concurrency,
+        "response_cache": args.response_cache,
+    }
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if baseline is not None:
+        cached = baseline.get("meta", {}).get("response_cache", False)
+        if cached != args.response_cache:
+            print(f"WARNING the baseline ran with the response cache {'on' if cached else 'off'}")
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""
+CPU time to turn a page of posts into a JSON body, per 1,000 posts.
+
+"before" is the list path as it was: full Post entities, dicts built from
+them, validated against PostPage and dumped by Pydantic. "after" is the
+current one: projected post card rows, dicts encoded with orjson as they
+are. Both run the same tag query. Times are process CPU time, best of
+--repeat runs, each in a fresh session.
+
+Run from backend/:
+
+    python -m benchmarks.serialization --posts 1000
+"""
+
+import argparse
+import time
+
+from benchmarks import dataset
+from benchmarks.common import setup_environment
+
+
+def before(db, limit: int) -> bytes:
+    from sqlalchemy import select
+
+    from app.models import Post, User
+    from app.routers.post import group_tags, tags_for_posts_statement
+    from app.schemas import PostPage
+
+    rows = db.execute(
+        select(Post, User.username.label("creator"))
+        .join(User, User.id == Post.owner_id)
+        .order_by(Post.id)
+        .limit(limit)
+    ).all()
+    post_ids = [post.id for post, _ in rows]
+    tags = group_tags(post_ids, db.execute(tags_for_posts_statement(post_ids)).all())
+    items = [
+        {
+            "id": post.id,
+            "title": post.title,
+            "description": post.description,
+            "image_url": post.image_url,
+            "thumbnail_url": post.thumbnail_url,
+            "preview_url": post.preview_url,
+            "material": post.material,
+            "length": post.length,
+            "width": post.width,
+            "height": post.height,
+            "color": post.color,
+            "shape": post.shape,
+            "weight": post.weight,
+            "location": post.location,
+            "smell": post.smell,
+            "taste": post.taste,
+            "origin": post.origin,
+            "resolved": False,
+            "creator": creator,
+            "interest_count": post.interest_count,
+            "tags": tags[post.id],
+        }
+        for post, creator in rows
+    ]
+    payload = {"items": items, "next_cursor": None}
+    return PostPage.model_validate(payload).model_dump_json().encode()
+
+
+def after(db, limit: int) -> bytes:
+    from app.models import Post
+    from app.routers.post import (
+        group_tags,
+        post_rows_statement,
+        serialize_post,
+        tags_for_posts_statement,
+    )
+    from app.serialization import dump_json
+
+    rows = db.execute(post_rows_statement().order_by(Post.id).limit(limit)).all()
+    post_ids = [row.id for row in rows]
+    tags = group_tags(post_ids, db.execute(tags_for_posts_statement(post_ids)).all())
+    items = [serialize_post(row, tags[row.id]) for row in rows]
+    return dump_json({"items": items, "next_cursor": None})
+
+
+def measure(path, limit: int, repeat: int) -> float:
+    """
+    Best CPU seconds of repeat runs of path.
+    """
+    from app.database import SessionLocal
+
+    best = float("inf")
+    for _ in range(repeat):
+        with SessionLocal() as db:
+            started = time.process_time()
+            path(db, limit)
+            best = min(best, time.process_time() - started)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serialization CPU time per 1,000 posts")
+    parser.add_argument("--repeat", type=int, default=20)
+    dataset.add_arguments(parser)
+    parser.set_defaults(posts=1000, comments=0, votes=0, interests=1000)
+    args = parser.parse_args(argv)
+
+    setup_environment()
+    dataset.generate(args)
+
+    import orjson
+
+    from app.database import SessionLocal
+
+    with SessionLocal() as db:
+        # Same content either way, whatever the encoder
+        assert orjson.loads(before(db, args.posts)) == orjson.loads(after(db, args.posts))
+
+    per_thousand = 1000 / args.posts
+    results = {
+        name: measure(path, args.posts, args.repeat) * per_thousand * 1000
+        for name, path in (("before", before), ("after", after))
+    }
+    for name, ms in results.items():
+        print(f"{name:<8}{ms:>8.1f} ms CPU per 1,000 posts")
+    print(f"speedup {results['before'] / results['after']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Throughput of the mixed read load against real uvicorn servers with a
+growing number of worker processes, to check that the service scales with
+cores once the response cache is shared.
+
+Run from backend/:
+
+    python -m benchmarks.workers --workers 1,2,4
+    python -m benchmarks.workers --cache-url file:///dev/shm/swe573-bench/cache.db
+
+Seeds a throwaway SQLite database (or uses DATABASE_URL with --no-seed),
+then for each worker count starts `uvicorn app.main:app --workers N` on a
+local port, replays the mix of benchmarks.run over HTTP and stops it. The
+load generator runs on the same host, so it competes with the workers for
+CPU: throughput can't grow past the cores left over, and a single-core
+host shows no scaling at all.
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from benchmarks import dataset
+from benchmarks.common import BACKEND_DIR, load, setup_environment, token_for
+from benchmarks.run import format_row, tracked_endpoints
+
+DEFAULT_CACHE_URL = "file:///dev/shm/swe573-bench/cache.db"
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def start_server(workers: int, port: int, cache_url: str) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        RESPONSE_CACHE_URL=cache_url,
+        LOG_LEVEL=os.getenv("LOG_LEVEL", "WARNING"),
+    )
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "app.main:app",
+            "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(workers), "--no-access-log",
+        ],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+
+
+async def wait_until_up(client, server: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with {server.returncode}")
+        try:
+            if (await client.get("/")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.25)
+    raise RuntimeError("uvicorn did not come up")
+
+
+async def measure(args, workers: int, mix: list, headers: dict) -> dict:
+    import httpx
+
+    port = free_port()
+    server = start_server(workers, port, args.cache_url)
+    limits = httpx.Limits(max_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=30
+        ) as client:
+            await wait_until_up(client, server)
+            # Every worker has to warm up its own caches and connections
+            await load(client, lambda n: mix[n % len(mix)], headers, args.warmup, args.concurrency)
+            return await load(
+                client,
+                lambda n: mix[n % len(mix)],
+                headers,
+                args.load_requests,
+                args.concurrency,
+            )
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark throughput by worker count")
+    parser.add_argument("--database-url", help="default: DATABASE_URL or a temp SQLite file")
+    parser.add_argument("--no-seed", action="store_true", help="use the existing data")
+    parser.add_argument(
+        "--workers",
+        default=",".join(str(n) for n in sorted({1, 2, os.cpu_count() or 1})),
+        help="comma-separated worker counts (default: 1, 2 and the CPU count)",
+    )
+    parser.add_argument(
+        "--cache-url",
+        default=DEFAULT_CACHE_URL,
+        help=f"RESPONSE_CACHE_URL of the servers (default {DEFAULT_CACHE_URL})",
+    )
+    parser.add_argument("--warmup", type=int, default=500)
+    parser.add_argument("--load-requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    dataset.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    setup_environment(args.database_url)
+    if not args.no_seed:
+        dataset.generate(args)
+
+    from app.database import SessionLocal
+    from app.models import User
+
+    with SessionLocal() as db:
+        username = db.query(User.username).order_by(User.id).limit(1).scalar()
+        mix = list(tracked_endpoints(db).values())
+    headers = {"Authorization": f"Bearer {token_for(username)}"}
+
+    print(f"{os.cpu_count()} CPUs, cache {args.cache_url}")
+    print(f"{'workers':<26}{'throughput':>15}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for workers in (int(n) for n in args.workers.split(",")):
+        result = asyncio.run(measure(args, workers, mix, headers))
+        print(f"{workers:<26}" + format_row(result))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""
+The app reads its configuration from the environment when imported, so it
+is pointed at a throwaway SQLite database here, before any test imports it.
+"""
+
+import itertools
+import os
+import sys
+import tempfile
+
+import pytest
+
+_workdir = tempfile.mkdtemp(prefix="swe573-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_workdir}/test.db"
+os.environ.setdefault("SECRET_KEY", "test-secret-key-" + "x" * 32)
+for name in (
+    "ASYNC_DATABASE_URL",
+    "DATABASE_REPLICA_URLS",
+    "EVENTS_BACKEND",
+    "PROMETHEUS_MULTIPROC_DIR",
+    "RESPONSE_CACHE_URL",
+    "VOTES_FLUSH_INTERVAL",
+):
+    os.environ.pop(name, None)
+# Uploaded images are written relative to the working directory
+os.chdir(_workdir)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.main import app  # noqa: E402
+from app.database import SessionLocal  # noqa: E402
+from app.models import Comment, Post, User  # noqa: E402
+
+_names = itertools.count()
+
+
+@pytest.fixture
+def db():
+    with SessionLocal() as session:
+        yield session
+
+
+@pytest.fixture
+def make_user(db):
+    def make_user() -> User:
+        user = User(username=f"user{next(_names)}", hashed_password="x")
+        db.add(user)
+        db.commit()
+        return user
+
+    return make_user
+
+
+@pytest.fixture
+def make_post(db, make_user):
+    def make_post(**fields) -> Post:
+        fields.setdefault("owner_id", make_user().id)
+        post = Post(title="Odd coin", description="Found in a drawer", **fields)
+        db.add(post)
+        db.commit()
+        return post
+
+    return make_post
+
+
+@pytest.fixture
+def make_comment(db, make_post, make_user):
+    def make_comment() -> Comment:
+        post = make_post()
+        comment = Comment(post_id=post.id, user_id=make_user().id, content="Looks Roman")
+        db.add(comment)
+        post.comment_count += 1
+        db.commit()
+        return comment
+
+    return make_comment
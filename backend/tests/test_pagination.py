@@ -0,0 +1,77 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select
+
+from app.database import AsyncSessionLocal, async_engine
+from app.models import Post
+from app.pagination import decode_cursor, encode_cursor, paginate
+
+
+def test_cursor_round_trip():
+    values = ["2024-05-01T12:00:00", 42, 1.5, None]
+    cursor = encode_cursor(values)
+    assert "=" not in cursor
+    assert decode_cursor(cursor, len(values)) == values
+
+
+def test_no_cursor():
+    assert decode_cursor(None, 2) is None
+    assert decode_cursor("", 2) is None
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    ["not base64!", encode_cursor([1]), encode_cursor([1, 2, 3])],
+)
+def test_invalid_cursor(cursor):
+    with pytest.raises(HTTPException) as raised:
+        decode_cursor(cursor, 2)
+    assert raised.value.status_code == 400
+
+
+def _walk(post_ids, limit):
+    """
+    Page through post_ids newest first, following the cursors.
+    """
+    columns = (Post.created_at, Post.id)
+
+    async def walk():
+        seen, cursor, pages = [], None, 0
+        async with AsyncSessionLocal() as db:
+            while True:
+                rows, cursor = await paginate(
+                    db,
+                    select(Post.id, Post.created_at).where(Post.id.in_(post_ids)),
+                    columns,
+                    cursor,
+                    limit,
+                    lambda row: [row.created_at.isoformat(), row.id],
+                    descending=True,
+                    parse_cursor=lambda values: [datetime.fromisoformat(values[0]), values[1]],
+                )
+                seen.extend(row.id for row in rows)
+                pages += 1
+                if cursor is None:
+                    break
+        # Its pooled connections belong to this event loop
+        await async_engine.dispose()
+        return seen, pages
+
+    return asyncio.run(walk())
+
+
+def test_keyset_pages_cover_every_row_once(make_post):
+    # Ties on created_at are broken by id
+    same_time = datetime(2024, 1, 1, 12, 0, 0)
+    posts = [make_post(created_at=same_time) for _ in range(5)]
+    posts += [make_post(created_at=datetime(2024, 1, 2, hour)) for hour in range(3)]
+    post_ids = [post.id for post in posts]
+
+    seen, pages = _walk(post_ids, limit=3)
+
+    assert pages == 3
+    expected = sorted(posts, key=lambda post: (post.created_at, post.id), reverse=True)
+    assert seen == [post.id for post in expected]
@@ -0,0 +1,101 @@
+from sqlalchemy import insert, select, update
+
+from app.models import (
+    Comment,
+    CommentVote,
+    Post,
+    PostInterest,
+    Tag,
+    TagCooccurrence,
+    post_tag_table,
+)
+from app.ranking import hot_score
+from app.reconcile import (
+    reconcile_comment_counts,
+    reconcile_comment_votes,
+    reconcile_interest_counts,
+    reconcile_tag_stats,
+)
+from app.votes import _toggle_now, _vote_now
+
+
+def test_comment_votes(db, make_comment, make_user):
+    comment = make_comment()
+    for is_upvote in (True, True, False):
+        _vote_now(db, comment.id, make_user().id, is_upvote)
+    db.execute(update(Comment).where(Comment.id == comment.id).values(upvotes=7, score=0))
+    db.commit()
+
+    assert reconcile_comment_votes(db) == 1
+    db.commit()
+
+    db.refresh(comment)
+    assert (comment.upvotes, comment.downvotes, comment.score) == (2, 1, 1)
+    assert reconcile_comment_votes(db) == 0
+
+
+def test_interest_counts(db, make_post, make_user):
+    post = make_post()
+    for _ in range(3):
+        _toggle_now(db, post.id, make_user().id)
+    db.execute(update(Post).where(Post.id == post.id).values(interest_count=0, hot_score=0))
+    db.commit()
+
+    assert reconcile_interest_counts(db) == 1
+    db.commit()
+
+    db.refresh(post)
+    assert post.interest_count == 3
+    assert post.hot_score == hot_score(3, post.created_at)
+    assert reconcile_interest_counts(db) == 0
+
+
+def test_interest_counts_rescore(db, make_post):
+    post = make_post()
+    db.execute(update(Post).where(Post.id == post.id).values(hot_score=-1))
+    db.commit()
+
+    assert reconcile_interest_counts(db) == 0
+    reconcile_interest_counts(db, rescore=True)
+    db.commit()
+
+    db.refresh(post)
+    assert post.hot_score == hot_score(0, post.created_at)
+
+
+def test_comment_counts(db, make_comment):
+    post_id = make_comment().post_id
+    db.execute(update(Post).where(Post.id == post_id).values(comment_count=5))
+    db.commit()
+
+    assert reconcile_comment_counts(db) == 1
+    db.commit()
+
+    assert db.scalar(select(Post.comment_count).where(Post.id == post_id)) == 1
+
+
+def test_tag_stats(db, make_post):
+    coin = Tag(label="test-coin", post_count=9)
+    silver = Tag(label="test-silver", post_count=0)
+    db.add_all([coin, silver])
+    db.flush()
+    for post in (make_post(), make_post()):
+        db.execute(
+            insert(post_tag_table),
+            [{"post_id": post.id, "tag_id": coin.id}, {"post_id": post.id, "tag_id": silver.id}],
+        )
+    db.commit()
+
+    assert reconcile_tag_stats(db) == 2
+    db.commit()
+
+    db.refresh(coin)
+    db.refresh(silver)
+    assert (coin.post_count, silver.post_count) == (2, 2)
+    together = db.scalar(
+        select(TagCooccurrence.post_count).where(
+            TagCooccurrence.tag_id == coin.id, TagCooccurrence.other_id == silver.id
+        )
+    )
+    assert together == 2
+    assert reconcile_tag_stats(db) == 0
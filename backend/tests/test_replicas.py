@@ -0,0 +1,102 @@
+import asyncio
+import os
+import sqlite3
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from app import database
+from app.database import AsyncSessionLocal, Replicas, async_engine, primary_reads
+from app.main import app
+
+PRIMARY = os.path.abspath(database.engine.url.database)
+
+
+def _copy(path):
+    with sqlite3.connect(PRIMARY) as source, sqlite3.connect(path) as target:
+        source.backup(target)
+    return f"sqlite:///{path}"
+
+
+def _use(monkeypatch, urls):
+    replicas = Replicas(urls)
+    monkeypatch.setattr(database, "replicas", replicas)
+    return replicas
+
+
+def _read_from(pin=False, under_primary_reads=False):
+    """
+    The database files a new async session reads from, twice in a row.
+    """
+
+    async def read():
+        async with AsyncSessionLocal() as db:
+            if pin:
+                db.sync_session.info["primary"] = True
+            files = []
+            for _ in range(2):
+                rows = (await db.execute(text("PRAGMA database_list"))).all()
+                files.append(os.path.abspath(rows[0].file))
+            return files
+
+    async def run():
+        try:
+            if under_primary_reads:
+                with primary_reads():
+                    return await read()
+            return await read()
+        finally:
+            await async_engine.dispose()
+            await database.replicas.stop()
+
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def two_replicas(tmp_path, monkeypatch):
+    paths = [str(tmp_path / "replica1.db"), str(tmp_path / "replica2.db")]
+    _use(monkeypatch, [_copy(path) for path in paths])
+    return paths
+
+
+def test_sessions_take_turns(two_replicas):
+    reads = [_read_from() for _ in range(4)]
+
+    # A session keeps the replica it started on
+    assert all(first == second for first, second in reads)
+    assert [first for first, _ in reads] == two_replicas * 2
+
+
+def test_pinned_session_reads_primary(two_replicas):
+    assert _read_from(pin=True) == [PRIMARY, PRIMARY]
+
+
+def test_primary_reads_read_primary(two_replicas):
+    assert _read_from(under_primary_reads=True) == [PRIMARY, PRIMARY]
+
+
+def test_no_replicas_reads_primary(monkeypatch):
+    _use(monkeypatch, [])
+    assert _read_from() == [PRIMARY, PRIMARY]
+
+
+def test_gone_replica_falls_back_to_primary(tmp_path, monkeypatch, make_user):
+    gone = f"sqlite:///{tmp_path}/gone/replica.db"
+    replica = _copy(str(tmp_path / "replica.db"))
+    replicas = _use(monkeypatch, [gone, replica])
+    # Only on the primary
+    user = make_user()
+    client = TestClient(app)
+
+    # The first session picks the gone replica and is served by the primary
+    response = client.get("/users")
+    assert response.status_code == 200
+    assert user.username in [row["username"] for row in response.json()]
+    # The replica is skipped until a health check passes
+    assert replicas.healthy == [replicas.engines[1]]
+    response = client.get("/users")
+    assert response.status_code == 200
+    assert user.username not in [row["username"] for row in response.json()]
+
+    asyncio.run(replicas.stop())
@@ -0,0 +1,118 @@
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from app.response_cache import cached_json, response_cache
+
+TAG = "test:thing"
+
+
+@pytest.fixture
+def thing():
+    """
+    A cached route whose payload the test can change, counting how often
+    it is built.
+    """
+    state = {"builds": 0, "name": "first", "during_build": None}
+    app = FastAPI()
+
+    @app.get("/thing")
+    async def get_thing(request: Request):
+        async def build():
+            state["builds"] += 1
+            if state["during_build"] is not None:
+                state["during_build"]()
+            return {"name": state["name"]}, [TAG]
+
+        return await cached_json(request, ("test", "thing"), build)
+
+    response_cache.clear()
+    with TestClient(app) as client:
+        yield client, state
+    response_cache.clear()
+
+
+def test_cached_response_has_etag(thing):
+    client, state = thing
+
+    first = client.get("/thing")
+    second = client.get("/thing")
+
+    assert first.status_code == second.status_code == 200
+    assert first.json() == {"name": "first"}
+    assert first.headers["ETag"] == second.headers["ETag"]
+    assert state["builds"] == 1
+
+
+def test_matching_etag_gets_304(thing):
+    client, state = thing
+    etag = client.get("/thing").headers["ETag"]
+
+    response = client.get("/thing", headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["ETag"] == etag
+
+
+def test_other_etag_gets_body(thing):
+    client, state = thing
+    client.get("/thing")
+
+    response = client.get("/thing", headers={"If-None-Match": '"stale"'})
+
+    assert response.status_code == 200
+    assert response.json() == {"name": "first"}
+
+
+def test_invalidation_rebuilds(thing):
+    client, state = thing
+    etag = client.get("/thing").headers["ETag"]
+    state["name"] = "second"
+
+    response_cache.invalidate(TAG)
+    response = client.get("/thing", headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.json() == {"name": "second"}
+    assert response.headers["ETag"] != etag
+    assert state["builds"] == 2
+
+
+def test_other_tags_stay_cached(thing):
+    client, state = thing
+    client.get("/thing")
+
+    response_cache.invalidate("test:unrelated")
+    client.get("/thing")
+
+    assert state["builds"] == 1
+
+
+def test_response_built_across_invalidation_is_not_stored(thing):
+    client, state = thing
+    # A write lands while the response is being built from older data
+    state["during_build"] = lambda: response_cache.invalidate(TAG)
+
+    client.get("/thing")
+    state["during_build"] = None
+    client.get("/thing")
+    client.get("/thing")
+
+    assert state["builds"] == 2
+
+
+def test_codings_share_invalidation(thing):
+    client, state = thing
+    state["name"] = "x" * 4096
+    compressed = client.get("/thing", headers={"Accept-Encoding": "gzip"})
+    plain = client.get("/thing", headers={"Accept-Encoding": "identity"})
+
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert "Content-Encoding" not in plain.headers
+    assert compressed.headers["ETag"] != plain.headers["ETag"]
+    assert state["builds"] == 1
+
+    response_cache.invalidate(TAG)
+    client.get("/thing", headers={"Accept-Encoding": "identity"})
+    assert state["builds"] == 2
@@ -0,0 +1,66 @@
+from sqlalchemy import func, select
+
+from app.models import CommentVote, Post, PostInterest
+from app.votes import _toggle_now, _vote_now
+
+
+def _votes(db, comment_id):
+    return db.scalar(select(func.count()).where(CommentVote.comment_id == comment_id))
+
+
+def test_repeated_vote_is_counted_once(db, make_comment, make_user):
+    comment, voter = make_comment(), make_user()
+
+    first = _vote_now(db, comment.id, voter.id, True)
+    again = _vote_now(db, comment.id, voter.id, True)
+
+    assert first["score"] == again["score"] == 1
+    assert _votes(db, comment.id) == 1
+    db.refresh(comment)
+    assert (comment.upvotes, comment.downvotes, comment.score) == (1, 0, 1)
+
+
+def test_flipped_vote_moves_sides(db, make_comment, make_user):
+    comment, voter, other = make_comment(), make_user(), make_user()
+    _vote_now(db, comment.id, voter.id, True)
+    _vote_now(db, comment.id, other.id, True)
+
+    flipped = _vote_now(db, comment.id, voter.id, False)
+
+    assert flipped["score"] == 0
+    assert _votes(db, comment.id) == 2
+    db.refresh(comment)
+    assert (comment.upvotes, comment.downvotes, comment.score) == (1, 1, 0)
+
+
+def test_vote_on_missing_comment(db, make_user):
+    assert _vote_now(db, 10**9, make_user().id, True) is None
+
+
+def test_toggling_twice_restores_interest(db, make_post, make_user):
+    post, user, other = make_post(), make_user(), make_user()
+
+    assert _toggle_now(db, post.id, user.id) == 1
+    assert _toggle_now(db, post.id, other.id) == 2
+    assert _toggle_now(db, post.id, user.id) == 1
+    assert _toggle_now(db, post.id, user.id) == 2
+
+    interests = db.scalars(
+        select(PostInterest.user_id).where(PostInterest.post_id == post.id)
+    ).all()
+    assert sorted(interests) == sorted([user.id, other.id])
+    db.refresh(post)
+    assert post.interest_count == 2
+
+
+def test_toggle_raises_hot_score(db, make_post, make_user):
+    post = make_post()
+    before = db.scalar(select(Post.hot_score).where(Post.id == post.id))
+
+    _toggle_now(db, post.id, make_user().id)
+
+    assert db.scalar(select(Post.hot_score).where(Post.id == post.id)) > before
+
+
+def test_toggle_on_missing_post(db, make_user):
+    assert _toggle_now(db, 10**9, make_user().id) is None
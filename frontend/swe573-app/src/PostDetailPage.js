@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useContext } from 'react';
+import React, { useState, useEffect, useContext, useRef } from 'react';
 import { useParams } from 'react-router-dom';
 import { UserContext } from './UserContext';
 
@@ -9,6 +9,9 @@ function PostDetailPage() {
   const [newComment, setNewComment] = useState("");
   const { username } = useContext(UserContext);
   const [resolved, setResolved] = useState(false);
+  // The post embeds the first page of comments by score; the rest is paged in
+  const [commentSort, setCommentSort] = useState("top");
+  const sortRef = useRef(commentSort);
 
   const fetchPost = () => {
     fetch(`${process.env.REACT_APP_BACKEND_URL}/posts/${id}`, { credentials: 'include' })
@@ -20,6 +23,8 @@ function PostDetailPage() {
       })
       .then(data => {
         setPost(data);
+        setCommentSort("top");
+        sortRef.current = "top";
         const resolvedPosts = JSON.parse(localStorage.getItem('resolvedPosts')) || [];
         setResolved(resolvedPosts.includes(id));
       })
@@ -30,6 +35,79 @@ function PostDetailPage() {
     fetchPost();
   }, [id]);
 
+  // Apply live updates instead of re-fetching the whole post
+  useEffect(() => {
+    const source = new EventSource(
+      `${process.env.REACT_APP_BACKEND_URL}/posts/${id}/events`,
+      { withCredentials: true }
+    );
+    source.onmessage = (e) => {
+      const event = JSON.parse(e.data);
+      if (event.truncated) {
+        fetchPost();
+        return;
+      }
+      setPost(current => {
+        if (!current) return current;
+        switch (event.type) {
+          case "comment.created":
+            if (current.comments.some(c => c.id === event.comment.id)) return current;
+            return {
+              ...current,
+              comment_count: event.comment_count,
+              comments: sortRef.current === "new"
+                ? [event.comment, ...current.comments]
+                : [...current.comments, event.comment],
+            };
+          case "comment.voted":
+            return {
+              ...current,
+              comments: current.comments.map(c =>
+                c.id === event.comment_id ? { ...c, score: event.score } : c
+              ),
+            };
+          case "interest":
+            return { ...current, interest_count: event.interest_count };
+          default:
+            return current;
+        }
+      });
+    };
+    // Evicted for falling behind: reload, the browser reconnects by itself
+    source.addEventListener("evicted", fetchPost);
+    return () => source.close();
+  }, [id]);
+
+  const fetchComments = (sort, cursor) => {
+    const params = new URLSearchParams({ sort });
+    if (cursor) params.set("cursor", cursor);
+    fetch(`${process.env.REACT_APP_BACKEND_URL}/posts/${id}/comments?${params}`, { credentials: 'include' })
+      .then(res => {
+        if (!res.ok) {
+          throw new Error("Failed to fetch comments");
+        }
+        return res.json();
+      })
+      .then(page => {
+        setPost(current => {
+          const kept = cursor ? current.comments : [];
+          const known = new Set(kept.map(c => c.id));
+          return {
+            ...current,
+            comments: [...kept, ...page.items.filter(c => !known.has(c.id))],
+            comments_next_cursor: page.next_cursor,
+          };
+        });
+      })
+      .catch(err => setError(err.message));
+  };
+
+  const handleSortChange = (sort) => {
+    setCommentSort(sort);
+    sortRef.current = sort;
+    fetchComments(sort, null);
+  };
+
   const handleCommentSubmit = (e) => {
     e.preventDefault();
     if (!newComment.trim()) return;
@@ -47,8 +125,7 @@ function PostDetailPage() {
         return res.json();
       })
       .then(() => {
-        setNewComment("");
-        fetchPost(); // Refresh post to update comments
+        setNewComment(""); // The new comment arrives as a live update
       })
       .catch(err => setError(err.message));
   };
@@ -66,9 +143,6 @@ function PostDetailPage() {
         }
         return res.json();
       })
-      .then(() => {
-        fetchPost(); // Refresh post to update comment scores
-      })
       .catch(err => setError(err.message));
   };
 
@@ -102,7 +176,7 @@ function PostDetailPage() {
 
       {post.image_url && (
         <img
-          src={`${process.env.REACT_APP_BACKEND_URL}${post.image_url}`}
+          src={`${process.env.REACT_APP_BACKEND_URL}${post.preview_url || post.image_url}`}
           alt={post.title}
           style={{ maxWidth: "100%", border: "1px solid #ddd", padding: "10px", marginBottom: "20px" }}
         />
@@ -162,7 +236,25 @@ function PostDetailPage() {
         </div>
 
       <hr />
-      <h2>Comments</h2>
+      <div className="d-flex align-items-center justify-content-between">
+        <h2>Comments ({post.comment_count})</h2>
+        <div className="btn-group btn-group-sm">
+          <button
+            type="button"
+            className={`btn ${commentSort === "top" ? "btn-secondary" : "btn-outline-secondary"}`}
+            onClick={() => handleSortChange("top")}
+          >
+            Top
+          </button>
+          <button
+            type="button"
+            className={`btn ${commentSort === "new" ? "btn-secondary" : "btn-outline-secondary"}`}
+            onClick={() => handleSortChange("new")}
+          >
+            Newest
+          </button>
+        </div>
+      </div>
       {post.comments.length === 0 && <p>No comments yet.</p>}
       {post.comments.map(comment => {
         let scoreClass, scoreText;
@@ -200,6 +292,15 @@ function PostDetailPage() {
           </div>
         );
       })}
+      {post.comments_next_cursor && (
+        <button
+          type="button"
+          className="btn btn-outline-primary"
+          onClick={() => fetchComments(commentSort, post.comments_next_cursor)}
+        >
+          Load more comments
+        </button>
+      )}
 
       {username ? (
         <form onSubmit={handleCommentSubmit} className="mt-4">
@@ -3,10 +3,12 @@ import { Link } from 'react-router-dom';
 
 function PostsPage() {
   const [posts, setPosts] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [error, setError] = useState("");
 
-  const fetchPosts = () => {
-    fetch(`${process.env.REACT_APP_BACKEND_URL}/posts`, {
+  const fetchPosts = (cursor = null) => {
+    const params = "?fields=card" + (cursor ? `&cursor=${encodeURIComponent(cursor)}` : "");
+    fetch(`${process.env.REACT_APP_BACKEND_URL}/posts${params}`, {
       credentials: 'include'
     })
       .then(res => {
@@ -15,7 +17,10 @@ function PostsPage() {
         }
         return res.json();
       })
-      .then(data => setPosts(data))
+      .then(data => {
+        setPosts(prevPosts => (cursor ? [...prevPosts, ...data.items] : data.items));
+        setNextCursor(data.next_cursor);
+      })
       .catch(err => setError(err.message));
   };
 
@@ -61,7 +66,7 @@ function PostsPage() {
               <div style={{ position: "relative" }}>
                 {post.image_url && (
                   <img
-                    src={`${process.env.REACT_APP_BACKEND_URL}${post.image_url}`}
+                    src={`${process.env.REACT_APP_BACKEND_URL}${post.thumbnail_url || post.image_url}`}
                     className="card-img-top"
                     alt={post.title}
                     style={{ height: "200px", objectFit: "cover" }}
@@ -94,6 +99,11 @@ function PostsPage() {
           </div>
         ))}
       </div>
+      {nextCursor && (
+        <div className="mb-4 text-center">
+          <button onClick={() => fetchPosts(nextCursor)} className="btn btn-secondary">Load More</button>
+        </div>
+      )}
     </div>
   );
 }
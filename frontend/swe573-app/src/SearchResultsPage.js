@@ -12,14 +12,14 @@ function SearchResultsPage() {
 
   useEffect(() => {
     if (query) {
-      fetch(`${process.env.REACT_APP_BACKEND_URL}/posts/search?query=${encodeURIComponent(query)}`, {
+      fetch(`${process.env.REACT_APP_BACKEND_URL}/posts/search?query=${encodeURIComponent(query)}&fields=card,description`, {
         credentials: 'include',
       })
         .then(res => {
           if (!res.ok) throw new Error("Failed to fetch search results");
           return res.json();
         })
-        .then(data => setResults(data))
+        .then(data => setResults(data.items))
         .catch(err => setError(err.message));
     }
   }, [query]);
@@ -38,7 +38,7 @@ function SearchResultsPage() {
             <div className="card">
               {post.image_url && (
                 <img
-                  src={`${process.env.REACT_APP_BACKEND_URL}${post.image_url}`}
+                  src={`${process.env.REACT_APP_BACKEND_URL}${post.thumbnail_url || post.image_url}`}
                   className="card-img-top"
                   alt={post.title}
                 />